@@ -0,0 +1,195 @@
+"""Background queue for LLM-backed work.
+
+Handlers submit a job (kind, owner, chat/message target and the coroutine
+that does the work) and return straight away; a fixed pool of workers runs
+the jobs with bounded concurrency. The job edits its placeholder message
+and hands its result back to the conversation as an update (see
+handlers.common.submit_ai_job). Each user has at most one
+job in flight, which can be cancelled (e.g. from /cancel), and submit()
+refuses work once MAX_QUEUE_SIZE jobs are waiting.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+AI_WORKERS = 4
+MAX_QUEUE_SIZE = 50
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class AIJobQueueFull(Exception):
+    """Raised by submit() when MAX_QUEUE_SIZE jobs are already waiting."""
+
+
+@dataclass(eq=False)
+class AIJob:
+    id: int
+    kind: str
+    user_id: int
+    chat_id: int
+    message_id: int | None
+    run: Callable[[], Awaitable] = field(repr=False)
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.monotonic)
+    started_at: float | None = None
+    finished_at: float | None = None
+    error: str | None = None
+    _task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+
+class AIJobQueue:
+    def __init__(self, workers: int = AI_WORKERS, max_queue: int = MAX_QUEUE_SIZE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._jobs: dict[int, AIJob] = {}  # user_id -> latest job
+        self._ids = itertools.count(1)
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"ai-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Cancel queued and running jobs and stop the workers."""
+        for job in self._jobs.values():
+            self._cancel(job)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    # --- Handler API ---
+
+    def submit(self, kind, user_id, chat_id, message_id, run) -> AIJob:
+        """Queue `run` (a zero-argument coroutine function) for a worker."""
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise AIJobQueueFull(f"{self.queued} AI jobs already waiting")
+        job = AIJob(next(self._ids), kind, user_id, chat_id, message_id, run)
+        self._jobs[user_id] = job
+        self._queue.put_nowait(job)
+        logger.info(f"AI job {job.id} ({kind}) queued for user {user_id}")
+        return job
+
+    def active_job(self, user_id) -> AIJob | None:
+        """The user's queued or running job, if any."""
+        job = self._jobs.get(user_id)
+        return job if job is not None and job.active else None
+
+    def position(self, job: AIJob) -> int:
+        """Jobs that will start before this one (0 once it is running)."""
+        if job.status != QUEUED:
+            return 0
+        return sum(
+            1
+            for other in self._jobs.values()
+            if other.status == QUEUED and other.id < job.id
+        )
+
+    def cancel(self, user_id) -> bool:
+        """Cancel the user's queued or running job; True if there was one."""
+        job = self.active_job(user_id)
+        if job is None:
+            return False
+        self._cancel(job)
+        return True
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": self.queued,
+            "running": sum(1 for job in self._jobs.values() if job.status == RUNNING),
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+        }
+
+    # --- Workers ---
+
+    def _cancel(self, job: AIJob):
+        if not job.active:
+            return
+        job.status = CANCELLED
+        job.finished_at = time.monotonic()
+        self.cancelled += 1
+        if job._task is not None:
+            job._task.cancel()
+        logger.info(f"AI job {job.id} cancelled")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == QUEUED:
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+                if self._jobs.get(job.user_id) is job and not job.active:
+                    del self._jobs[job.user_id]
+
+    async def _run(self, job: AIJob):
+        job.status = RUNNING
+        job.started_at = time.monotonic()
+        job._task = asyncio.create_task(job.run())
+        try:
+            await job._task
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                # The worker itself is being cancelled (shutdown)
+                job._task.cancel()
+                raise
+            return
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            self.failed += 1
+            logger.error(f"AI job {job.id} ({job.kind}) failed: {e}", exc_info=e)
+        else:
+            job.status = DONE
+            self.completed += 1
+        finally:
+            job._task = None
+            if job.finished_at is None:
+                job.finished_at = time.monotonic()
+        logger.info(
+            f"AI job {job.id} ({job.kind}) {job.status}: "
+            f"waited {job.started_at - job.created_at:.1f}s, "
+            f"ran {job.finished_at - job.started_at:.1f}s"
+        )
+
+
+ai_jobs = AIJobQueue()
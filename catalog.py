@@ -0,0 +1,179 @@
+"""Normalized exercise catalog.
+
+The `exercises` table gives every exercise one integer id, a canonical name,
+its primary muscle group and the spellings it is known by. It is seeded from
+EXERCISE_MUSCLE_MAP in handlers/ai_coach.py (passed in by the caller);
+spellings that differ only by spaces or hyphens ("pull up", "pullup")
+collapse into one entry. template_exercises and workout_logs
+reference it through exercise_id. Names are resolved with the same fuzzy
+matching the AI coach uses for muscle groups; anything that still doesn't
+match gets its own catalog entry.
+"""
+
+import logging
+import re
+
+from sqlalchemy import select, update, union
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database import AsyncSessionLocal, Exercise, TemplateExercise, WorkoutLog
+from fuzzy_index import FuzzyIndex
+
+logger = logging.getLogger(__name__)
+
+# Same bar the AI coach uses before overriding a muscle group
+CATALOG_MATCH_THRESHOLD = 82
+
+
+def normalize(name: str) -> str:
+    """Lower-case, trim and collapse whitespace so trivial variants compare equal."""
+    return re.sub(r"\s+", " ", name.lower().strip())
+
+
+def _squash(name: str) -> str:
+    return re.sub(r"[\s\-]", "", normalize(name))
+
+
+def seed_entries(muscle_map: dict[str, str]) -> list[dict]:
+    """Catalog rows derived from an exercise → muscle group map."""
+    entries: dict[str, dict] = {}
+    for name, muscle_group in muscle_map.items():
+        entry = entries.setdefault(
+            _squash(name),
+            {
+                "canonical_name": name.title(),
+                "muscle_group": muscle_group,
+                "aliases": [],
+            },
+        )
+        entry["aliases"].append(normalize(name))
+    return list(entries.values())
+
+
+class ExerciseCatalog:
+    """In-process view of the exercises table for name → id resolution."""
+
+    def __init__(self):
+        self._ids: dict[str, int] = {}  # normalized name or alias -> id
+        self._fuzzy = FuzzyIndex()  # the keys of _ids, in insertion order
+        self.loaded = False
+
+    def _index(self, exercise_id: int, canonical_name: str, aliases):
+        self._add(normalize(canonical_name), exercise_id)
+        for alias in aliases or []:
+            self._add(normalize(alias), exercise_id)
+
+    def _add(self, key: str, exercise_id: int):
+        if key not in self._ids:
+            self._fuzzy.add(key)
+        self._ids[key] = exercise_id
+
+    async def load(self, muscle_map: dict[str, str]):
+        """Seed the catalog from `muscle_map` (idempotent) and load it into memory."""
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                pg_insert(Exercise)
+                .values(seed_entries(muscle_map))
+                .on_conflict_do_nothing(index_elements=[Exercise.canonical_name])
+            )
+            await session.commit()
+            result = await session.execute(select(Exercise))
+            for exercise in result.scalars().all():
+                self._index(exercise.id, exercise.canonical_name, exercise.aliases)
+        self.loaded = True
+        logger.info(f"Exercise catalog loaded: {len(self._ids)} names")
+
+    def match(self, name: str) -> int | None:
+        """Catalog id for `name`: exact alias first, then a confident fuzzy match."""
+        key = normalize(name)
+        if key in self._ids:
+            return self._ids[key]
+        if not self._ids:
+            return None
+        result = self._fuzzy.best(key, CATALOG_MATCH_THRESHOLD)
+        if result is None:
+            return None
+        match, score = result
+        logger.info(f"Catalog fuzzy match: '{name}' → '{match}' (score {score})")
+        self._add(key, self._ids[match])
+        return self._ids[match]
+
+    async def resolve(
+        self, names: list[str], muscle_groups: dict[str, str] | None = None
+    ) -> dict[str, int | None]:
+        """Map names to catalog ids, adding entries for names that don't match.
+
+        New entries are committed in their own transaction so callers can roll
+        back theirs freely. If the catalog can't be reached, unmatched names map
+        to None and are picked up by the exercise-ids backfill later.
+        """
+        muscle_groups = muscle_groups or {}
+        ids = {name: self.match(name) for name in dict.fromkeys(names)}
+        missing = [name for name, exercise_id in ids.items() if exercise_id is None]
+        if not missing:
+            return ids
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    pg_insert(Exercise)
+                    .values(
+                        [
+                            {
+                                "canonical_name": name.strip(),
+                                "muscle_group": muscle_groups.get(name),
+                                "aliases": [normalize(name)],
+                            }
+                            for name in missing
+                        ]
+                    )
+                    .on_conflict_do_nothing(index_elements=[Exercise.canonical_name])
+                )
+                await session.commit()
+                result = await session.execute(
+                    select(Exercise).where(
+                        Exercise.canonical_name.in_([n.strip() for n in missing])
+                    )
+                )
+                for exercise in result.scalars().all():
+                    self._index(exercise.id, exercise.canonical_name, exercise.aliases)
+        except Exception as e:
+            logger.warning(f"Could not add exercises to the catalog: {e}")
+        return {name: self._ids.get(normalize(name)) for name in ids}
+
+
+exercise_catalog = ExerciseCatalog()
+
+
+async def backfill_exercise_ids(muscle_map: dict[str, str]) -> int:
+    """Set exercise_id on template_exercises and workout_logs rows missing one.
+
+    Returns the number of distinct names resolved.
+    """
+    await exercise_catalog.load(muscle_map)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            union(
+                select(TemplateExercise.exercise_name).where(
+                    TemplateExercise.exercise_id.is_(None)
+                ),
+                select(WorkoutLog.exercise_name).where(WorkoutLog.exercise_id.is_(None)),
+            )
+        )
+        names = [row[0] for row in result.fetchall()]
+    ids = await exercise_catalog.resolve(names)
+
+    async with AsyncSessionLocal() as session:
+        for model in (TemplateExercise, WorkoutLog):
+            for name, exercise_id in ids.items():
+                if exercise_id is None:
+                    continue
+                await session.execute(
+                    update(model)
+                    .where(model.exercise_name == name)
+                    .where(model.exercise_id.is_(None))
+                    .values(exercise_id=exercise_id)
+                )
+        await session.commit()
+    resolved = sum(1 for exercise_id in ids.values() if exercise_id is not None)
+    logger.info(f"backfill_exercise_ids: resolved {resolved}/{len(ids)} names")
+    return resolved
@@ -5,15 +5,19 @@ from sqlalchemy import (
     Float,
     ForeignKey,
     DateTime,
+    Date,
+    LargeBinary,
     BigInteger,
     UniqueConstraint,
+    Index,
 )
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import os
+from typing import TypedDict
 from dotenv import load_dotenv
-import json
 
 load_dotenv()
 
@@ -28,6 +32,22 @@ class User(Base):
 
     templates = relationship("Template", back_populates="user")
     logs = relationship("WorkoutLog", back_populates="user")
+    sessions = relationship("WorkoutSession", back_populates="user")
+
+
+class SetConfig(TypedDict):
+    weight: float
+    reps: int
+
+
+class Exercise(Base):
+    """Exercise catalog entry; see catalog.py."""
+
+    __tablename__ = "exercises"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    canonical_name = Column(String, nullable=False, unique=True)
+    muscle_group = Column(String, nullable=True)
+    aliases = Column(ARRAY(String), nullable=False, default=list)  # normalized spellings
 
 
 class Template(Base):
@@ -52,37 +72,124 @@ class TemplateExercise(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     template_id = Column(Integer, ForeignKey("templates.id"), nullable=False)
     exercise_name = Column(String, nullable=False)
+    exercise_id = Column(Integer, ForeignKey("exercises.id"), nullable=True)
     default_sets = Column(Integer, default=3)
     default_weight = Column(Float, default=0.0)
     default_reps = Column(Integer, default=0)
-    sets_config = Column(
-        String, nullable=True
-    )  # JSON: [{"weight": 60, "reps": 5}, ...]
+    sets_config = Column(JSONB, nullable=True)  # [{"weight": 60, "reps": 5}, ...]
     order = Column(Integer, default=0)
 
     template = relationship("Template", back_populates="exercises")
+    exercise = relationship("Exercise")
+
+    def get_sets_config(self) -> list[SetConfig] | None:
+        # JSONB is decoded once by the driver when the row loads
+        return self.sets_config
+
+    def set_sets_config(self, config: list[SetConfig]):
+        # Assign a new list: in-place changes to a JSONB value aren't tracked
+        self.sets_config = list(config)
 
-    def get_sets_config(self):
-        if self.sets_config:
-            return json.loads(self.sets_config)
-        return None
 
-    def set_sets_config(self, config):
-        self.sets_config = json.dumps(config)
+class WorkoutSession(Base):
+    __tablename__ = "workout_sessions"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
+    template_name = Column(String, nullable=True)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    ended_at = Column(DateTime(timezone=True), nullable=True)
+    set_count = Column(Integer, default=0)
+    total_volume = Column(Float, default=0.0)
+
+    user = relationship("User", back_populates="sessions")
+    logs = relationship("WorkoutLog", back_populates="session")
+
+    __table_args__ = (
+        Index("ix_workout_sessions_user_started", "user_id", started_at.desc()),
+    )
 
 
 class WorkoutLog(Base):
     __tablename__ = "workout_logs"
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
+    session_id = Column(Integer, ForeignKey("workout_sessions.id"), nullable=True)
     template_name = Column(String, nullable=True)
     exercise_name = Column(String, nullable=False)
+    exercise_id = Column(Integer, ForeignKey("exercises.id"), nullable=True)
     sets = Column(Integer, nullable=False)
     weight = Column(Float, nullable=False)
     reps = Column(Integer, nullable=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    # Set journal entry id, so a replayed entry is never inserted twice
+    journal_id = Column(String, nullable=True)
 
     user = relationship("User", back_populates="logs")
+    session = relationship("WorkoutSession", back_populates="logs")
+    exercise = relationship("Exercise")
+
+    # Composite indexes matching the hot access paths (see queries.py):
+    # last performance per exercise, and per-user history by day/template.
+    __table_args__ = (
+        Index(
+            "ix_workout_logs_user_exercise_ts",
+            "user_id",
+            "exercise_name",
+            timestamp.desc(),
+        ),
+        Index(
+            "ix_workout_logs_user_ts_template",
+            "user_id",
+            timestamp.desc(),
+            "template_name",
+        ),
+        Index(
+            "ix_workout_logs_user_exercise_id_ts",
+            "user_id",
+            "exercise_id",
+            timestamp.desc(),
+        ),
+        Index("ix_workout_logs_session", "session_id"),
+        Index("ix_workout_logs_journal_id", "journal_id", unique=True),
+    )
+
+
+class UserExerciseLast(Base):
+    """Most recent logged set per (user, exercise), upserted with every batched
+    log insert so the set screen can read "Previous" by primary key."""
+
+    __tablename__ = "user_exercise_last"
+    user_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    exercise_name = Column(String, primary_key=True)
+    sets = Column(Integer, nullable=False)
+    weight = Column(Float, nullable=False)
+    reps = Column(Integer, nullable=False)
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+
+
+class DailyWorkoutSummary(Base):
+    """Per-user rollup of workout_logs by UTC day and workout session, kept in
+    step with every batched log insert (see queries.save_workout_logs)."""
+
+    __tablename__ = "daily_workout_summary"
+    user_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    session_id = Column(Integer, ForeignKey("workout_sessions.id"), primary_key=True)
+    template_name = Column(String, nullable=False, default="")  # "" = no template
+    set_count = Column(Integer, nullable=False, default=0)
+    exercise_count = Column(Integer, nullable=False, default=0)
+    volume = Column(Float, nullable=False, default=0.0)
+
+
+class PersistenceEntry(Base):
+    """One pickled user_data/chat_data/bot_data entry or conversation state
+    (see persistence.py)."""
+
+    __tablename__ = "persistence_entries"
+    kind = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
 DATABASE_URL = os.getenv(
@@ -94,6 +201,61 @@ engine = create_async_engine(DATABASE_URL, echo=True, connect_args={"ssl": "requ
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+# Recomputes daily_workout_summary from workout_logs; logs without a session
+# are rolled up once the workout-sessions backfill has assigned them one.
+REBUILD_DAILY_SUMMARY = (
+    "INSERT INTO daily_workout_summary "
+    "(user_id, day, session_id, template_name, set_count, exercise_count, volume) "
+    "SELECT user_id, CAST(timezone('UTC', timestamp) AS date), session_id, "
+    "coalesce(min(template_name), ''), sum(sets), "
+    "count(DISTINCT exercise_name), sum(sets * weight * reps) "
+    "FROM workout_logs WHERE session_id IS NOT NULL "
+    "GROUP BY user_id, CAST(timezone('UTC', timestamp) AS date), session_id "
+    "ON CONFLICT (user_id, day, session_id) DO UPDATE SET "
+    "template_name = excluded.template_name, "
+    "set_count = excluded.set_count, "
+    "exercise_count = excluded.exercise_count, "
+    "volume = excluded.volume"
+)
+
+# Idempotent DDL for columns added to tables that create_all won't alter.
+SCHEMA_UPGRADES = [
+    "ALTER TABLE workout_logs ADD COLUMN IF NOT EXISTS session_id INTEGER "
+    "REFERENCES workout_sessions(id)",
+    "ALTER TABLE template_exercises ADD COLUMN IF NOT EXISTS exercise_id INTEGER "
+    "REFERENCES exercises(id)",
+    "ALTER TABLE workout_logs ADD COLUMN IF NOT EXISTS exercise_id INTEGER "
+    "REFERENCES exercises(id)",
+    "ALTER TABLE workout_logs ADD COLUMN IF NOT EXISTS journal_id VARCHAR",
+    # sets_config used to be a String holding JSON
+    "DO $$ BEGIN "
+    "IF (SELECT data_type FROM information_schema.columns "
+    "WHERE table_name = 'template_exercises' AND column_name = 'sets_config') "
+    "<> 'jsonb' THEN "
+    "ALTER TABLE template_exercises ALTER COLUMN sets_config TYPE JSONB "
+    "USING NULLIF(sets_config, '')::jsonb; "
+    "END IF; END $$",
+    # daily_workout_summary used to be keyed by template name; re-key it by
+    # session and rebuild it (it is derived from workout_logs)
+    "DO $$ BEGIN "
+    "IF NOT EXISTS (SELECT 1 FROM information_schema.columns "
+    "WHERE table_name = 'daily_workout_summary' AND column_name = 'session_id') THEN "
+    "DELETE FROM daily_workout_summary; "
+    "ALTER TABLE daily_workout_summary DROP CONSTRAINT daily_workout_summary_pkey; "
+    "ALTER TABLE daily_workout_summary ADD COLUMN session_id INTEGER NOT NULL "
+    "REFERENCES workout_sessions(id); "
+    "ALTER TABLE daily_workout_summary ADD PRIMARY KEY (user_id, day, session_id); "
+    + REBUILD_DAILY_SUMMARY
+    + "; END IF; END $$",
+]
+
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        for statement in SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
+        # create_all skips indexes on tables that already exist
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
@@ -0,0 +1,87 @@
+"""Precomputed fuzzy matching for exercise names.
+
+thefuzz's process.extractOne re-normalizes every candidate in Python on
+every call, so matching a session's exercises against a few hundred known
+names spends most of its time in that preprocessing. FuzzyIndex normalizes
+the candidates once (per catalog, per user's names, or for
+EXERCISE_MUSCLE_MAP) and scores queries with rapidfuzz's native WRatio.
+Scores and best matches are the ones thefuzz gives: the same normalization
+(ASCII only, lower-case, punctuation to spaces) and the same rounding.
+"""
+
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+
+from lru import LRUCache
+
+INDEX_CACHE_ENTRIES = 64
+
+
+def prepare(name: str) -> str:
+    """Normalize a name the way thefuzz does before WRatio."""
+    return default_process(name.encode("ascii", "ignore").decode("ascii"))
+
+
+class FuzzyIndex:
+    """Candidate names, normalized once, for repeated best-match lookups."""
+
+    def __init__(self, choices=()):
+        self.choices: list[str] = []
+        self._prepared: list[str] = []
+        self._exact: dict[str, int] = {}  # prepared name -> first position
+        for choice in choices:
+            self.add(choice)
+
+    def __len__(self) -> int:
+        return len(self.choices)
+
+    def add(self, choice: str):
+        prepared = prepare(choice)
+        self._exact.setdefault(prepared, len(self.choices))
+        self.choices.append(choice)
+        self._prepared.append(prepared)
+
+    def best(self, name: str, threshold: int = 0) -> tuple[str, int] | None:
+        """(choice, score) of the best match for `name`, or None below threshold."""
+        query = prepare(name)
+        if not query or not self.choices:
+            return None
+        # Only identical names score 100, so this is also what a scan finds
+        position = self._exact.get(query)
+        if position is not None:
+            return self.choices[position], 100
+        result = process.extractOne(
+            query,
+            self._prepared,
+            scorer=fuzz.WRatio,
+            processor=None,
+            score_cutoff=max(threshold - 0.5, 0),
+        )
+        if result is None:
+            return None
+        _, score, position = result
+        score = int(round(score))
+        if score < threshold:
+            return None
+        return self.choices[position], score
+
+    def best_many(self, names, threshold: int = 0) -> list[tuple[str, int] | None]:
+        """best() for a batch of names; repeated names are scored once."""
+        results: dict[str, tuple[str, int] | None] = {}
+        for name in names:
+            if name not in results:
+                results[name] = self.best(name, threshold)
+        return [results[name] for name in names]
+
+
+_indexes = LRUCache(INDEX_CACHE_ENTRIES)
+
+
+def index_for(choices) -> FuzzyIndex:
+    """A shared FuzzyIndex for this exact list of names (e.g. one user's)."""
+    key = tuple(choices)
+    index = _indexes.get(key, None)
+    if index is None:
+        index = FuzzyIndex(key)
+        _indexes.put(key, index)
+    return index
@@ -1,21 +1,27 @@
 """AI Coach: personalized multi-template recommendation via CSCS-style LLM prompting."""
 
 import asyncio
-import json
 import re
 from collections import defaultdict
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
+from telegram.helpers import escape_markdown
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
-from thefuzz import process as fuzz_process
 
 from database import AsyncSessionLocal, Template, TemplateExercise
-import handlers.common as common
+from catalog import exercise_catalog
+from fuzzy_index import FuzzyIndex, index_for
+from json_stream import ItemStream
+from llm_cache import is_json, llm_cache
+from llm_gateway import CircuitOpenError, llm_gateway
 from handlers.common import (
+    ProgressMessage,
+    message_tracker,
     logger,
     get_client,
+    submit_ai_job,
     AI_COACH_BIO,
     AI_COACH_SBD,
     AI_COACH_SPLIT,
@@ -28,6 +34,8 @@ VOLUME_GUARD_THRESHOLD = 8
 FUZZY_MATCH_THRESHOLD = 70
 MUSCLE_CORRECTION_THRESHOLD = 82  # higher bar — only override when very confident
 AI_MODEL = "allenai/Molmo2-8B"
+SESSION_ATTEMPTS = 3  # per session, before it is reported as failed
+RETRY_BACKOFF_SECONDS = 2.0  # doubled after every failed attempt
 
 # Canonical exercise → primary muscle group lookup.
 # Used to correct LLM hallucinations in muscle group assignments.
@@ -100,6 +108,9 @@ EXERCISE_MUSCLE_MAP: dict[str, str] = {
     "seated calf raise": "calves", "donkey calf raise": "calves",
 }
 
+# Normalized once; _correct_muscle_group matches every exercise against it
+_MUSCLE_MAP_INDEX = FuzzyIndex(EXERCISE_MUSCLE_MAP)
+
 # Maps split key → ordered list of session names the LLM must generate
 SPLIT_SESSIONS: dict[str, list[str]] = {
     "PPL":        ["Push Day", "Pull Day", "Legs Day"],
@@ -133,6 +144,100 @@ SESSION_MUSCLE_GROUPS: dict[tuple[str, str], set[str]] = {
     ("BroSplit", "Legs Day"):      {"quads", "hamstrings", "glutes", "calves", "core"},
 }
 
+# Rule-based sessions, used while the LLM is unavailable and for "quick plan":
+# ordered (exercise, role) slots. The first slot is the session's main lift.
+# No muscle group gets more than VOLUME_GUARD_THRESHOLD sets, even with the
+# 5-set strength scheme on the main lift.
+OFFLINE_SESSIONS: dict[tuple[str, str], list[tuple[str, str]]] = {
+    ("PPL", "Push Day"): [
+        ("Bench Press", "main"), ("Overhead Press", "compound"),
+        ("Incline Dumbbell Press", "compound"), ("Lateral Raise", "accessory"),
+        ("Tricep Pushdown", "accessory"),
+    ],
+    ("PPL", "Pull Day"): [
+        ("Barbell Row", "main"), ("Lat Pulldown", "compound"),
+        ("Face Pull", "accessory"), ("Barbell Curl", "accessory"),
+        ("Hammer Curl", "accessory"),
+    ],
+    ("PPL", "Legs Day"): [
+        ("Squat", "main"), ("Romanian Deadlift", "compound"),
+        ("Leg Press", "compound"), ("Leg Curl", "accessory"),
+        ("Standing Calf Raise", "accessory"),
+    ],
+    ("UpperLower", "Upper Body"): [
+        ("Bench Press", "main"), ("Barbell Row", "compound"),
+        ("Overhead Press", "compound"), ("Lat Pulldown", "compound"),
+        ("Barbell Curl", "accessory"), ("Tricep Pushdown", "accessory"),
+    ],
+    ("UpperLower", "Lower Body"): [
+        ("Squat", "main"), ("Romanian Deadlift", "compound"),
+        ("Leg Press", "compound"), ("Leg Curl", "accessory"),
+        ("Standing Calf Raise", "accessory"), ("Plank", "accessory"),
+    ],
+    ("FullBody", "Full Body"): [
+        ("Squat", "main"), ("Bench Press", "compound"),
+        ("Barbell Row", "compound"), ("Romanian Deadlift", "compound"),
+        ("Overhead Press", "accessory"), ("Plank", "accessory"),
+    ],
+    ("BroSplit", "Chest Day"): [
+        ("Bench Press", "main"), ("Incline Dumbbell Press", "compound"),
+        ("Cable Crunch", "accessory"), ("Hanging Leg Raise", "accessory"),
+    ],
+    ("BroSplit", "Back Day"): [
+        ("Deadlift", "main"), ("Lat Pulldown", "compound"),
+        ("Hanging Leg Raise", "accessory"), ("Plank", "accessory"),
+    ],
+    ("BroSplit", "Shoulders Day"): [
+        ("Overhead Press", "main"), ("Lateral Raise", "accessory"),
+        ("Cable Crunch", "accessory"), ("Plank", "accessory"),
+    ],
+    ("BroSplit", "Arms Day"): [
+        ("Close Grip Bench Press", "main"), ("Barbell Curl", "compound"),
+        ("Skull Crusher", "accessory"), ("Hammer Curl", "accessory"),
+    ],
+    ("BroSplit", "Legs Day"): [
+        ("Squat", "main"), ("Romanian Deadlift", "compound"),
+        ("Leg Press", "compound"), ("Leg Curl", "accessory"),
+        ("Standing Calf Raise", "accessory"),
+    ],
+}
+
+# Exercise → (SBD lift, its estimated 1RM as a fraction of that lift's 1RM).
+# Exercises missing here are bodyweight (weight 0).
+OFFLINE_LOAD_RATIOS: dict[str, tuple[str, float]] = {
+    "Bench Press": ("bench", 1.0),
+    "Overhead Press": ("bench", 0.6),
+    "Incline Dumbbell Press": ("bench", 0.35),  # per dumbbell
+    "Close Grip Bench Press": ("bench", 0.85),
+    "Lateral Raise": ("bench", 0.08),
+    "Face Pull": ("bench", 0.25),
+    "Tricep Pushdown": ("bench", 0.3),
+    "Skull Crusher": ("bench", 0.3),
+    "Barbell Curl": ("bench", 0.4),
+    "Hammer Curl": ("bench", 0.15),
+    "Barbell Row": ("deadlift", 0.5),
+    "Lat Pulldown": ("deadlift", 0.4),
+    "Deadlift": ("deadlift", 1.0),
+    "Romanian Deadlift": ("deadlift", 0.65),
+    "Squat": ("squat", 1.0),
+    "Leg Press": ("squat", 1.5),
+    "Leg Curl": ("squat", 0.3),
+    "Standing Calf Raise": ("squat", 0.6),
+}
+
+# Beginner 1RM estimates, as a multiple of body weight, for lifts entered as 0
+BEGINNER_1RM_RATIOS = {"bench": 0.5, "squat": 0.75, "deadlift": 1.0}
+DEFAULT_BODY_WEIGHT = 70.0  # kg
+
+# role → (sets, reps, %1RM); strength goals change the main lift only
+OFFLINE_SCHEMES = {
+    "main": (4, 8, 0.75),
+    "main_strength": (5, 5, 0.82),
+    "compound": (3, 10, 0.70),
+    "accessory": (3, 12, 0.60),
+}
+BODYWEIGHT_SCHEME = (3, 10)  # sets, reps (seconds for planks are up to the user)
+
 CSCS_SYSTEM_PROMPT = """\
 You are a Certified Strength & Conditioning Specialist (CSCS) and expert program designer.
 Design ONE workout session template based on the athlete profile and session type provided.
@@ -187,14 +292,9 @@ async def ai_coach_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Example: `25 80 180`",
         parse_mode="Markdown",
     )
-    if common.last_msg_id:
-        try:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-        except Exception:
-            pass
-    common.last_msg_id = sent.message_id
+    await message_tracker.replace_last(
+        context.bot, update.message.chat_id, sent.message_id
+    )
     return AI_COACH_BIO
 
 
@@ -277,10 +377,11 @@ async def ai_coach_sbd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("Bro Split (body-part) — 5 templates", callback_data="split_BroSplit")],
     ])
 
+    last_msg_id = message_tracker.get(update.effective_chat.id)
     try:
         await context.bot.edit_message_text(
             chat_id=update.effective_chat.id,
-            message_id=common.last_msg_id,
+            message_id=last_msg_id,
             text=(
                 f"✅ *SBD saved:* Bench {bench} kg | Squat {squat} kg | Deadlift {deadlift} kg\n\n"
                 "*Step 3/4 — Training Split*\n"
@@ -295,7 +396,7 @@ async def ai_coach_sbd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode="Markdown",
             reply_markup=keyboard,
         )
-        common.last_msg_id = sent.message_id
+        message_tracker.track(update.effective_chat.id, sent.message_id)
 
     return AI_COACH_SPLIT
 
@@ -311,7 +412,7 @@ async def ai_coach_split(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     split = query.data.replace("split_", "")
     context.user_data["coach_split"] = split
-    common.last_msg_id = query.message.message_id
+    message_tracker.track(update.effective_chat.id, query.message.message_id)
 
     sessions = SPLIT_SESSIONS.get(split, ["Full Body"])
     session_list = ", ".join(sessions)
@@ -322,8 +423,11 @@ async def ai_coach_split(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "*Step 4/4 — Goals & Notes*\n"
         "Any specific goals or constraints for the AI coach?\n\n"
         "Examples: _'Focus on shoulders'_, _'Only 45 mins'_, _'No barbell'_\n\n"
-        "_(Type `none` to skip)_",
+        "_(Type `none` to skip, or tap Quick plan for an instant plan without the AI)_",
         parse_mode="Markdown",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("⚡ Quick plan", callback_data="coach_quick")],
+        ]),
     )
     return AI_COACH_GOALS
 
@@ -334,12 +438,19 @@ async def ai_coach_split(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def ai_coach_goals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Quick plan button: rule-based sessions, built inline (no LLM, no queue)
+    if update.callback_query:
+        await update.callback_query.answer()
+        message_tracker.track(update.effective_chat.id, update.callback_query.message.message_id)
+        context.user_data["coach_goals"] = "No specific goals or constraints."
+        return await _generate_recommendation(update, context, quick=True)
+
     goals = update.message.text.strip()
     if goals.lower() == "none":
         goals = "No specific goals or constraints."
     context.user_data["coach_goals"] = goals
     await _delete_user_msg(update)
-    return await _generate_recommendation(update, context)
+    return await _submit_recommendation(update, context, busy_state=AI_COACH_GOALS)
 
 
 # ---------------------------------------------------------------------------
@@ -347,8 +458,41 @@ async def ai_coach_goals(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ---------------------------------------------------------------------------
 
 
-async def _generate_recommendation(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Call the LLM for all sessions, apply volume guard + fuzzy match, show draft."""
+async def _submit_recommendation(
+    update: Update, context, busy_state, refresh=False, retry_failed=False
+):
+    """Generate in the background; the draft replaces the tracked message.
+
+    refresh bypasses the LLM cache, for "regenerate as-is" where the prompt
+    is unchanged but a new answer is wanted. retry_failed only reruns the
+    sessions that failed last time and keeps the other drafts.
+    """
+    return await submit_ai_job(
+        update,
+        context,
+        "coach",
+        message_tracker.get(update.effective_chat.id),
+        lambda job_context: _generate_recommendation(
+            update, job_context, refresh=refresh, retry_failed=retry_failed
+        ),
+        pending_state=AI_COACH_REVIEW,
+        busy_state=busy_state,
+    )
+
+
+async def _generate_recommendation(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    refresh: bool = False,
+    retry_failed: bool = False,
+    quick: bool = False,
+):
+    """Call the LLM for all sessions, apply volume guard + fuzzy match, show draft.
+
+    quick (or an open circuit breaker) builds the sessions with
+    rule_based_session instead; a session also falls back to it when the
+    breaker opens while it is being generated.
+    """
     bio = context.user_data.get("coach_bio", {})
     sbd = context.user_data.get("coach_sbd", {})
     split = context.user_data.get("coach_split", "PPL")
@@ -373,21 +517,62 @@ async def _generate_recommendation(update: Update, context: ContextTypes.DEFAULT
         base_prompt += "\n".join(f"  {i+1}. {c}" for i, c in enumerate(regen_comments))
         base_prompt += "\n"
 
-    ai_client = get_client()
+    ai_client = get_client("coach", update.effective_user.id)
     canonical_names = await _fetch_canonical_names(update.effective_user.id)
     error_text = "❌ Failed to generate templates. Try /recommend_template again or /cancel."
 
+    last_msg_id = message_tracker.get(update.effective_chat.id)
     try:
         await context.bot.edit_message_text(
             chat_id=update.effective_chat.id,
-            message_id=common.last_msg_id,
+            message_id=last_msg_id,
             text=f"⚙️ Generating {len(sessions)} template{'s' if len(sessions) > 1 else ''} for *{split}* in parallel...",
             parse_mode="Markdown",
         )
     except Exception:
         pass
 
-    logger.info(f"_generate_recommendation: launching {len(sessions)} parallel LLM calls for {split}")
+    # Sessions already drafted (kept when only the failed ones are retried)
+    drafts: dict[str, dict] = {}
+    if retry_failed:
+        drafts = {
+            tmpl["session"]: tmpl
+            for tmpl in context.user_data.get("coach_templates", [])
+            if tmpl.get("session") in sessions
+        }
+    pending = [s for s in sessions if s not in drafts]
+    offline = quick or llm_gateway.breaker.is_open
+    rule_based: list[str] = []
+    if offline:
+        logger.info(
+            f"_generate_recommendation: building {len(pending)} rule-based sessions for {split}"
+        )
+    else:
+        logger.info(
+            f"_generate_recommendation: launching {len(pending)} parallel LLM calls for {split}"
+        )
+
+    # Drafts are shown as each session finishes; running sessions list the
+    # exercise names streamed so far
+    progress = ProgressMessage(
+        context.bot, update.effective_chat.id, last_msg_id, parse_mode="Markdown"
+    )
+    streamed: dict[str, list[str]] = {s: [] for s in pending}
+    status: dict[str, str] = {}
+
+    async def _show_progress(force=False):
+        done = [drafts[s] for s in sessions if s in drafts]
+        if done:
+            text = _build_draft_text(split, done)
+        else:
+            text = f"⚙️ Generating {len(sessions)} template{'s' if len(sessions) > 1 else ''} for *{split}*...\n"
+        for name in sessions:
+            if name in drafts or status.get(name) == "failed":
+                continue
+            names = escape_markdown(", ".join(streamed[name])) or "…"
+            note = f" _({status[name]})_" if name in status else ""
+            text += f"\n⏳ *{name}*{note}: {names}"
+        await progress.update(_fit_message(text), force=force)
 
     async def _call_session(session_name: str):
         allowed = SESSION_MUSCLE_GROUPS.get((split, session_name), _ALL_MUSCLE_GROUPS)
@@ -399,7 +584,19 @@ async def _generate_recommendation(update: Update, context: ContextTypes.DEFAULT
             + " You may also include core/ab work as accessory."
             + " Do NOT include exercises for muscle groups outside this list."
         )
-        response = await ai_client.chat.completions.create(
+        parser = ItemStream("exercises")
+
+        async def on_text(delta):
+            done = parser.feed(delta)
+            if done:
+                streamed[session_name].extend(ex.get("name", "?") for ex in done)
+                await _show_progress()
+
+        await llm_cache.stream(
+            ai_client,
+            on_text,
+            refresh=refresh,
+            validate=is_json,
             model=AI_MODEL,
             messages=[
                 {"role": "system", "content": CSCS_SYSTEM_PROMPT},
@@ -407,47 +604,83 @@ async def _generate_recommendation(update: Update, context: ContextTypes.DEFAULT
             ],
             response_format={"type": "json_object"},
         )
-        return json.loads(response.choices[0].message.content)
-
-    results = await asyncio.gather(
-        *[_call_session(s) for s in sessions],
-        return_exceptions=True,
-    )
-    logger.info("_generate_recommendation: all parallel calls complete")
+        if not parser.complete:
+            if not parser.items:
+                raise ValueError(f"Truncated response without exercises: {parser.text[:200]!r}")
+            logger.warning(
+                f"AI Coach response for '{session_name}' was cut off; "
+                f"keeping {len(parser.items)} complete exercises"
+            )
+        return parser.result()
+
+    def _rule_based(session_name: str):
+        rule_based.append(session_name)
+        return session_name, rule_based_session(split, session_name, sbd, bio, goals)
+
+    async def _run_session(session_name: str):
+        """(session_name, raw template or the last exception), retrying with backoff."""
+        if offline:
+            return _rule_based(session_name)
+        for attempt in range(1, SESSION_ATTEMPTS + 1):
+            try:
+                return session_name, await _call_session(session_name)
+            except Exception as e:
+                if isinstance(e, CircuitOpenError) or llm_gateway.breaker.is_open:
+                    logger.warning(
+                        f"AI Coach: LLM unavailable, using the rule-based '{session_name}'"
+                    )
+                    return _rule_based(session_name)
+                logger.error(
+                    f"AI Coach generation error for session '{session_name}' "
+                    f"(attempt {attempt}/{SESSION_ATTEMPTS}): {e}",
+                    exc_info=e,
+                )
+                if attempt == SESSION_ATTEMPTS:
+                    return session_name, e
+                streamed[session_name] = []
+                status[session_name] = f"retrying, attempt {attempt + 1}"
+                await _show_progress()
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+    tasks = [asyncio.create_task(_run_session(s)) for s in pending]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            session_name, result = await next_done
+            if isinstance(result, Exception):
+                status[session_name] = "failed"
+            else:
+                drafts[session_name] = _session_template(
+                    split, session_name, result, canonical_names
+                )
+                status.pop(session_name, None)
+            context.user_data["coach_templates"] = [
+                drafts[s] for s in sessions if s in drafts
+            ]
+            await _show_progress(force=True)
+    finally:
+        # Only matters when the job itself is cancelled part-way
+        for task in tasks:
+            task.cancel()
+    logger.info("_generate_recommendation: all sessions complete")
+
+    processed_templates = [drafts[s] for s in sessions if s in drafts]
+    failed_sessions = [s for s in sessions if s not in drafts]
+    context.user_data["coach_templates"] = processed_templates
+    context.user_data["coach_failed_sessions"] = failed_sessions
 
-    # Check for any failures
-    failed = [(sessions[i], results[i]) for i in range(len(results)) if isinstance(results[i], Exception)]
-    if failed:
-        for name, exc in failed:
-            logger.error(f"AI Coach generation error for session '{name}': {exc}", exc_info=exc)
+    if not processed_templates:
         try:
             await context.bot.edit_message_text(
                 chat_id=update.effective_chat.id,
-                message_id=common.last_msg_id,
+                message_id=last_msg_id,
                 text=error_text,
             )
         except Exception:
             await context.bot.send_message(chat_id=update.effective_chat.id, text=error_text)
         return ConversationHandler.END
 
-    processed_templates = []
-    for session_name, raw_tmpl in zip(sessions, results):
-        tmpl_name = raw_tmpl.get("template_name", session_name)
-        notes = raw_tmpl.get("notes", "")
-        exercises = _process_exercises(raw_tmpl.get("exercises", []), canonical_names)
-        exercises = _filter_exercises_for_session(exercises, split, session_name)
-        volume_warnings = _check_volume(exercises)
-        processed_templates.append({
-            "template_name": tmpl_name,
-            "notes": notes,
-            "exercises": exercises,
-            "volume_warnings": volume_warnings,
-        })
-
-    context.user_data["coach_templates"] = processed_templates
-
     draft_text = _build_draft_text(split, processed_templates)
-    keyboard = InlineKeyboardMarkup([
+    buttons = [
         [
             InlineKeyboardButton(
                 f"✅ Save {len(processed_templates)} Template{'s' if len(processed_templates) > 1 else ''}",
@@ -455,16 +688,33 @@ async def _generate_recommendation(update: Update, context: ContextTypes.DEFAULT
             ),
             InlineKeyboardButton("🔄 Regenerate", callback_data="coach_regen"),
         ]
-    ])
+    ]
+    fallback_sessions = [s for s in sessions if s in rule_based]
+    if quick:
+        draft_text += "\n⚡ Quick plan from standard rules. Tap Regenerate for an AI-designed one."
+    elif fallback_sessions:
+        draft_text += (
+            f"\n⚡ The AI coach is unavailable, so *{', '.join(fallback_sessions)}* "
+            f"{'was' if len(fallback_sessions) == 1 else 'were'} built from standard rules. "
+            "Tap Regenerate to try the AI again."
+        )
+    if failed_sessions:
+        failed_str = ", ".join(failed_sessions)
+        draft_text += (
+            f"\n⚠️ Could not generate: *{failed_str}*. "
+            "Save the templates above, retry the missing ones, or regenerate."
+        )
+        buttons.append(
+            [InlineKeyboardButton(f"🔁 Retry {failed_str}", callback_data="coach_retry")]
+        )
+    keyboard = InlineKeyboardMarkup(buttons)
 
-    # Telegram message limit is 4096 chars; truncate gracefully if needed
-    if len(draft_text) > 4000:
-        draft_text = draft_text[:3970] + "\n\n_...truncated for display_"
+    draft_text = _fit_message(draft_text)
 
     try:
         await context.bot.edit_message_text(
             chat_id=update.effective_chat.id,
-            message_id=common.last_msg_id,
+            message_id=last_msg_id,
             text=draft_text,
             parse_mode="Markdown",
             reply_markup=keyboard,
@@ -474,11 +724,96 @@ async def _generate_recommendation(update: Update, context: ContextTypes.DEFAULT
         sent = await effective_message.reply_text(
             draft_text, parse_mode="Markdown", reply_markup=keyboard
         )
-        common.last_msg_id = sent.message_id
+        message_tracker.track(update.effective_chat.id, sent.message_id)
 
     return AI_COACH_REVIEW
 
 
+def _session_template(split, session_name, raw_tmpl, canonical_names) -> dict:
+    """Apply fuzzy matching, the session's muscle filter and the volume guard."""
+    exercises = _process_exercises(raw_tmpl.get("exercises", []), canonical_names)
+    exercises = _filter_exercises_for_session(exercises, split, session_name)
+    return {
+        "session": session_name,
+        "template_name": raw_tmpl.get("template_name", session_name),
+        "notes": raw_tmpl.get("notes", ""),
+        "exercises": exercises,
+        "volume_warnings": _check_volume(exercises),
+    }
+
+
+def _fit_message(text: str) -> str:
+    # Telegram message limit is 4096 chars; truncate gracefully if needed
+    if len(text) > 4000:
+        return text[:3970] + "\n\n_...truncated for display_"
+    return text
+
+
+# ---------------------------------------------------------------------------
+# Rule-based generator (AI coach offline / quick plan)
+# ---------------------------------------------------------------------------
+
+
+def rule_based_session(
+    split: str, session_name: str, sbd: dict, bio: dict, goals: str = ""
+) -> dict:
+    """A deterministic session from OFFLINE_SESSIONS, loaded by %1RM.
+
+    Returns the same shape as the LLM's JSON, so it goes through
+    _session_template like an LLM answer.
+    """
+    slots = OFFLINE_SESSIONS.get((split, session_name))
+    if slots is None:
+        slots = OFFLINE_SESSIONS[("FullBody", "Full Body")]
+    strength = "strength" in goals.lower()
+
+    exercises = []
+    for name, role in slots:
+        one_rm = _estimated_1rm(name, sbd, bio)
+        if one_rm is None:
+            sets, reps = BODYWEIGHT_SCHEME
+            weight = 0
+        else:
+            if role == "main" and strength:
+                role = "main_strength"
+            sets, reps, pct = OFFLINE_SCHEMES[role]
+            weight = _round_load(one_rm * pct)
+        exercises.append({
+            "name": name,
+            "muscle_group": EXERCISE_MUSCLE_MAP.get(name.lower(), "unknown"),
+            "sets": sets,
+            "sets_config": [{"weight": weight, "reps": reps} for _ in range(sets)],
+        })
+
+    main_pct = OFFLINE_SCHEMES["main_strength" if strength else "main"][2]
+    return {
+        "template_name": f"{split} {session_name}",
+        "notes": (
+            f"Rule-based plan: main lift at {main_pct:.0%} of 1RM, "
+            "compounds at 70%, accessories at 60%."
+        ),
+        "exercises": exercises,
+    }
+
+
+def _estimated_1rm(exercise: str, sbd: dict, bio: dict) -> float | None:
+    """Estimated 1RM for `exercise` from the SBD maxes, None for bodyweight."""
+    ratio = OFFLINE_LOAD_RATIOS.get(exercise)
+    if ratio is None:
+        return None
+    lift, fraction = ratio
+    base = sbd.get(lift) or 0
+    if base <= 0:
+        body_weight = bio.get("weight") or DEFAULT_BODY_WEIGHT
+        base = body_weight * BEGINNER_1RM_RATIOS[lift]
+    return base * fraction
+
+
+def _round_load(weight: float, step: float = 2.5) -> float:
+    """Round to the nearest loadable increment, never below one step."""
+    return max(step, round(weight / step) * step)
+
+
 # ---------------------------------------------------------------------------
 # Review callbacks: Save / Regenerate
 # ---------------------------------------------------------------------------
@@ -487,7 +822,7 @@ async def _generate_recommendation(update: Update, context: ContextTypes.DEFAULT
 async def ai_coach_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    common.last_msg_id = query.message.message_id
+    message_tracker.track(update.effective_chat.id, query.message.message_id)
 
     if query.data == "coach_regen":
         await query.edit_message_text(
@@ -504,6 +839,11 @@ async def ai_coach_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if query.data == "coach_save":
         return await _save_coach_templates(update, context)
 
+    if query.data == "coach_retry":
+        return await _submit_recommendation(
+            update, context, busy_state=AI_COACH_REVIEW, retry_failed=True
+        )
+
     return AI_COACH_REVIEW
 
 
@@ -512,8 +852,10 @@ async def ai_coach_regen_comment(update: Update, context: ContextTypes.DEFAULT_T
     # Skip button pressed
     if update.callback_query:
         await update.callback_query.answer()
-        common.last_msg_id = update.callback_query.message.message_id
-        return await _generate_recommendation(update, context)
+        message_tracker.track(update.effective_chat.id, update.callback_query.message.message_id)
+        return await _submit_recommendation(
+            update, context, busy_state=AI_COACH_REGEN_COMMENT, refresh=True
+        )
 
     # Text comment provided — accumulate across regenerations
     comment = update.message.text.strip()
@@ -521,7 +863,9 @@ async def ai_coach_regen_comment(update: Update, context: ContextTypes.DEFAULT_T
     comments: list[str] = context.user_data.get("coach_regen_comments", [])
     comments.append(comment)
     context.user_data["coach_regen_comments"] = comments
-    return await _generate_recommendation(update, context)
+    return await _submit_recommendation(
+        update, context, busy_state=AI_COACH_REGEN_COMMENT
+    )
 
 
 async def _save_coach_templates(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -537,6 +881,15 @@ async def _save_coach_templates(update: Update, context: ContextTypes.DEFAULT_TY
     saved_names: list[str] = []
     duplicate_names: list[str] = []
 
+    exercise_ids = await exercise_catalog.resolve(
+        [ex["name"] for tmpl in templates for ex in tmpl["exercises"]],
+        muscle_groups={
+            ex["name"]: ex.get("muscle_group")
+            for tmpl in templates
+            for ex in tmpl["exercises"]
+        },
+    )
+
     try:
         async with AsyncSessionLocal() as session:
             for tmpl in templates:
@@ -557,10 +910,11 @@ async def _save_coach_templates(update: Update, context: ContextTypes.DEFAULT_TY
                     session.add(TemplateExercise(
                         template_id=template.id,
                         exercise_name=ex["name"],
+                        exercise_id=exercise_ids[ex["name"]],
                         default_sets=ex["sets"],
                         default_weight=sc[0]["weight"] if sc else 0,
                         default_reps=sc[0]["reps"] if sc else 0,
-                        sets_config=json.dumps(sc),
+                        sets_config=sc,
                         order=idx,
                     ))
                 await session.flush()
@@ -612,17 +966,16 @@ def _correct_muscle_group(exercise_name: str, llm_group: str) -> tuple[str, bool
         return llm_group, False
 
     # Fuzzy match against map keys
-    result = fuzz_process.extractOne(name_lower, EXERCISE_MUSCLE_MAP.keys())
+    result = _MUSCLE_MAP_INDEX.best(name_lower, MUSCLE_CORRECTION_THRESHOLD)
     if result:
         match, score = result
-        if score >= MUSCLE_CORRECTION_THRESHOLD:
-            correct = EXERCISE_MUSCLE_MAP[match]
-            if correct != llm_group:
-                logger.info(
-                    f"Muscle group corrected: '{exercise_name}' "
-                    f"LLM='{llm_group}' → '{correct}' (via '{match}', score {score})"
-                )
-                return correct, True
+        correct = EXERCISE_MUSCLE_MAP[match]
+        if correct != llm_group:
+            logger.info(
+                f"Muscle group corrected: '{exercise_name}' "
+                f"LLM='{llm_group}' → '{correct}' (via '{match}', score {score})"
+            )
+            return correct, True
 
     return llm_group, False
 
@@ -631,15 +984,16 @@ def _process_exercises(raw_exercises: list[dict], canonical_names: list[str]) ->
     """Fuzzy-match names, correct muscle groups, normalise sets_config, and deduplicate."""
     exercises = []
     seen_names: set[str] = set()
-    for ex in raw_exercises:
-        name = ex.get("name", "Unknown Exercise")
-
-        # Fuzzy-match exercise name to user's existing canonical names
-        if canonical_names:
-            match, score = fuzz_process.extractOne(name, canonical_names)
-            if score >= FUZZY_MATCH_THRESHOLD:
-                logger.info(f"Name fuzzy match: '{name}' → '{match}' (score {score})")
-                name = match
+    names = [ex.get("name", "Unknown Exercise") for ex in raw_exercises]
+    # Fuzzy-match exercise names to the user's existing canonical names, in one batch
+    matches = [None] * len(names)
+    if canonical_names:
+        matches = index_for(canonical_names).best_many(names, FUZZY_MATCH_THRESHOLD)
+    for ex, name, result in zip(raw_exercises, names, matches):
+        if result:
+            match, score = result
+            logger.info(f"Name fuzzy match: '{name}' → '{match}' (score {score})")
+            name = match
 
         llm_group = ex.get("muscle_group", "unknown").lower()
         muscle_group, _ = _correct_muscle_group(name, llm_group)
@@ -744,11 +1098,6 @@ async def _delete_user_msg(update: Update):
 
 
 async def _replace_last(context, update, sent):
-    if common.last_msg_id:
-        try:
-            await context.bot.delete_message(
-                chat_id=update.effective_chat.id, message_id=common.last_msg_id
-            )
-        except Exception:
-            pass
-    common.last_msg_id = sent.message_id
+    await message_tracker.replace_last(
+        context.bot, update.effective_chat.id, sent.message_id
+    )
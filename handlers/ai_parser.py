@@ -0,0 +1,177 @@
+"""Rule-based parser for simple workout descriptions.
+
+Most /add_template_ai inputs follow a handful of shapes, e.g.
+
+    Push Day: Bench 3x5 @ 80kg, OHP 3x8 @ 40kg
+    Leg Day: 3 sets of Squats at 100kg for 5 reps
+    Pull: Deadlift 100x5 110x3 120x1; Pull-ups 3x8
+
+parse_template_text() reads those into the same {template_name, exercises}
+structure the LLM returns, with a confidence score. Anything it cannot read
+cleanly gets a low score and goes to the LLM instead.
+"""
+
+import re
+
+from handlers.common import parse_exercise_details, parse_reps
+
+# Below this the input is handed to the LLM
+FAST_PATH_MIN_CONFIDENCE = 0.8
+DEFAULT_TEMPLATE_NAME = "AI Template"
+
+_NUM = r"\d+(?:\.\d+)?"
+_REPS = r"\d+(?:\s*-\s*\d+)?"
+_KG = r"\s*kgs?"
+
+# "3 sets of Squats at 100kg for 5 reps", "3 sets of Push-ups for 15 reps"
+_SETS_OF = re.compile(
+    rf"^(?P<sets>\d+)\s*sets?\s+of\s+(?P<name>.+?)"
+    rf"(?:\s+(?:at\s+|@\s*)?(?P<weight>{_NUM}){_KG})?"
+    rf"\s+(?:for\s+|x\s*)(?P<reps>{_REPS})\s*reps?$",
+    re.IGNORECASE,
+)
+# "Bench 3x5 @ 80kg", "Bench 3x5 80kg", "Pull-ups 3x8", "Curl 3 x 10-12 reps"
+_SETS_X_REPS = re.compile(
+    rf"^(?P<name>.+?)\s+(?P<sets>\d+)\s*[x×]\s*(?P<reps>{_REPS})(?:\s*reps?)?"
+    rf"(?:\s*(?:@|\bat)\s*(?P<at_weight>{_NUM})(?:{_KG})?|\s+(?P<weight>{_NUM}){_KG})?$",
+    re.IGNORECASE,
+)
+# "Bench 80kg 3x5", "Bench @ 80kg 3x5"
+_WEIGHT_SETS_X_REPS = re.compile(
+    rf"^(?P<name>.+?)\s+(?:@\s*)?(?P<weight>{_NUM}){_KG}\s+"
+    rf"(?P<sets>\d+)\s*[x×]\s*(?P<reps>{_REPS})(?:\s*reps?)?$",
+    re.IGNORECASE,
+)
+# "Deadlift 100x5 110x3 120x1", "Deadlift 3 100x5 110x3 120x1" (set entry format)
+_PER_SET = re.compile(
+    rf"^(?P<name>.+?)\s+(?P<count>\d+\s+)?"
+    rf"(?P<sets>{_NUM}x\d+(?:\s+{_NUM}x\d+)*)$",
+    re.IGNORECASE,
+)
+_NAME = re.compile(r"^[A-Za-z][A-Za-z'&/().\- ]*$")
+_SPLIT_ITEMS = re.compile(r"[,;\n]+|\s+then\s+", re.IGNORECASE)
+# Words that should have been consumed by the grammar, not left in a name
+_STRAY_WORDS = {"set", "sets", "rep", "reps", "kg", "kgs", "lb", "lbs", "for", "at", "x"}
+
+MAX_PLAUSIBLE_SETS = 10
+MAX_PLAUSIBLE_REPS = 50
+MAX_PLAUSIBLE_WEIGHT = 500
+
+
+class FastPathStats:
+    """How many inputs the rule-based parser answered without the LLM."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.handled = 0
+
+    def record(self, handled: bool):
+        self.attempts += 1
+        self.handled += handled
+
+    def snapshot(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "handled": self.handled,
+            "fraction": self.handled / self.attempts if self.attempts else 0.0,
+        }
+
+
+fast_path_stats = FastPathStats()
+
+
+def parse_template_text(text: str) -> tuple[dict | None, float]:
+    """Parse a workout description into ({template_name, exercises}, confidence).
+
+    Returns (None, 0.0) when any part of the input doesn't fit the grammar.
+    """
+    text = (text or "").strip()
+    if not text:
+        return None, 0.0
+
+    confidence = 1.0
+    template_name, sep, body = text.partition(":")
+    if sep and _NAME.match(template_name.strip()) and len(template_name.split()) <= 6:
+        template_name = template_name.strip()
+    else:
+        # No "Name:" prefix; the LLM would have made one up
+        template_name, body = DEFAULT_TEMPLATE_NAME, text
+        confidence -= 0.1
+
+    exercises: dict[str, dict] = {}
+    items = [item.strip(" .") for item in _SPLIT_ITEMS.split(body)]
+    for item in filter(None, items):
+        parsed = _parse_item(item)
+        if parsed is None:
+            return None, 0.0
+        name, sets_config, item_confidence = parsed
+        confidence = min(confidence, item_confidence)
+        # Sets of the same exercise are grouped into one entry
+        key = name.lower()
+        if key in exercises:
+            exercises[key]["sets_config"].extend(sets_config)
+            exercises[key]["sets"] = len(exercises[key]["sets_config"])
+        else:
+            exercises[key] = {
+                "name": name,
+                "sets": len(sets_config),
+                "sets_config": sets_config,
+            }
+
+    if not exercises:
+        return None, 0.0
+    return {"template_name": template_name, "exercises": list(exercises.values())}, confidence
+
+
+def try_fast_path(text: str) -> dict | None:
+    """The parsed template if the rule-based parser is confident, else None."""
+    data, confidence = parse_template_text(text)
+    handled = data is not None and confidence >= FAST_PATH_MIN_CONFIDENCE
+    fast_path_stats.record(handled)
+    return data if handled else None
+
+
+def _parse_item(item: str) -> tuple[str, list[dict], float] | None:
+    """One exercise entry into (name, sets_config, confidence), or None."""
+    match = _PER_SET.match(item)
+    if match and (match["count"] or " " in match["sets"]):
+        count = match["count"] or str(len(match["sets"].split()))
+        _, sets_config, error = parse_exercise_details(
+            f"{count} {match['sets']}"
+        )
+        if error:
+            return None
+        return _checked(match["name"], sets_config)
+
+    match = (
+        _SETS_OF.match(item)
+        or _WEIGHT_SETS_X_REPS.match(item)
+        or _SETS_X_REPS.match(item)
+    )
+    if match is None:
+        return None
+    groups = match.groupdict()
+    weight = groups.get("weight") or groups.get("at_weight") or 0
+    reps = parse_reps(re.sub(r"\s+", "", match["reps"]))
+    num_sets = int(match["sets"])
+    if num_sets <= 0 or reps <= 0:
+        return None
+    sets_config = [{"weight": float(weight), "reps": reps} for _ in range(num_sets)]
+    return _checked(match["name"], sets_config)
+
+
+def _checked(name: str, sets_config: list[dict]) -> tuple[str, list[dict], float] | None:
+    name = name.strip()
+    if not _NAME.match(name) or _STRAY_WORDS & set(name.lower().split()):
+        return None
+    confidence = 1.0
+    if len(name.split()) > 5:
+        confidence -= 0.3
+    if (
+        len(sets_config) > MAX_PLAUSIBLE_SETS
+        or any(s["reps"] > MAX_PLAUSIBLE_REPS for s in sets_config)
+        or any(s["weight"] > MAX_PLAUSIBLE_WEIGHT for s in sets_config)
+    ):
+        # Probably weight and reps swapped or a unit we don't read
+        confidence -= 0.3
+    return name, sets_config, confidence
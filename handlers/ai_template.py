@@ -4,18 +4,25 @@ import json
 import io
 import base64
 import csv
+import time
 
 from telegram import Update
 from telegram.ext import ContextTypes
-import handlers.common as common
 from handlers.common import (
+    ProgressMessage,
+    message_tracker,
     logger,
     get_client,
+    submit_ai_job,
     parse_reps,
     ADD_TEMPLATE_AI_INPUT,
     EDIT_TEMPLATE_EXERCISE,
 )
+from handlers.ai_parser import try_fast_path
 from handlers.template import show_edited_template
+from json_stream import ItemStream
+from image_prep import image_stats, prepare_photo
+from llm_cache import cache_key, is_json, llm_cache
 
 
 async def add_template_ai_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -27,14 +34,9 @@ async def add_template_ai_start(update: Update, context: ContextTypes.DEFAULT_TY
         "• A CSV file with workout data\n"
         "• A photo of a workout plan (I'll read it with AI)"
     )
-    if common.last_msg_id:
-        try:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-        except Exception as e:
-            print(f"Could not delete: {e}")
-    common.last_msg_id = update.message.message_id
+    await message_tracker.replace_last(
+        context.bot, update.message.chat_id, update.message.message_id
+    )
     return ADD_TEMPLATE_AI_INPUT
 
 
@@ -42,6 +44,12 @@ async def process_ai_template(update: Update, context: ContextTypes.DEFAULT_TYPE
     """Process the natural language workout description using OpenAI."""
     user_input = update.message.text
 
+    # Simple descriptions are parsed on the spot, without the LLM round trip
+    data = try_fast_path(user_input)
+    if data is not None:
+        logger.info(f"Template parsed by the fast path: {len(data['exercises'])} exercises")
+        return await _process_parsed_workout(update, context, data)
+
     # Show typing action to user
     await context.bot.send_chat_action(
         chat_id=update.effective_chat.id, action="typing"
@@ -51,16 +59,23 @@ async def process_ai_template(update: Update, context: ContextTypes.DEFAULT_TYPE
     processing_msg = await update.message.reply_text(
         "Got it! Analyzing your workout routine... ⏳"
     )
-    if common.last_msg_id:
-        try:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-        except Exception:
-            pass
-    common.last_msg_id = processing_msg.message_id
+    await message_tracker.replace_last(
+        context.bot, update.message.chat_id, processing_msg.message_id
+    )
+
+    return await submit_ai_job(
+        update,
+        context,
+        "template_text",
+        processing_msg.message_id,
+        lambda job_context: _parse_template_text(update, job_context, user_input),
+        pending_state=ADD_TEMPLATE_AI_INPUT,
+    )
+
 
-    ai_client = get_client()
+async def _parse_template_text(update, context, user_input):
+    """Ask the LLM to turn a workout description into a template draft."""
+    ai_client = get_client("template_text", update.effective_user.id)
     system_prompt = (
         "You are a workout assistant. Your task is to parse a workout description into a detailed JSON format.\n"
         "The output MUST be a JSON object with two keys:\n"
@@ -81,142 +96,16 @@ async def process_ai_template(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
 
     try:
-        response = await ai_client.chat.completions.create(
-            model="allenai/Molmo2-8B",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input},
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=4000,
+        data = await _stream_template(
+            update, context, ai_client, system_prompt, user_input,
+            "Analyzing your workout routine... ⏳",
         )
-
-        content = response.choices[0].message.content
-        logger.info(f"AI Response length: {len(content)} characters")
-
-        try:
-            data = json.loads(content)
-        except json.JSONDecodeError as je:
-            logger.warning(
-                f"Initial JSON parsing failed: {je}. Attempting to fix truncated JSON."
-            )
-            # Attempt to fix truncated JSON by closing arrays and objects
-            fixed_content = content.strip()
-            # Simple heuristic: if it doesn't end with } or ] and looks like a JSON object
-            if not fixed_content.endswith("}"):
-                stack = []
-                for char in fixed_content:
-                    if char == "{":
-                        stack.append("}")
-                    elif char == "[":
-                        stack.append("]")
-                    elif char == "}":
-                        if stack and stack[-1] == "}":
-                            stack.pop()
-                    elif char == "]":
-                        if stack and stack[-1] == "]":
-                            stack.pop()
-
-                # Append missing closing brackets in reverse order (LIFO)
-                while stack:
-                    fixed_content += stack.pop()
-
-                try:
-                    data = json.loads(fixed_content)
-                    logger.info("Successfully fixed truncated JSON.")
-                except json.JSONDecodeError as je2:
-                    logger.error(f"JSON parsing error after fix attempt: {je2}")
-                    logger.error(
-                        f"Raw content snippet: {content[:1000]}...{content[-500:]}"
-                    )
-                    await update.message.reply_text(
-                        "The AI returned an invalid or truncated response. Please try again with a shorter description."
-                    )
-                    return ADD_TEMPLATE_AI_INPUT
-            else:
-                # Re-raise if it ends with } but still failed
-                logger.error(f"JSON parsing error: {je}")
-                logger.error(f"Raw content snippet: {content[:1000]}")
-                await update.message.reply_text(
-                    "The AI returned an invalid response. Please try again."
-                )
-                return ADD_TEMPLATE_AI_INPUT
-
-        template_name = data.get("template_name", "AI Template")
-        raw_exercises = data.get("exercises", [])
-
-        exercises = []
-        for ex in raw_exercises:
-            name = ex.get("name", "Unknown Exercise")
-            num_sets = ex.get("sets", 0)
-            sets_config = ex.get("sets_config", [])
-
-            # Simple validation
-            if num_sets > 0 and len(sets_config) > 0:
-                # Ensure weight and reps are valid
-                valid_config = []
-                for s in sets_config:
-                    weight = float(s.get("weight", 0.0))
-                    reps = int(s.get("reps", 0))
-                    if reps > 0:
-                        valid_config.append({"weight": weight, "reps": reps})
-
-                if valid_config:
-                    exercises.append(
-                        {
-                            "name": name,
-                            "sets": len(valid_config),
-                            "sets_config": valid_config,
-                        }
-                    )
-            else:
-                logger.warning(f"AI parsing skip exercise {name}: Invalid structure")
-
-        if not exercises:
+        if data is None:
             await update.message.reply_text(
-                "Could not parse any exercises correctly. Please try again with a clearer description."
+                "The AI returned an invalid or truncated response. Please try again with a shorter description."
             )
             return ADD_TEMPLATE_AI_INPUT
-
-        context.user_data["template_name"] = template_name
-        context.user_data["exercises"] = exercises
-
-        # Redirect to editing UI for confirmation
-        context.user_data["editing_template_id"] = None  # New template
-        context.user_data["editing_template_name"] = template_name
-        context.user_data["editing_exercises"] = [
-            {
-                "id": None,
-                "name": ex["name"],
-                "sets": ex["sets"],
-                "weight": ex["sets_config"][0]["weight"] if ex["sets_config"] else 0,
-                "reps": ex["sets_config"][0]["reps"] if ex["sets_config"] else 0,
-                "sets_config": ex["sets_config"],
-            }
-            for ex in exercises
-        ]
-
-        # Confirmation message
-        ex_list = "\n".join([f"- {ex['name']}: {ex['sets']} sets" for ex in exercises])
-        sent = await update.message.reply_text(
-            f"I've parsed your workout:\n\n"
-            f"**Template Name:** {template_name}\n"
-            f"**Exercises:**\n{ex_list}\n\n"
-            f"Review and edit below:"
-        )
-
-        # Update last_msg_id so show_edited_template uses it
-        if common.last_msg_id:
-            try:
-                await context.bot.delete_message(
-                    chat_id=update.message.chat_id, message_id=common.last_msg_id
-                )
-            except Exception:
-                pass
-        common.last_msg_id = sent.message_id
-
-        # Pass the message object so show_edited_template can edit it
-        return await show_edited_template(update, context, sent)
+        return await _process_parsed_workout(update, context, data)
 
     except Exception as e:
         logger.error(f"AI parsing error: {e}")
@@ -226,6 +115,48 @@ async def process_ai_template(update: Update, context: ContextTypes.DEFAULT_TYPE
         return ADD_TEMPLATE_AI_INPUT
 
 
+async def _stream_template(update, context, ai_client, system_prompt, user_content, header):
+    """Stream the LLM's template JSON, listing exercises in the placeholder as they arrive.
+
+    Returns the parsed template; a response cut off part-way keeps every
+    complete exercise. None if not a single exercise came through.
+    """
+    chat_id = update.effective_chat.id
+    progress = ProgressMessage(context.bot, chat_id, message_tracker.get(chat_id))
+    parser = ItemStream("exercises")
+
+    async def on_text(delta):
+        if parser.feed(delta):
+            lines = [
+                f"✓ {ex.get('name', '?')} — {len(ex.get('sets_config') or [])} sets"
+                for ex in parser.items
+            ]
+            await progress.update(header + "\n\n" + "\n".join(lines))
+
+    content = await llm_cache.stream(
+        ai_client,
+        on_text,
+        validate=is_json,
+        model="allenai/Molmo2-8B",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+        ],
+        response_format={"type": "json_object"},
+        max_tokens=4000,
+    )
+    logger.info(f"AI Response length: {len(content)} characters")
+
+    if not parser.complete:
+        if not parser.items:
+            logger.error(f"Unusable AI response: {content[:1000]}")
+            return None
+        logger.warning(
+            f"AI response was cut off; keeping {len(parser.items)} complete exercises"
+        )
+    return parser.result()
+
+
 async def process_ai_template_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process file uploads (CSV or photos) for AI template creation."""
     # Show typing action
@@ -234,31 +165,30 @@ async def process_ai_template_file(update: Update, context: ContextTypes.DEFAULT
     )
 
     processing_msg = await update.message.reply_text("Processing your file... ⏳")
-    if common.last_msg_id:
-        try:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-        except Exception:
-            pass
-    common.last_msg_id = processing_msg.message_id
+    await message_tracker.replace_last(
+        context.bot, update.message.chat_id, processing_msg.message_id
+    )
+
+    return await submit_ai_job(
+        update,
+        context,
+        "template_file",
+        processing_msg.message_id,
+        lambda job_context: _parse_template_file(update, job_context),
+        pending_state=ADD_TEMPLATE_AI_INPUT,
+    )
 
+
+async def _parse_template_file(update, context):
+    """Read a photo (via the vision model) or CSV/document into a template draft."""
     try:
         # Check if it's a photo
         if update.message.photo:
-            # Get the largest photo
-            photo = update.message.photo[-1]
-            file = await context.bot.get_file(photo.file_id)
-
-            # Download to memory
-            image_bytes = io.BytesIO()
-            await file.download_to_memory(image_bytes)
-            image_bytes.seek(0)
+            # Smallest sufficient size, grayscaled and recompressed
+            image = await prepare_photo(context.bot, update.message.photo)
+            image_base64 = base64.b64encode(image.data).decode("ascii")
 
-            # Convert to base64 for AI vision
-            image_base64 = base64.b64encode(image_bytes.read()).decode("utf-8")
-
-            ai_client = get_client()
+            ai_client = get_client("template_file", update.effective_user.id)
             system_prompt = (
                 "You are a workout assistant. Your task is to analyze an image of a workout plan "
                 "and parse it into a detailed JSON format.\n"
@@ -275,7 +205,17 @@ async def process_ai_template_file(update: Update, context: ContextTypes.DEFAULT
                 "- Provide ONLY the JSON response, no other text."
             )
 
-            response = await ai_client.chat.completions.create(
+            start = time.perf_counter()
+            content = await llm_cache.complete(
+                ai_client,
+                validate=is_json,
+                # Key by image digest instead of hashing the inlined base64
+                key=cache_key(
+                    model="allenai/Molmo2-8B",
+                    system=system_prompt,
+                    image_sha256=image.digest,
+                    max_tokens=4000,
+                ),
                 model="allenai/Molmo2-8B",
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -298,8 +238,8 @@ async def process_ai_template_file(update: Update, context: ContextTypes.DEFAULT
                 response_format={"type": "json_object"},
                 max_tokens=4000,
             )
+            image_stats.record(image, time.perf_counter() - start)
 
-            content = response.choices[0].message.content
             logger.info(f"AI Vision Response length: {len(content)} characters")
 
             try:
@@ -380,7 +320,7 @@ async def process_ai_template_file(update: Update, context: ContextTypes.DEFAULT
                 try:
                     content = file_bytes.read().decode("utf-8")
 
-                    ai_client = get_client()
+                    ai_client = get_client("template_file", update.effective_user.id)
                     system_prompt = (
                         "You are a workout assistant. Your task is to parse a workout description into a detailed JSON format.\n"
                         "The output MUST be a JSON object with two keys:\n"
@@ -392,17 +332,12 @@ async def process_ai_template_file(update: Update, context: ContextTypes.DEFAULT
                         "Provide ONLY the JSON response, no other text."
                     )
 
-                    response = await ai_client.chat.completions.create(
-                        model="allenai/Molmo2-8B",
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": content},
-                        ],
-                        response_format={"type": "json_object"},
-                        max_tokens=4000,
+                    data = await _stream_template(
+                        update, context, ai_client, system_prompt, content,
+                        "Processing your file... ⏳",
                     )
-
-                    data = json.loads(response.choices[0].message.content)
+                    if data is None:
+                        raise ValueError("no exercises in the AI response")
                     return await _process_parsed_workout(update, context, data)
 
                 except Exception as e:
@@ -493,15 +428,10 @@ async def _process_parsed_workout(
         f"Review and edit below:"
     )
 
-    # Update last_msg_id so show_edited_template uses it
-    if common.last_msg_id:
-        try:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-        except Exception:
-            pass
-    common.last_msg_id = sent.message_id
+    # Track the confirmation so show_edited_template edits it
+    await message_tracker.replace_last(
+        context.bot, update.message.chat_id, sent.message_id
+    )
 
     # Pass the message object so show_edited_template can edit it
     return await show_edited_template(update, context, sent)
@@ -1,25 +1,20 @@
 """Shared state, constants, keyboards, and utility functions for all handlers."""
 
 import logging
-import os
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ConversationHandler
-from openai import AsyncOpenAI
+import time
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import ConversationHandler, TypeHandler
 
-# --- OpenAI Client Singleton ---
+from ai_jobs import ai_jobs, AIJobQueueFull
+from llm_gateway import llm_gateway
+from lru import LRUCache, MISSING
 
-client = None
+# --- LLM Client ---
 
 
-def get_client():
-    global client
-    if client is None:
-        api_key = os.getenv("OPENAI_API_KEY") or os.getenv("API_TOKEN")
-        if not api_key:
-            # Fallback for testing or incomplete setup
-            return AsyncOpenAI(api_key="sk-dummy")
-        client = AsyncOpenAI(api_key=api_key, base_url="https://api.publicai.co/v1")
-    return client
+def get_client(flow=None, user_id=None):
+    """Client for one AI flow; calls share the gateway's pool and limits."""
+    return llm_gateway.client(flow, user_id)
 
 
 # --- Logging ---
@@ -27,10 +22,244 @@ def get_client():
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- Shared Mutable State ---
+# --- Per-chat Message Tracking ---
 
-last_msg_id = None
-last_chat_id = None
+MESSAGE_TRACKER_SIZE = 10_000
+
+
+class MessageTracker:
+    """The last bot-managed message of each chat, i.e. the one the next step replaces.
+
+    Bounded LRU keyed by chat_id. attach() mirrors it into a dict that a
+    persistence backend saves (bot_data), so tracked ids survive a restart.
+    """
+
+    def __init__(self, maxsize: int = MESSAGE_TRACKER_SIZE):
+        self._last = LRUCache(maxsize)
+        self._store = None
+
+    def attach(self, store: dict):
+        """Load tracked ids from `store` and keep it in sync from now on."""
+        for chat_id, message_id in list(store.items()):
+            self._last.put(chat_id, message_id)
+        for chat_id in [c for c in store if c not in self._last]:
+            del store[chat_id]
+        self._store = store
+
+    def get(self, chat_id) -> int | None:
+        return self._last.get(chat_id, None)
+
+    def track(self, chat_id, message_id):
+        """Remember `message_id` as the chat's last message without deleting anything."""
+        evicted = self._last.put(chat_id, message_id)
+        if self._store is not None:
+            self._store[chat_id] = message_id
+            for old_chat_id, _ in evicted:
+                self._store.pop(old_chat_id, None)
+
+    def forget(self, chat_id) -> int | None:
+        if self._store is not None:
+            self._store.pop(chat_id, None)
+        return self._last.pop(chat_id)
+
+    async def delete_last(self, bot, chat_id):
+        """Delete the chat's tracked message, if any, and forget it."""
+        message_id = self.forget(chat_id)
+        if message_id is None:
+            return
+        try:
+            await bot.delete_message(chat_id=chat_id, message_id=message_id)
+        except Exception as e:
+            logger.info(f"Could not delete message {message_id} in chat {chat_id}: {e}")
+
+    async def replace_last(self, bot, chat_id, message_id):
+        """Delete the chat's previous tracked message and track `message_id` instead."""
+        if self.get(chat_id) != message_id:
+            await self.delete_last(bot, chat_id)
+        self.track(chat_id, message_id)
+
+    def __len__(self):
+        return len(self._last)
+
+
+message_tracker = MessageTracker()
+
+
+# --- Background AI Jobs ---
+
+AI_BUSY_TEXT = (
+    "😅 I'm handling a lot of AI requests right now. "
+    "Please try again in a minute, or /cancel."
+)
+
+
+async def _show_job_status(context, chat_id, message_id, text):
+    if message_id is not None:
+        try:
+            await context.bot.edit_message_text(
+                chat_id=chat_id, message_id=message_id, text=text
+            )
+            return
+        except Exception:
+            pass
+    await context.bot.send_message(chat_id=chat_id, text=text)
+
+
+class AIJobContext:
+    """What a background AI job sees of its handler's context.
+
+    user_data is a copy taken when the job is submitted. Keys the job sets
+    or removes are applied to the real user_data once its AIJobResult is
+    processed, so jobs assign keys instead of mutating values in place.
+    """
+
+    def __init__(self, context):
+        self.bot = context.bot
+        self.application = context.application
+        self.user_data = dict(context.user_data)
+        self._submitted = dict(self.user_data)
+
+    def changes(self) -> tuple[dict, list]:
+        """(keys set or replaced by the job, keys it removed)."""
+        changed = {
+            key: value
+            for key, value in self.user_data.items()
+            if self._submitted.get(key, MISSING) is not value
+        }
+        removed = [key for key in self._submitted if key not in self.user_data]
+        return changed, removed
+
+
+class AIJobResult(Update):
+    """Synthetic update that hands a finished AI job back to its conversation.
+
+    It carries the job's user and chat, so it waits for the user's turn in
+    PerUserUpdateProcessor and its user_data is persisted like any other
+    update's. It has no message, so only AIJobResultHandler matches it.
+    """
+
+    def __init__(self, update, kind, state, changed, removed):
+        super().__init__(update_id=update.update_id)
+        with self._unfrozen():
+            self._effective_user = update.effective_user
+            self._effective_chat = update.effective_chat
+            self.kind = kind
+            self.state = state
+            self.changed = changed
+            self.removed = removed
+
+
+async def resume_ai_job(update: AIJobResult, context):
+    """Apply a finished job's user_data changes and move to the state it returned."""
+    context.user_data.update(update.changed)
+    for key in update.removed:
+        context.user_data.pop(key, None)
+    return update.state
+
+
+class AIJobResultHandler(TypeHandler):
+    """Resumes a conversation with the results of its AI jobs of `kinds`."""
+
+    def __init__(self, *kinds):
+        super().__init__(AIJobResult, resume_ai_job)
+        self.kinds = kinds
+
+    def check_update(self, update):
+        return isinstance(update, AIJobResult) and update.kind in self.kinds
+
+
+async def submit_ai_job(
+    update, context, kind, message_id, run, pending_state, busy_state=None
+):
+    """Hand an LLM-backed step to the AI job queue and return immediately.
+
+    `run(context)` does the work, editing the placeholder `message_id`, and
+    returns the conversation's next state. In a job it gets an AIJobContext
+    and its result comes back as an AIJobResult update. Returns
+    `pending_state`, or `busy_state` when the queue is full. Without running
+    workers (tests, scripts) the step is awaited inline with the handler's
+    own context and its state is returned.
+    """
+    if not ai_jobs.running:
+        return await run(context)
+
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+    existing = ai_jobs.active_job(user_id)
+    if existing is not None:
+        await _show_job_status(
+            context,
+            chat_id,
+            message_id,
+            f"⏳ Still working on your previous request ({existing.status}). "
+            "Send /cancel to stop it.",
+        )
+        return pending_state
+
+    job_context = AIJobContext(context)
+
+    async def run_job():
+        state = await run(job_context)
+        await context.application.update_queue.put(
+            AIJobResult(update, kind, state, *job_context.changes())
+        )
+
+    try:
+        job = ai_jobs.submit(kind, user_id, chat_id, message_id, run_job)
+    except AIJobQueueFull:
+        await _show_job_status(context, chat_id, message_id, AI_BUSY_TEXT)
+        return busy_state if busy_state is not None else pending_state
+
+    ahead = ai_jobs.position(job)
+    if ahead:
+        await _show_job_status(
+            context,
+            chat_id,
+            message_id,
+            f"⏳ Queued — {ahead} request{'s' if ahead > 1 else ''} ahead of yours. "
+            "Send /cancel to stop it.",
+        )
+    return pending_state
+
+
+# Telegram allows roughly one edit per second per chat
+PROGRESS_EDIT_INTERVAL = 1.5
+
+
+class ProgressMessage:
+    """Placeholder message edited with growing partial output, rate-limited."""
+
+    def __init__(
+        self, bot, chat_id, message_id, interval=PROGRESS_EDIT_INTERVAL, parse_mode=None
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval = interval
+        self.parse_mode = parse_mode
+        self.edits = 0
+        self._shown = None
+        self._last_edit = float("-inf")
+
+    async def update(self, text: str, force: bool = False):
+        """Show `text` unless it is unchanged or the last edit was too recent."""
+        if self.message_id is None or text == self._shown:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_edit < self.interval:
+            return
+        self._last_edit = now
+        self._shown = text
+        try:
+            await self.bot.edit_message_text(
+                chat_id=self.chat_id,
+                message_id=self.message_id,
+                text=text,
+                parse_mode=self.parse_mode,
+            )
+            self.edits += 1
+        except Exception as e:
+            logger.debug(f"Progress edit of message {self.message_id} failed: {e}")
 
 
 # --- Conversation State Constants ---
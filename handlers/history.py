@@ -3,54 +3,48 @@
 import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from sqlalchemy import select, desc
-from database import AsyncSessionLocal, WorkoutLog
+from database import AsyncSessionLocal, WorkoutSession
+from queries import session_summary_query, session_logs_query
 
 
-async def history(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    two_weeks_ago = datetime.datetime.now() - datetime.timedelta(days=14)
-
+async def _recent_summaries(user_id: int):
+    """Rollup rows for the last 2 weeks; one row per session."""
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    two_weeks_ago = today - datetime.timedelta(days=14)
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(WorkoutLog)
-            .where(WorkoutLog.user_id == user_id)
-            .where(WorkoutLog.timestamp >= two_weeks_ago)
-            .order_by(desc(WorkoutLog.timestamp))
-        )
-        logs = result.scalars().all()
-
-    if not logs:
-        await update.message.reply_text(
-            "No workouts in the last 2 weeks. Time to get moving! 💪"
-        )
-        return
+        result = await session.execute(session_summary_query(user_id, two_weeks_ago))
+        return result.all()
 
-    workouts_by_date = {}
-    for log in logs:
-        date_key = log.timestamp.date()
-        template_name = log.template_name or "Unknown"
-        key = (date_key, template_name)
-        if key not in workouts_by_date:
-            workouts_by_date[key] = []
-        workouts_by_date[key].append(log)
 
+def _history_keyboard(summaries):
     keyboard = []
-    for date, template_name in sorted(workouts_by_date.keys(), reverse=True):
-        log_count = len(workouts_by_date[(date, template_name)])
-        date_str = date.strftime("%b %d, %Y")
-        callback_data = f"hist_{date.isoformat()}_{template_name}"
+    for summary in summaries:
+        date_str = summary.day.strftime("%b %d, %Y")
+        template_name = summary.template_name or "Unknown"
         keyboard.append(
             [
                 InlineKeyboardButton(
-                    f"📅 {date_str} - {template_name} ({log_count} exercises)",
-                    callback_data=callback_data,
+                    f"📅 {date_str} - {template_name} ({summary.exercise_count} exercises)",
+                    callback_data=f"hist_{summary.session_id}",
                 )
             ]
         )
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    summaries = await _recent_summaries(update.effective_user.id)
+
+    if not summaries:
+        await update.message.reply_text(
+            "No workouts in the last 2 weeks. Time to get moving! 💪"
+        )
+        return
 
     text = "🏋️ Your workouts from the last 2 weeks:"
-    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await update.message.reply_text(
+        text, reply_markup=_history_keyboard(summaries)
+    )
 
 
 async def history_detail_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -65,51 +59,29 @@ async def history_detail_callback(update: Update, context: ContextTypes.DEFAULT_
     if not data.startswith("hist_"):
         return
 
-    parts = data.replace("hist_", "").split("_", 1)
-    date_str = parts[0]
-    template_name = parts[1] if len(parts) > 1 else ""
-    date = datetime.datetime.fromisoformat(date_str).date()
+    try:
+        session_id = int(data.replace("hist_", ""))
+    except ValueError:
+        await query.edit_message_text("This workout is no longer available.")
+        return
     user_id = update.effective_user.id
 
-    next_day = date + datetime.timedelta(days=1)
-
     async with AsyncSessionLocal() as session:
-        if template_name:
-            result = await session.execute(
-                select(WorkoutLog)
-                .where(WorkoutLog.user_id == user_id)
-                .where(
-                    WorkoutLog.timestamp
-                    >= datetime.datetime.combine(date, datetime.datetime.min.time())
-                )
-                .where(
-                    WorkoutLog.timestamp
-                    < datetime.datetime.combine(next_day, datetime.datetime.min.time())
-                )
-                .where(WorkoutLog.template_name == template_name)
-            )
-        else:
-            result = await session.execute(
-                select(WorkoutLog)
-                .where(WorkoutLog.user_id == user_id)
-                .where(
-                    WorkoutLog.timestamp
-                    >= datetime.datetime.combine(date, datetime.datetime.min.time())
-                )
-                .where(
-                    WorkoutLog.timestamp
-                    < datetime.datetime.combine(next_day, datetime.datetime.min.time())
-                )
-            )
+        workout = await session.get(WorkoutSession, session_id)
+        if workout is None or workout.user_id != user_id:
+            await query.edit_message_text("This workout is no longer available.")
+            return
+        result = await session.execute(session_logs_query(session_id))
         logs = result.scalars().all()
 
+    date = workout.started_at.date()
     if not logs:
         await query.edit_message_text(f"No exercises logged on {date}.")
         return
 
     log_text = f"💪 Workout on {date.strftime('%B %d, %Y')}"
-    if template_name:
-        log_text += f" - {template_name}"
+    if workout.template_name:
+        log_text += f" - {workout.template_name}"
     log_text += ":\n\n"
 
     exercise_summary = {}
@@ -141,48 +113,15 @@ async def history_back_callback(update: Update, context: ContextTypes.DEFAULT_TY
     if data != "hist_back":
         return
 
-    user_id = update.effective_user.id
-    two_weeks_ago = datetime.datetime.now() - datetime.timedelta(days=14)
+    summaries = await _recent_summaries(update.effective_user.id)
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(WorkoutLog)
-            .where(WorkoutLog.user_id == user_id)
-            .where(WorkoutLog.timestamp >= two_weeks_ago)
-            .order_by(desc(WorkoutLog.timestamp))
-        )
-        logs = result.scalars().all()
-
-    if not logs:
+    if not summaries:
         await query.edit_message_text(
             "No workouts in the last 2 weeks. Time to get moving! 💪"
         )
         return
 
-    workouts_by_date = {}
-    for log in logs:
-        date_key = log.timestamp.date()
-        template_name = log.template_name or "Unknown"
-        key = (date_key, template_name)
-        if key not in workouts_by_date:
-            workouts_by_date[key] = []
-        workouts_by_date[key].append(log)
-
-    keyboard = []
-    for date, template_name in sorted(workouts_by_date.keys(), reverse=True):
-        log_count = len(workouts_by_date[(date, template_name)])
-        date_str = date.strftime("%b %d, %Y")
-        callback_data = f"hist_{date.isoformat()}_{template_name}"
-        keyboard.append(
-            [
-                InlineKeyboardButton(
-                    f"📅 {date_str} - {template_name} ({log_count} exercises)",
-                    callback_data=callback_data,
-                )
-            ]
-        )
-
     await query.edit_message_text(
         "🏋️ Your workouts from the last 2 weeks:",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_history_keyboard(summaries),
     )
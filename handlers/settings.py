@@ -5,6 +5,7 @@ from telegram.ext import ContextTypes, ConversationHandler
 from sqlalchemy import select
 from database import AsyncSessionLocal, User
 import handlers.common as common
+from handlers.common import message_tracker
 
 
 async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -47,14 +48,9 @@ async def settings_rest(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.edit_message_text(
         "Enter your default rest time in seconds (e.g., 90 for 1:30, 180 for 3m):"
     )
-    if common.last_msg_id:
-        try:
-            await context.bot.delete_message(
-                chat_id=query.message.chat_id, message_id=common.last_msg_id
-            )
-        except Exception as e:
-            print(f"Could not delete: {e}")
-    common.last_msg_id = query.message.message_id
+    await message_tracker.replace_last(
+        context.bot, query.message.chat_id, query.message.message_id
+    )
     return common.SETTINGS_REST_CONFIRM
 
 
@@ -103,12 +99,7 @@ async def settings_rest_confirm(update: Update, context: ContextTypes.DEFAULT_TY
     await update.message.reply_text(
         f"✅ Default rest time updated to {rest_text}!",
     )
-    if common.last_msg_id:
-        try:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-        except Exception as e:
-            print(f"Could not delete: {e}")
-    common.last_msg_id = update.message.message_id
+    await message_tracker.replace_last(
+        context.bot, update.message.chat_id, update.message.message_id
+    )
     return ConversationHandler.END
@@ -4,8 +4,7 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from sqlalchemy import select
 from database import AsyncSessionLocal, User
-from handlers.common import last_msg_id as _last_msg_id
-import handlers.common as common
+from handlers.common import message_tracker
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -44,11 +43,6 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         "**What are we smashing today?** 👇"
     )
-    try:
-        if common.last_msg_id:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-    except Exception as e:
-        print(f"Could not delete: {e}")
-    common.last_msg_id = update.message.message_id
+    await message_tracker.replace_last(
+        context.bot, update.message.chat_id, update.message.message_id
+    )
@@ -1,14 +1,15 @@
 """Handlers for manual template creation, editing, and deletion."""
 
-import json
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
 from database import AsyncSessionLocal, Template, TemplateExercise
-import handlers.common as common
+from ai_jobs import ai_jobs
+from catalog import exercise_catalog
 from handlers.common import (
+    message_tracker,
     logger,
     parse_exercise_details,
     TEMPLATE_NAME,
@@ -32,14 +33,9 @@ async def create_template_start(update: Update, context: ContextTypes.DEFAULT_TY
     await update.message.reply_text(
         "Let's create a workout template. What specific name would you like to give this routine? (e.g., 'Leg Day')"
     )
-    if common.last_msg_id:
-        try:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-        except Exception as e:
-            print(f"Could not delete: {e}")
-    common.last_msg_id = update.message.message_id
+    await message_tracker.replace_last(
+        context.bot, update.message.chat_id, update.message.message_id
+    )
     return TEMPLATE_NAME
 
 
@@ -50,13 +46,7 @@ async def template_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["editing_exercises"] = []
     context.user_data["editing_template_id"] = None
 
-    if common.last_msg_id:
-        try:
-            await context.bot.delete_message(
-                chat_id=update.effective_chat.id, message_id=common.last_msg_id
-            )
-        except Exception:
-            pass
+    await message_tracker.delete_last(context.bot, update.effective_chat.id)
     try:
         await context.bot.delete_message(
             chat_id=update.effective_chat.id, message_id=update.message.message_id
@@ -77,20 +67,14 @@ async def exercise_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Enter sets config for {text} (e.g., '3 60x5 65x4 70x3'):\n"
         f"Format: <num_sets> <weight>x<reps> <weight>x<reps> ..."
     )
-    try:
-        if common.last_msg_id:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-    except Exception as e:
-        print(f"Could not delete: {e}")
+    await message_tracker.delete_last(context.bot, update.message.chat_id)
     try:
         await context.bot.delete_message(
             chat_id=update.message.chat_id, message_id=update.message.message_id
         )
     except Exception as e:
         print(f"Could not delete user message: {e}")
-    common.last_msg_id = sent.message_id
+    message_tracker.track(update.message.chat_id, sent.message_id)
     return EXERCISE_DETAILS
 
 
@@ -103,20 +87,14 @@ async def exercise_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     num_sets, sets_config, error = parse_exercise_details(text)
     if error:
         sent = await update.message.reply_text(error)
-        try:
-            if common.last_msg_id:
-                await context.bot.delete_message(
-                    chat_id=update.message.chat_id, message_id=common.last_msg_id
-                )
-        except Exception:
-            pass
+        await message_tracker.delete_last(context.bot, update.message.chat_id)
         try:
             await context.bot.delete_message(
                 chat_id=update.message.chat_id, message_id=update.message.message_id
             )
         except Exception:
             pass
-        common.last_msg_id = sent.message_id
+        message_tracker.track(update.message.chat_id, sent.message_id)
         return EXERCISE_DETAILS
 
     exercises = context.user_data.get("exercises", [])
@@ -133,20 +111,14 @@ async def exercise_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"✅ {context.user_data['current_exercise_name']} added with {num_sets} sets.\n"
         f"Enter next exercise name (or /done to finish):"
     )
-    try:
-        if common.last_msg_id:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-    except Exception:
-        pass
+    await message_tracker.delete_last(context.bot, update.message.chat_id)
     try:
         await context.bot.delete_message(
             chat_id=update.message.chat_id, message_id=update.message.message_id
         )
     except Exception:
         pass
-    common.last_msg_id = sent.message_id
+    message_tracker.track(update.message.chat_id, sent.message_id)
     return EXERCISE_NAME
 
 
@@ -164,6 +136,8 @@ async def save_template(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data.clear()
         return ConversationHandler.END
 
+    exercise_ids = await exercise_catalog.resolve([ex["name"] for ex in exercises_data])
+
     async with AsyncSessionLocal() as session:
         template = Template(name=name, user_id=user_id)
         session.add(template)
@@ -173,6 +147,7 @@ async def save_template(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ex = TemplateExercise(
                 template_id=template.id,
                 exercise_name=ex_data["name"],
+                exercise_id=exercise_ids[ex_data["name"]],
                 default_sets=ex_data["sets"],
                 default_weight=ex_data["sets_config"][0]["weight"]
                 if ex_data.get("sets_config")
@@ -180,7 +155,7 @@ async def save_template(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 default_reps=ex_data["sets_config"][0]["reps"]
                 if ex_data.get("sets_config")
                 else 0,
-                sets_config=json.dumps(ex_data.get("sets_config", [])),
+                sets_config=ex_data.get("sets_config", []),
                 order=idx,
             )
             session.add(ex)
@@ -203,40 +178,31 @@ async def save_template(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "Error saving template. Please try again."
             )
 
-    try:
-        if common.last_msg_id:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-    except Exception as e:
-        print(f"Could not delete: {e}")
+    await message_tracker.delete_last(context.bot, update.message.chat_id)
     try:
         await context.bot.delete_message(
             chat_id=update.message.chat_id, message_id=update.message.message_id
         )
     except Exception as e:
         print(f"Could not delete user message: {e}")
-    common.last_msg_id = sent.message_id
+    message_tracker.track(update.message.chat_id, sent.message_id)
     context.user_data.clear()
     return ConversationHandler.END
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    sent = await update.message.reply_text("Action canceled.")
-    try:
-        if common.last_msg_id:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-    except Exception as e:
-        print(f"Could not delete: {e}")
+    if ai_jobs.cancel(update.effective_user.id):
+        sent = await update.message.reply_text("Action canceled, AI request stopped.")
+    else:
+        sent = await update.message.reply_text("Action canceled.")
+    await message_tracker.delete_last(context.bot, update.message.chat_id)
     try:
         await context.bot.delete_message(
             chat_id=update.message.chat_id, message_id=update.message.message_id
         )
     except Exception as e:
         print(f"Could not delete user message: {e}")
-    common.last_msg_id = sent.message_id
+    message_tracker.track(update.message.chat_id, sent.message_id)
     context.user_data.clear()
     return ConversationHandler.END
 
@@ -265,17 +231,18 @@ async def done_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # Attempt to edit the last message sent by the bot
-    if common.last_msg_id:
+    last_msg_id = message_tracker.get(update.effective_chat.id)
+    if last_msg_id:
         try:
             sent = await context.bot.edit_message_text(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id, text=text
+                chat_id=update.message.chat_id, message_id=last_msg_id, text=text
             )
             return await show_edited_template(update, context, sent)
         except Exception:
             pass
 
     sent = await update.message.reply_text(text)
-    common.last_msg_id = sent.message_id
+    message_tracker.track(update.effective_chat.id, sent.message_id)
     return await show_edited_template(update, context, sent)
 
 
@@ -333,7 +300,7 @@ async def select_template_to_edit(update: Update, context: ContextTypes.DEFAULT_
             "sets": ex.default_sets,
             "weight": ex.default_weight,
             "reps": ex.default_reps,
-            "sets_config": json.loads(ex.sets_config) if ex.sets_config else None,
+            "sets_config": ex.get_sets_config(),
         }
         for ex in exercises
     ]
@@ -377,7 +344,7 @@ async def handle_edit_exercise_action(
     query = update.callback_query
     await query.answer()
     data = query.data
-    common.last_msg_id = query.message.message_id
+    message_tracker.track(update.effective_chat.id, query.message.message_id)
 
     if data == "etadd":
         await query.edit_message_text("Enter new exercise name:")
@@ -526,13 +493,7 @@ async def edit_exercise_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
         context.user_data.pop("is_template_add", None)
 
         # Cleanup messages
-        if common.last_msg_id:
-            try:
-                await context.bot.delete_message(
-                    chat_id=update.message.chat_id, message_id=common.last_msg_id
-                )
-            except Exception:
-                pass
+        await message_tracker.delete_last(context.bot, update.message.chat_id)
         try:
             await context.bot.delete_message(
                 chat_id=update.message.chat_id, message_id=update.message.message_id
@@ -547,11 +508,12 @@ async def edit_exercise_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
         f"Enter sets config for {text} (e.g., '3 60x5 65x4 70x3'):\n"
         f"Format: <num_sets> <weight>x<reps> <weight>x<reps> ..."
     )
-    if common.last_msg_id:
+    last_msg_id = message_tracker.get(update.effective_chat.id)
+    if last_msg_id:
         try:
             await context.bot.edit_message_text(
                 chat_id=update.effective_chat.id,
-                message_id=common.last_msg_id,
+                message_id=last_msg_id,
                 text=prompt_text,
             )
             return EDIT_EXERCISE_DETAILS
@@ -559,7 +521,7 @@ async def edit_exercise_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
             pass
 
     sent = await update.message.reply_text(prompt_text)
-    common.last_msg_id = sent.message_id
+    message_tracker.track(update.effective_chat.id, sent.message_id)
     return EDIT_EXERCISE_DETAILS
 
 
@@ -576,7 +538,7 @@ async def edit_exercise_details(update: Update, context: ContextTypes.DEFAULT_TY
             "Invalid format. Use: '3 60x5 65x4 70x3'\n"
             "Format: <num_sets> <weight>x<reps> <weight>x<reps> ..."
         )
-        common.last_msg_id = sent.message_id
+        message_tracker.track(update.effective_chat.id, sent.message_id)
         return EDIT_EXERCISE_DETAILS
 
     try:
@@ -587,7 +549,7 @@ async def edit_exercise_details(update: Update, context: ContextTypes.DEFAULT_TY
         sent = await update.message.reply_text(
             "First value must be number of sets (e.g., '3')."
         )
-        common.last_msg_id = sent.message_id
+        message_tracker.track(update.effective_chat.id, sent.message_id)
         return EDIT_EXERCISE_DETAILS
 
     sets_config = []
@@ -605,40 +567,28 @@ async def edit_exercise_details(update: Update, context: ContextTypes.DEFAULT_TY
             sent = await update.message.reply_text(
                 f"Invalid format '{parts[i]}'. Use: '60x5' for 60kg x 5 reps"
             )
-            try:
-                if common.last_msg_id:
-                    await context.bot.delete_message(
-                        chat_id=update.message.chat_id, message_id=common.last_msg_id
-                    )
-            except Exception as e:
-                print(f"Could not delete: {e}")
+            await message_tracker.delete_last(context.bot, update.message.chat_id)
             try:
                 await context.bot.delete_message(
                     chat_id=update.message.chat_id, message_id=update.message.message_id
                 )
             except Exception as e:
                 print(f"Could not delete user message: {e}")
-            common.last_msg_id = sent.message_id
+            message_tracker.track(update.message.chat_id, sent.message_id)
             return EDIT_EXERCISE_DETAILS
 
     if len(sets_config) != num_sets:
         sent = await update.message.reply_text(
             f"Mismatch: You said {num_sets} sets but provided {len(sets_config)} weight x reps values."
         )
-        try:
-            if common.last_msg_id:
-                await context.bot.delete_message(
-                    chat_id=update.message.chat_id, message_id=common.last_msg_id
-                )
-        except Exception as e:
-            print(f"Could not delete: {e}")
+        await message_tracker.delete_last(context.bot, update.message.chat_id)
         try:
             await context.bot.delete_message(
                 chat_id=update.message.chat_id, message_id=update.message.message_id
             )
         except Exception as e:
             print(f"Could not delete user message: {e}")
-        common.last_msg_id = sent.message_id
+        message_tracker.track(update.message.chat_id, sent.message_id)
         return EDIT_EXERCISE_DETAILS
 
     exercise_idx = context.user_data.get("editing_exercise_idx")
@@ -674,12 +624,7 @@ async def edit_exercise_details(update: Update, context: ContextTypes.DEFAULT_TY
 async def edit_template_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle template renaming."""
     context.user_data["editing_template_name"] = update.message.text.strip()
-    try:
-        if common.last_msg_id:
-            # Will be edited by show_edited_template
-            pass
-    except Exception as e:
-        print(f"Could not delete: {e}")
+    # The tracked message is edited by show_edited_template
     return await show_edited_template(update, context, None)
 
 
@@ -734,11 +679,12 @@ async def show_edited_template(update, context, message=None):
         except Exception:
             pass
 
-    if common.last_msg_id:
+    last_msg_id = message_tracker.get(update.effective_chat.id)
+    if last_msg_id:
         try:
             await context.bot.edit_message_text(
                 chat_id=update.effective_chat.id,
-                message_id=common.last_msg_id,
+                message_id=last_msg_id,
                 text=text,
                 parse_mode="Markdown",
                 reply_markup=InlineKeyboardMarkup(keyboard),
@@ -750,7 +696,7 @@ async def show_edited_template(update, context, message=None):
     sent = await update.message.reply_text(
         text, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(keyboard)
     )
-    common.last_msg_id = sent.message_id
+    message_tracker.track(update.effective_chat.id, sent.message_id)
     return EDIT_TEMPLATE_EXERCISE
 
 
@@ -808,7 +754,7 @@ async def show_template_exercise_sets(update, context, message=None):
         sent = await update.message.reply_text(
             text, parse_mode="Markdown", reply_markup=keyboard
         )
-        common.last_msg_id = sent.message_id
+        message_tracker.track(update.effective_chat.id, sent.message_id)
 
     return EDIT_TEMPLATE_EXERCISE
 
@@ -853,10 +799,14 @@ async def save_edited_template(update: Update, context: ContextTypes.DEFAULT_TYP
                 session.add(template)
                 await session.flush()
 
+            exercise_ids = await exercise_catalog.resolve(
+                [ex["name"] for ex in exercises]
+            )
             for idx, ex_data in enumerate(exercises):
                 ex = TemplateExercise(
                     template_id=template.id,
                     exercise_name=ex_data["name"],
+                    exercise_id=exercise_ids[ex_data["name"]],
                     default_sets=ex_data["sets"],
                     default_weight=ex_data["sets_config"][0]["weight"]
                     if ex_data.get("sets_config")
@@ -864,7 +814,7 @@ async def save_edited_template(update: Update, context: ContextTypes.DEFAULT_TYP
                     default_reps=ex_data["sets_config"][0]["reps"]
                     if ex_data.get("sets_config")
                     else 0,
-                    sets_config=json.dumps(ex_data.get("sets_config", [])),
+                    sets_config=ex_data.get("sets_config", []),
                     order=idx,
                 )
                 session.add(ex)
@@ -895,20 +845,14 @@ async def cancel_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel template editing."""
     context.user_data.clear()
     sent = await update.message.reply_text("Template editing canceled.")
-    try:
-        if common.last_msg_id:
-            await context.bot.delete_message(
-                chat_id=update.message.chat_id, message_id=common.last_msg_id
-            )
-    except Exception as e:
-        print(f"Could not delete: {e}")
+    await message_tracker.delete_last(context.bot, update.message.chat_id)
     try:
         await context.bot.delete_message(
             chat_id=update.message.chat_id, message_id=update.message.message_id
         )
     except Exception as e:
         print(f"Could not delete user message: {e}")
-    common.last_msg_id = sent.message_id
+    message_tracker.track(update.message.chat_id, sent.message_id)
     return ConversationHandler.END
 
 
@@ -1,11 +1,19 @@
 """Handlers for live workout logging sessions."""
 
 import asyncio
+import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from sqlalchemy import select, desc
+from sqlalchemy import select
 from sqlalchemy.orm import selectinload
-from database import AsyncSessionLocal, Template, WorkoutLog
+from database import AsyncSessionLocal, Template, WorkoutSession
+from queries import (
+    get_last_performance,
+    get_last_performances,
+    finalize_workout_session,
+)
+from journal import set_journal
+from catalog import exercise_catalog
 import handlers.common as common
 from handlers.common import (
     logger,
@@ -21,33 +29,99 @@ from handlers.template import (
     show_template_exercise_sets,
     handle_template_set_finish,
 )
+from handlers.workout_state import WorkoutState, ExerciseState
+
+
+def _journal_set(user_id, workout: WorkoutState, exercise: ExerciseState, set_num, weight, reps):
+    """Record a logged set in the write-behind journal."""
+    set_journal.record(
+        user_id,
+        workout.session_id,
+        exercise.id,
+        set_num,
+        {
+            "user_id": user_id,
+            "session_id": workout.session_id,
+            "template_name": workout.template_name,
+            "exercise_name": exercise.name,
+            "exercise_id": exercise.catalog_id,
+            "sets": 1,
+            "weight": weight,
+            "reps": reps,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc),
+        },
+    )
+
+
+async def _finish_workout(user_id, workout: WorkoutState | None, save_pending=True):
+    """Commit (or drop) the remaining journaled sets and close the session."""
+    if workout is None:
+        return
+    if save_pending:
+        set_journal.commit(user_id, workout.session_id)
+        for exercise in workout.active():
+            workout.tally(exercise)
+    else:
+        set_journal.discard(user_id, workout.session_id)
+    if workout.session_id is not None:
+        await finalize_workout_session(
+            workout.session_id, workout.set_count, workout.total_volume
+        )
+
+
+def _pending_exercise(context) -> ExerciseState | None:
+    """The exercise whose set is being entered, if it is still in the workout."""
+    workout = context.user_data["current_workout"]
+    return workout.get(context.user_data.get("pending_exercise_id"))
+
+
+def _sets_text(exercise: ExerciseState) -> str:
+    if exercise.has_plan:
+        return ", ".join(f"{weight}x{reps}" for weight, reps in exercise.plan())
+    return f"{exercise.default_sets}x{exercise.default_weight}kgx{exercise.default_reps}"
+
+
+def _continue_keyboard(workout: WorkoutState):
+    """Exercise list shown after skipping/removing or going back."""
+    keyboard = []
+    for idx, ex in enumerate(workout.active()):
+        keyboard.append(
+            [
+                InlineKeyboardButton(
+                    f"{idx + 1}. {ex.name} ({ex.default_sets} sets x {ex.default_weight}kg x {ex.default_reps} reps)",
+                    callback_data=f"ex_{ex.id}",
+                ),
+                InlineKeyboardButton("❌", callback_data=f"remove_exercise_{ex.id}"),
+            ]
+        )
+    keyboard.append(
+        [InlineKeyboardButton("🛑 End Workout", callback_data="end_workout")]
+    )
+    keyboard.append(
+        [InlineKeyboardButton("➕ Add Exercise", callback_data="add_exercise")]
+    )
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def _exercise_gone(message, workout: WorkoutState, edit=True):
+    """Answer a stale button or input for an exercise completed/removed meanwhile."""
+    send = message.edit_text if edit else message.reply_text
+    await send(
+        "That exercise is no longer part of this workout.\n"
+        "Select an exercise to continue:",
+        reply_markup=_continue_keyboard(workout),
+    )
+    return WORKOUT_EXERCISE_SELECT
 
 
 async def end_workout_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle end_workout callback from any state."""
     query = update.callback_query
     await query.answer()
-    workout_data = context.user_data.get("current_workout", {})
-    template_name = workout_data.get("template_name", "")
-    logged_sets = workout_data.get("logged_sets", {})
+    workout = context.user_data.get("current_workout")
     user_id = update.effective_user.id
 
-    for exercise_idx, sets in logged_sets.items():
-        ex_data = workout_data["exercises"][exercise_idx]
-        for log_data in sets:
-            if log_data.get("weight") is None or log_data.get("reps") is None:
-                continue
-            log = WorkoutLog(
-                user_id=user_id,
-                template_name=template_name,
-                exercise_name=ex_data["name"],
-                sets=1,
-                weight=log_data["weight"],
-                reps=log_data["reps"],
-            )
-            async with AsyncSessionLocal() as session:
-                session.add(log)
-                await session.commit()
+    await _finish_workout(user_id, workout)
 
     context.user_data.pop("current_workout", None)
     context.user_data.pop("selected_exercise", None)
@@ -68,6 +142,9 @@ async def start_workout(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if context.user_data.get("current_workout"):
         logger.info(f"Clearing stale workout data for user {user_id}")
+        await _finish_workout(
+            user_id, context.user_data["current_workout"], save_pending=False
+        )
         context.user_data.pop("current_workout", None)
         context.user_data.pop("selected_exercise", None)
         context.user_data.pop("exercise_history", None)
@@ -113,41 +190,50 @@ async def select_template(update: Update, context: ContextTypes.DEFAULT_TYPE):
         exercises = sorted(template.exercises, key=lambda x: x.order)
         logger.info(f"Template {template.name} has {len(exercises)} exercises")
 
-    context.user_data["current_workout"] = {
-        "template_name": template.name,
-        "exercises": [
-            {
-                "name": ex.exercise_name,
-                "default_sets": ex.default_sets,
-                "default_weight": ex.default_weight,
-                "default_reps": ex.default_reps,
-                "sets_config": ex.get_sets_config()
-                if hasattr(ex, "get_sets_config")
-                else None,
-            }
-            for ex in exercises
-        ],
-        "current_index": 0,
-        "logged_sets": {},  # {exercise_idx: [{weight, reps, timestamp}]}
-    }
+        # One up-front lookup instead of a query per exercise transition
+        previous = await get_last_performances(
+            update.effective_user.id,
+            [ex.exercise_name for ex in exercises],
+            session=session,
+        )
+
+        workout_session = WorkoutSession(
+            user_id=update.effective_user.id, template_name=template.name
+        )
+        session.add(workout_session)
+        await session.commit()
+
+    workout = WorkoutState(
+        session_id=workout_session.id,
+        template_name=template.name,
+        previous=previous,
+    )
+    for ex in exercises:
+        workout.add_exercise(
+            ex.exercise_name,
+            ex.exercise_id
+            if ex.exercise_id is not None
+            else exercise_catalog.match(ex.exercise_name),
+            ex.default_sets,
+            ex.default_weight,
+            ex.default_reps,
+            ex.get_sets_config() if hasattr(ex, "get_sets_config") else None,
+        )
+    workout.current_id = workout.order[0] if workout.order else None
+    context.user_data["current_workout"] = workout
 
     # Show all exercises for selection
     keyboard = []
-    for idx, ex in enumerate(context.user_data["current_workout"]["exercises"]):
-        sets_config = ex.get("sets_config")
-        if sets_config:
-            sets_text = ", ".join([f"{s['weight']}x{s['reps']}" for s in sets_config])
-            volume = sum([s["weight"] * s["reps"] for s in sets_config])
+    for ex in workout.active():
+        if ex.has_plan:
+            volume = sum(weight * reps for weight, reps in ex.plan())
         else:
-            sets_text = (
-                f"{ex['default_sets']}x{ex['default_weight']}kgx{ex['default_reps']}"
-            )
-            volume = ex["default_sets"] * ex["default_weight"] * ex["default_reps"]
+            volume = ex.default_sets * ex.default_weight * ex.default_reps
         keyboard.append(
             [
                 InlineKeyboardButton(
-                    f"{ex['name']} ({sets_text}) - {volume}kg vol",
-                    callback_data=f"ex_{idx}",
+                    f"{ex.name} ({_sets_text(ex)}) - {volume}kg vol",
+                    callback_data=f"ex_{ex.id}",
                 ),
             ]
         )
@@ -166,14 +252,17 @@ async def select_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    exercise_idx = int(query.data.split("_")[1])
-    context.user_data["current_workout"]["current_index"] = exercise_idx
+    exercise_id = int(query.data.split("_")[1])
+    workout = context.user_data["current_workout"]
+    if workout.get(exercise_id) is None:
+        return await _exercise_gone(query.message, workout)
+    workout.current_id = exercise_id
 
     await process_next_exercise(query.message, context, query.from_user.id)
     return WORKOUT_EXERCISE_CONFIRM
 
 
-def build_set_keyboard(exercise_idx, ex_data, logged_sets, context, is_completed=False):
+def build_set_keyboard(exercise: ExerciseState, context, is_completed=False):
     """Build keyboard with individual set buttons."""
     rest_seconds = context.user_data.get("default_rest_seconds", 300)
     rest_seconds = 300 if rest_seconds is None else rest_seconds
@@ -185,39 +274,25 @@ def build_set_keyboard(exercise_idx, ex_data, logged_sets, context, is_completed
         rest_text = f"{minutes}m"
 
     keyboard = []
-    total_sets = ex_data["default_sets"]
-    sets_config = ex_data.get("sets_config")
-
-    for set_num in range(1, total_sets + 1):
-        if sets_config and set_num <= len(sets_config):
-            default_weight = sets_config[set_num - 1]["weight"]
-            default_reps = sets_config[set_num - 1]["reps"]
-        else:
-            default_weight = ex_data["default_weight"]
-            default_reps = ex_data["default_reps"]
-
-        if set_num <= len(logged_sets):
-            logged = logged_sets[set_num - 1]
-            if logged.get("weight") is not None and logged.get("reps") is not None:
-                button_text = (
-                    f"Set {set_num}: {logged['weight']}kg x {logged['reps']} ✅"
-                )
-                callback_data = f"edit_set_{exercise_idx}_{set_num}"
-            else:
-                button_text = f"Set {set_num}: {default_weight}kg x {default_reps}"
-                callback_data = f"log_set_{exercise_idx}_{set_num}"
+    for set_num in range(1, exercise.default_sets + 1):
+        logged = exercise.logged(set_num)
+        if logged is not None:
+            weight, reps = logged
+            button_text = f"Set {set_num}: {weight}kg x {reps} ✅"
+            callback_data = f"edit_set_{exercise.id}_{set_num}"
         else:
+            default_weight, default_reps = exercise.planned(set_num)
             button_text = f"Set {set_num}: {default_weight}kg x {default_reps}"
-            callback_data = f"log_set_{exercise_idx}_{set_num}"
+            callback_data = f"log_set_{exercise.id}_{set_num}"
         keyboard.append(
             [InlineKeyboardButton(button_text, callback_data=callback_data)]
         )
 
-    if logged_sets:
+    if exercise.logged_count:
         keyboard.append(
             [
                 InlineKeyboardButton(
-                    "✅ Complete Exercise", callback_data=f"complete_{exercise_idx}"
+                    "✅ Complete Exercise", callback_data=f"complete_{exercise.id}"
                 )
             ]
         )
@@ -234,46 +309,40 @@ def build_set_keyboard(exercise_idx, ex_data, logged_sets, context, is_completed
 
 
 async def process_next_exercise(message, context, user_id):
-    workout_data = context.user_data["current_workout"]
-    idx = workout_data["current_index"]
+    workout = context.user_data["current_workout"]
+    active = workout.active()
+    exercise = workout.get(workout.current_id)
 
-    logger.info(f"process_next_exercise: index={idx}/{len(workout_data['exercises'])}")
+    logger.info(f"process_next_exercise: exercise={workout.current_id}, {len(active)} left")
 
-    if idx >= len(workout_data["exercises"]):
+    if exercise is None:
         context.user_data.clear()
         await message.reply_text("Workout complete! Great job! 🎉")
         return ConversationHandler.END
 
-    ex_data = workout_data["exercises"][idx]
-    logged_sets = workout_data["logged_sets"].get(idx, [])
-
     prev_log_text = "No history"
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(WorkoutLog)
-            .where(
-                WorkoutLog.user_id == user_id,
-                WorkoutLog.exercise_name == ex_data["name"],
-            )
-            .order_by(desc(WorkoutLog.timestamp))
-            .limit(1)
-        )
-        prev_log = result.scalar_one_or_none()
-        if prev_log:
-            prev_log_text = f"{prev_log.sets}s x {prev_log.weight}kg x {prev_log.reps}"
+    if exercise.name in workout.previous:
+        prev_log = workout.previous[exercise.name]
+    else:
+        # Exercises added mid-workout weren't part of the prefetch
+        prev_log = await get_last_performance(user_id, exercise.name)
+        workout.previous[exercise.name] = prev_log
+    if prev_log:
+        sets, weight, reps = prev_log
+        prev_log_text = f"{sets}s x {weight}kg x {reps}"
 
-    completed_count = len(logged_sets)
-    is_completed = completed_count >= ex_data["default_sets"]
+    completed_count = exercise.logged_count
+    is_completed = completed_count >= exercise.default_sets
 
     text = (
-        f"**Exercise {idx + 1}/{len(workout_data['exercises'])}: {ex_data['name']}**\n"
-        f"Progress: {completed_count}/{ex_data['default_sets']} sets completed\n"
+        f"**Exercise {active.index(exercise) + 1}/{len(active)}: {exercise.name}**\n"
+        f"Progress: {completed_count}/{exercise.default_sets} sets completed\n"
         f"Previous: {prev_log_text}"
     )
 
-    keyboard = build_set_keyboard(idx, ex_data, logged_sets, context, is_completed)
+    keyboard = build_set_keyboard(exercise, context, is_completed)
 
-    logger.info(f"Sending exercise keyboard for {ex_data['name']}")
+    logger.info(f"Sending exercise keyboard for {exercise.name}")
 
     if hasattr(message, "edit_text"):
         try:
@@ -346,72 +415,41 @@ async def handle_exercise_action(update: Update, context: ContextTypes.DEFAULT_T
             user_data = context.application.user_data[user_id]
         user_data.pop("rest_job", None)
         logger.info(f"Skip handler triggered for user {user_id}")
-        workout_data = user_data.get("current_workout")
-        if (
-            not workout_data
-            or "exercises" not in workout_data
-            or not workout_data["exercises"]
-        ):
+        workout = user_data.get("current_workout")
+        if not workout or workout.get(workout.current_id) is None:
             logger.info(f"Skip aborted: no workout data")
             return WORKOUT_EXERCISE_CONFIRM
-        logger.info(f"Skipping exercise at index {workout_data['current_index']}")
-        current_idx = workout_data["current_index"]
-        workout_data["exercises"].pop(current_idx)
-        if "logged_sets" in workout_data:
-            workout_data["logged_sets"].pop(current_idx, None)
-            new_logged_sets = {}
-            for old_idx, sets in workout_data["logged_sets"].items():
-                if old_idx < current_idx:
-                    new_logged_sets[old_idx] = sets
-                elif old_idx > current_idx:
-                    new_logged_sets[old_idx - 1] = sets
-            workout_data["logged_sets"] = new_logged_sets
-        num_exercises = len(workout_data["exercises"])
-        if num_exercises == 0:
+        logger.info(f"Skipping exercise {workout.current_id}")
+        skipped = workout.drop(workout.current_id)
+        set_journal.discard(user_id, workout.session_id, skipped.id)
+        workout.current_id = workout.next_active(skipped.id)
+        if workout.current_id is None:
+            await _finish_workout(user_id, workout)
             context.user_data.clear()
             await query.message.edit_text("Workout complete! Great job! 🎉")
             return ConversationHandler.END
-        if current_idx >= num_exercises:
-            workout_data["current_index"] = num_exercises - 1
-        else:
-            workout_data["current_index"] = max(0, current_idx - 1)
-        keyboard = []
-        for idx, ex in enumerate(workout_data["exercises"]):
-            keyboard.append(
-                [
-                    InlineKeyboardButton(
-                        f"{idx + 1}. {ex['name']} ({ex['default_sets']} sets x {ex['default_weight']}kg x {ex['default_reps']} reps)",
-                        callback_data=f"ex_{idx}",
-                    ),
-                    InlineKeyboardButton("❌", callback_data=f"remove_exercise_{idx}"),
-                ]
-            )
-        keyboard.append(
-            [InlineKeyboardButton("🛑 End Workout", callback_data="end_workout")]
-        )
-        keyboard.append(
-            [InlineKeyboardButton("➕ Add Exercise", callback_data="add_exercise")]
-        )
         await query.message.edit_text(
             "Select an exercise to continue:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=_continue_keyboard(workout),
         )
         return WORKOUT_EXERCISE_SELECT
 
     if data.startswith("log_set_"):
         context.user_data.pop("rest_job", None)
         parts = data.split("_")
-        exercise_idx = int(parts[2])
+        exercise_id = int(parts[2])
         set_num = int(parts[3])
-        context.user_data["pending_exercise_idx"] = exercise_idx
+        workout = context.user_data["current_workout"]
+        exercise = workout.get(exercise_id)
+        if exercise is None:
+            return await _exercise_gone(query.message, workout)
+        context.user_data["pending_exercise_id"] = exercise_id
         context.user_data["pending_set_num"] = set_num
         context.user_data["pending_weight"] = None
         context.user_data["pending_reps"] = None
 
-        workout_data = context.user_data.get("current_workout", {})
-        ex_data = workout_data["exercises"][exercise_idx]
-        default_weight = ex_data["default_weight"]
-        default_reps = ex_data["default_reps"]
+        default_weight = exercise.default_weight
+        default_reps = exercise.default_reps
 
         context.user_data["default_weight"] = default_weight
         context.user_data["default_reps"] = default_reps
@@ -443,43 +481,35 @@ async def handle_exercise_action(update: Update, context: ContextTypes.DEFAULT_T
             reps = context.user_data.get("pending_reps", 0)
             return await handle_template_set_finish(update, context, weight, reps)
 
-        exercise_idx = context.user_data.get("pending_exercise_idx", 0)
         set_num = context.user_data.get("pending_set_num", 1)
         default_weight = context.user_data.get("default_weight", 0)
         default_reps = context.user_data.get("default_reps", 0)
 
-        workout_data = context.user_data.get("current_workout", {})
-        if "logged_sets" not in workout_data:
-            workout_data["logged_sets"] = {}
-        if exercise_idx not in workout_data["logged_sets"]:
-            workout_data["logged_sets"][exercise_idx] = []
-
-        logged_sets = workout_data["logged_sets"][exercise_idx]
-        while len(logged_sets) < set_num:
-            logged_sets.append({"weight": None, "reps": None})
-
-        logged_sets[set_num - 1] = {"weight": default_weight, "reps": default_reps}
-
-        ex_data = workout_data["exercises"][exercise_idx]
-        completed_count = len(logged_sets)
+        workout = context.user_data["current_workout"]
+        exercise = _pending_exercise(context)
+        if exercise is None:
+            return await _exercise_gone(query.message, workout)
+        exercise.log(set_num, default_weight, default_reps)
+        _journal_set(
+            user_id, workout, exercise, set_num, default_weight, default_reps
+        )
+        completed_count = exercise.logged_count
 
         context.user_data.pop("pending_weight", None)
         context.user_data.pop("pending_reps", None)
-        context.user_data.pop("pending_exercise_idx", None)
+        context.user_data.pop("pending_exercise_id", None)
         context.user_data.pop("pending_set_num", None)
         context.user_data.pop("default_weight", None)
         context.user_data.pop("default_reps", None)
 
         await query.message.edit_text(
             f"Set {set_num} logged: {default_weight}kg x {default_reps} reps\n\n"
-            f"Progress: {completed_count}/{ex_data['default_sets']} sets completed",
+            f"Progress: {completed_count}/{exercise.default_sets} sets completed",
             parse_mode="Markdown",
             reply_markup=build_set_keyboard(
-                exercise_idx,
-                ex_data,
-                logged_sets,
+                exercise,
                 context,
-                completed_count >= ex_data["default_sets"],
+                completed_count >= exercise.default_sets,
             ),
         )
         return WORKOUT_EXERCISE_CONFIRM
@@ -491,11 +521,7 @@ async def handle_exercise_action(update: Update, context: ContextTypes.DEFAULT_T
             default_weight = ex_data.get("weight", 0)
             set_num = context.user_data.get("pending_template_set_num", 1)
         else:
-            exercise_idx = context.user_data.get("pending_exercise_idx", 0)
-            ex_data = context.user_data.get("current_workout", {}).get(
-                "exercises", [{}]
-            )[exercise_idx]
-            default_weight = ex_data.get("default_weight", 0)
+            default_weight = context.user_data.get("default_weight", 0)
             set_num = context.user_data.get("pending_set_num", 1)
 
         await query.message.edit_text(
@@ -515,12 +541,8 @@ async def handle_exercise_action(update: Update, context: ContextTypes.DEFAULT_T
             default_reps = ex_data.get("reps", 0)
             default_weight = ex_data.get("weight", 0)
         else:
-            exercise_idx = context.user_data.get("pending_exercise_idx", 0)
-            ex_data = context.user_data.get("current_workout", {}).get(
-                "exercises", [{}]
-            )[exercise_idx]
-            default_reps = ex_data.get("default_reps", 0)
-            default_weight = ex_data.get("default_weight", 0)
+            default_reps = context.user_data.get("default_reps", 0)
+            default_weight = context.user_data.get("default_weight", 0)
 
         pending_weight = context.user_data.get("pending_weight")
 
@@ -541,27 +563,29 @@ async def handle_exercise_action(update: Update, context: ContextTypes.DEFAULT_T
     if data.startswith("edit_set_"):
         context.user_data.pop("rest_job", None)
         parts = data.split("_")
-        exercise_idx = int(parts[2])
+        exercise_id = int(parts[2])
         set_num = int(parts[3])
-        context.user_data["pending_exercise_idx"] = exercise_idx
+        workout = context.user_data["current_workout"]
+        exercise = workout.get(exercise_id)
+        if exercise is None:
+            return await _exercise_gone(query.message, workout)
+        context.user_data["pending_exercise_id"] = exercise_id
         context.user_data["pending_set_num"] = set_num
-        workout_data = context.user_data["current_workout"]
-        ex_data = workout_data["exercises"][exercise_idx]
-        logged_sets = workout_data["logged_sets"].get(exercise_idx, [])
 
-        context.user_data["default_weight"] = ex_data["default_weight"]
-        context.user_data["default_reps"] = ex_data["default_reps"]
+        context.user_data["default_weight"] = exercise.default_weight
+        context.user_data["default_reps"] = exercise.default_reps
 
-        if set_num <= len(logged_sets):
-            existing = logged_sets[set_num - 1]
-            context.user_data["pending_weight"] = existing["weight"]
-            context.user_data["pending_reps"] = existing["reps"]
+        existing = exercise.logged(set_num)
+        if existing is not None:
+            existing_weight, existing_reps = existing
+            context.user_data["pending_weight"] = existing_weight
+            context.user_data["pending_reps"] = existing_reps
             context.user_data["editing_existing"] = True
             edit_keyboard = InlineKeyboardMarkup(
                 [
                     [
                         InlineKeyboardButton(
-                            f"✅ {existing['weight']}kg x {existing['reps']} reps",
+                            f"✅ {existing_weight}kg x {existing_reps} reps",
                             callback_data="use_existing_values",
                         )
                     ],
@@ -581,7 +605,7 @@ async def handle_exercise_action(update: Update, context: ContextTypes.DEFAULT_T
                 [
                     [
                         InlineKeyboardButton(
-                            f"✅ {ex_data['default_weight']}kg x {ex_data['default_reps']} reps",
+                            f"✅ {exercise.default_weight}kg x {exercise.default_reps} reps",
                             callback_data="use_defaults",
                         )
                     ],
@@ -596,21 +620,23 @@ async def handle_exercise_action(update: Update, context: ContextTypes.DEFAULT_T
         return WORKOUT_EXERCISE_INPUT
 
     if data == "use_existing_values":
-        exercise_idx = context.user_data.get("pending_exercise_idx", 0)
         set_num = context.user_data.get("pending_set_num", 1)
         existing_weight = context.user_data.get("pending_weight", 0)
         existing_reps = context.user_data.get("pending_reps", 0)
 
-        workout_data = context.user_data.get("current_workout", {})
-        logged_sets = workout_data["logged_sets"].get(exercise_idx, [])
-        logged_sets[set_num - 1] = {"weight": existing_weight, "reps": existing_reps}
-
-        ex_data = workout_data["exercises"][exercise_idx]
-        completed_count = len(logged_sets)
+        workout = context.user_data["current_workout"]
+        exercise = _pending_exercise(context)
+        if exercise is None:
+            return await _exercise_gone(query.message, workout)
+        exercise.log(set_num, existing_weight, existing_reps)
+        _journal_set(
+            user_id, workout, exercise, set_num, existing_weight, existing_reps
+        )
+        completed_count = exercise.logged_count
 
         context.user_data.pop("pending_weight", None)
         context.user_data.pop("pending_reps", None)
-        context.user_data.pop("pending_exercise_idx", None)
+        context.user_data.pop("pending_exercise_id", None)
         context.user_data.pop("pending_set_num", None)
         context.user_data.pop("default_weight", None)
         context.user_data.pop("default_reps", None)
@@ -618,97 +644,49 @@ async def handle_exercise_action(update: Update, context: ContextTypes.DEFAULT_T
 
         await query.message.edit_text(
             f"Set {set_num} updated: {existing_weight}kg x {existing_reps} reps\n\n"
-            f"Progress: {completed_count}/{ex_data['default_sets']} sets completed",
+            f"Progress: {completed_count}/{exercise.default_sets} sets completed",
             parse_mode="Markdown",
             reply_markup=build_set_keyboard(
-                exercise_idx,
-                ex_data,
-                logged_sets,
+                exercise,
                 context,
-                completed_count >= ex_data["default_sets"],
+                completed_count >= exercise.default_sets,
             ),
         )
         return WORKOUT_EXERCISE_CONFIRM
 
     if data.startswith("complete_"):
         context.user_data.pop("rest_job", None)
-        exercise_idx = int(data.split("_")[1])
-        workout_data = context.user_data["current_workout"]
-        template_name = workout_data.get("template_name", "")
-        ex_data = workout_data["exercises"][exercise_idx]
-        logged_sets = workout_data["logged_sets"].get(exercise_idx, [])
-
-        for log_data in logged_sets:
-            if log_data.get("weight") is None or log_data.get("reps") is None:
-                continue
-            log = WorkoutLog(
-                user_id=user_id,
-                template_name=template_name,
-                exercise_name=ex_data["name"],
-                sets=1,
-                weight=log_data["weight"],
-                reps=log_data["reps"],
-            )
-            async with AsyncSessionLocal() as session:
-                session.add(log)
-                await session.commit()
-
-        workout_data["exercises"].pop(exercise_idx)
-        if "logged_sets" in workout_data:
-            workout_data["logged_sets"].pop(exercise_idx, None)
-            new_logged_sets = {}
-            for old_idx, sets in workout_data["logged_sets"].items():
-                if old_idx < exercise_idx:
-                    new_logged_sets[old_idx] = sets
-                elif old_idx > exercise_idx:
-                    new_logged_sets[old_idx - 1] = sets
-            workout_data["logged_sets"] = new_logged_sets
-
-        num_exercises = len(workout_data["exercises"])
-        if num_exercises == 0:
+        exercise_id = int(data.split("_")[1])
+        workout = context.user_data["current_workout"]
+        exercise = workout.complete(exercise_id)
+        if exercise is None:
+            return await _exercise_gone(query.message, workout)
+
+        set_journal.commit(user_id, workout.session_id, exercise.id)
+
+        workout.current_id = workout.next_active(exercise_id)
+        if workout.current_id is None:
+            await _finish_workout(user_id, workout)
             context.user_data.clear()
             await query.message.edit_text("Workout complete! Great job! 🎉")
             return ConversationHandler.END
 
-        if exercise_idx >= num_exercises:
-            workout_data["current_index"] = num_exercises - 1
-        else:
-            workout_data["current_index"] = exercise_idx
-
         return await process_next_exercise(query.message, context, user_id)
 
     if data == "back_to_exercise":
-        workout_data = context.user_data.get("current_workout")
-        if workout_data:
-            keyboard = []
-            for idx, ex in enumerate(workout_data["exercises"]):
-                keyboard.append(
-                    [
-                        InlineKeyboardButton(
-                            f"{idx + 1}. {ex['name']} ({ex['default_sets']} sets x {ex['default_weight']}kg x {ex['default_reps']} reps)",
-                            callback_data=f"ex_{idx}",
-                        ),
-                        InlineKeyboardButton(
-                            "❌", callback_data=f"remove_exercise_{idx}"
-                        ),
-                    ]
-                )
-            keyboard.append(
-                [InlineKeyboardButton("🛑 End Workout", callback_data="end_workout")]
-            )
-            keyboard.append(
-                [InlineKeyboardButton("➕ Add Exercise", callback_data="add_exercise")]
-            )
+        workout = context.user_data.get("current_workout")
+        if workout:
             await query.message.edit_text(
                 "Select an exercise to continue:",
-                reply_markup=InlineKeyboardMarkup(keyboard),
+                reply_markup=_continue_keyboard(workout),
             )
             return WORKOUT_EXERCISE_SELECT
         return WORKOUT_EXERCISE_CONFIRM
 
     if data == "end_workout":
         context.user_data.pop("rest_job", None)
-        context.user_data.pop("current_workout", None)
+        workout = context.user_data.pop("current_workout", None)
+        await _finish_workout(user_id, workout, save_pending=False)
         context.user_data.pop("selected_exercise", None)
         context.user_data.pop("exercise_history", None)
         context.user_data.pop("waiting_for_add_exercise", None)
@@ -725,46 +703,23 @@ async def handle_exercise_action(update: Update, context: ContextTypes.DEFAULT_T
         return WORKOUT_EXERCISE_INPUT
 
     if data.startswith("remove_exercise_"):
-        exercise_idx = int(data.split("_")[2])
-        workout_data = context.user_data["current_workout"]
-        workout_data["exercises"].pop(exercise_idx)
-        if "logged_sets" in workout_data:
-            workout_data["logged_sets"].pop(exercise_idx, None)
-            new_logged_sets = {}
-            for old_idx, sets in workout_data["logged_sets"].items():
-                if old_idx < exercise_idx:
-                    new_logged_sets[old_idx] = sets
-                elif old_idx > exercise_idx:
-                    new_logged_sets[old_idx - 1] = sets
-            workout_data["logged_sets"] = new_logged_sets
-        num_exercises = len(workout_data["exercises"])
-        if num_exercises == 0:
+        exercise_id = int(data.split("_")[2])
+        workout = context.user_data["current_workout"]
+        removed = workout.drop(exercise_id)
+        if removed is None:
+            return await _exercise_gone(query.message, workout)
+        set_journal.discard(user_id, workout.session_id, removed.id)
+        if workout.current_id == exercise_id:
+            workout.current_id = workout.next_active(exercise_id)
+        if not workout.active():
             await query.answer()
+            await _finish_workout(user_id, workout)
             context.user_data.clear()
             await query.message.edit_text("Workout complete! Great job! 🎉")
             return ConversationHandler.END
-        if workout_data["current_index"] >= num_exercises:
-            workout_data["current_index"] = num_exercises - 1
-        keyboard = []
-        for idx, ex in enumerate(workout_data["exercises"]):
-            keyboard.append(
-                [
-                    InlineKeyboardButton(
-                        f"{idx + 1}. {ex['name']} ({ex['default_sets']} sets x {ex['default_weight']}kg x {ex['default_reps']} reps)",
-                        callback_data=f"ex_{idx}",
-                    ),
-                    InlineKeyboardButton("❌", callback_data=f"remove_exercise_{idx}"),
-                ]
-            )
-        keyboard.append(
-            [InlineKeyboardButton("🛑 End Workout", callback_data="end_workout")]
-        )
-        keyboard.append(
-            [InlineKeyboardButton("➕ Add Exercise", callback_data="add_exercise")]
-        )
         await query.message.edit_text(
             "Select an exercise to continue:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=_continue_keyboard(workout),
         )
         return WORKOUT_EXERCISE_SELECT
 
@@ -809,11 +764,7 @@ async def handle_weight_select(
         ex_data = context.user_data["editing_exercises"][exercise_idx]
         default_reps = ex_data.get("reps", 0)
     else:
-        exercise_idx = context.user_data.get("pending_exercise_idx", 0)
-        ex_data = context.user_data.get("current_workout", {}).get("exercises", [{}])[
-            exercise_idx
-        ]
-        default_reps = ex_data.get("default_reps", 0)
+        default_reps = context.user_data.get("default_reps", 0)
 
     await query.message.edit_text(
         f"Weight: {weight}kg\nSelect reps (default: {default_reps}):",
@@ -836,11 +787,7 @@ async def handle_reps_select(
             ex_data = context.user_data["editing_exercises"][exercise_idx]
             default_reps = ex_data.get("reps", 0)
         else:
-            exercise_idx = context.user_data.get("pending_exercise_idx", 0)
-            ex_data = context.user_data.get("current_workout", {}).get(
-                "exercises", [{}]
-            )[exercise_idx]
-            default_reps = ex_data.get("default_reps", 0)
+            default_reps = context.user_data.get("default_reps", 0)
 
         await query.message.edit_text(
             f"Enter custom reps (default: {default_reps}):",
@@ -855,11 +802,7 @@ async def handle_reps_select(
             default_weight = ex_data.get("weight", 0)
             set_num = context.user_data.get("pending_template_set_num", 1)
         else:
-            exercise_idx = context.user_data.get("pending_exercise_idx", 0)
-            ex_data = context.user_data.get("current_workout", {}).get(
-                "exercises", [{}]
-            )[exercise_idx]
-            default_weight = ex_data.get("default_weight", 0)
+            default_weight = context.user_data.get("default_weight", 0)
             set_num = context.user_data.get("pending_set_num", 1)
 
         await query.message.edit_text(
@@ -881,44 +824,33 @@ async def handle_reps_select(
     if context.user_data.get("is_template_edit"):
         return await handle_template_set_finish(update, context, weight, reps)
 
-    exercise_idx = context.user_data.get("pending_exercise_idx", 0)
     set_num = context.user_data.get("pending_set_num", 1)
 
-    workout_data = context.user_data.get("current_workout", {})
-    if "logged_sets" not in workout_data:
-        workout_data["logged_sets"] = {}
-
-    if exercise_idx not in workout_data["logged_sets"]:
-        workout_data["logged_sets"][exercise_idx] = []
-
-    logged_sets = workout_data["logged_sets"][exercise_idx]
-
-    while len(logged_sets) < set_num:
-        logged_sets.append({"weight": None, "reps": None})
-
-    logged_sets[set_num - 1] = {"weight": weight, "reps": reps}
+    workout = context.user_data["current_workout"]
+    exercise = _pending_exercise(context)
+    if exercise is None:
+        return await _exercise_gone(query.message, workout)
+    exercise.log(set_num, weight, reps)
 
     context.user_data.pop("pending_weight", None)
     context.user_data.pop("pending_reps", None)
-    context.user_data.pop("pending_exercise_idx", None)
+    context.user_data.pop("pending_exercise_id", None)
     context.user_data.pop("pending_set_num", None)
     context.user_data.pop("default_weight", None)
     context.user_data.pop("default_reps", None)
     context.user_data.pop("editing_existing", None)
 
-    ex_data = workout_data["exercises"][exercise_idx]
-    completed_count = len(logged_sets)
+    _journal_set(user_id, workout, exercise, set_num, weight, reps)
+    completed_count = exercise.logged_count
 
     await query.message.edit_text(
         f"Set {set_num} logged: {weight}kg x {reps} reps\n\n"
-        f"Progress: {completed_count}/{ex_data['default_sets']} sets completed",
+        f"Progress: {completed_count}/{exercise.default_sets} sets completed",
         parse_mode="Markdown",
         reply_markup=build_set_keyboard(
-            exercise_idx,
-            ex_data,
-            logged_sets,
+            exercise,
             context,
-            completed_count >= ex_data["default_sets"],
+            completed_count >= exercise.default_sets,
         ),
     )
     return WORKOUT_EXERCISE_CONFIRM
@@ -978,36 +910,24 @@ async def log_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 return WORKOUT_EXERCISE_INPUT
 
-        workout_data = context.user_data.get("current_workout")
-        if workout_data and "exercises" in workout_data:
-            workout_data["exercises"].append(
-                {
-                    "name": name,
-                    "default_sets": num_sets,
-                    "default_weight": sets_config[0]["weight"],
-                    "default_reps": sets_config[0]["reps"],
-                    "sets_config": sets_config,
-                }
+        workout = context.user_data.get("current_workout")
+        if workout is not None:
+            workout.add_exercise(
+                name,
+                exercise_catalog.match(name),
+                num_sets,
+                sets_config[0]["weight"],
+                sets_config[0]["reps"],
+                sets_config,
             )
             context.user_data.pop("waiting_for_add_exercise", None)
-            exercises = workout_data["exercises"]
             keyboard = []
-            for idx, ex in enumerate(exercises):
-                sets_text = (
-                    ", ".join(
-                        [
-                            f"{s['weight']}x{s['reps']}"
-                            for s in ex.get("sets_config", [])
-                        ]
-                    )
-                    if ex.get("sets_config")
-                    else f"{ex['default_sets']}x{ex['default_weight']}kgx{ex['default_reps']}"
-                )
+            for idx, ex in enumerate(workout.active()):
                 keyboard.append(
                     [
                         InlineKeyboardButton(
-                            f"{idx + 1}. {ex['name']} ({sets_text})",
-                            callback_data=f"ex_{idx}",
+                            f"{idx + 1}. {ex.name} ({_sets_text(ex)})",
+                            callback_data=f"ex_{ex.id}",
                         )
                     ]
                 )
@@ -1039,11 +959,7 @@ async def log_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 ex_data = context.user_data["editing_exercises"][exercise_idx]
                 default_reps = ex_data.get("reps", 0)
             else:
-                exercise_idx = context.user_data.get("pending_exercise_idx", 0)
-                ex_data = context.user_data.get("current_workout", {}).get(
-                    "exercises", [{}]
-                )[exercise_idx]
-                default_reps = ex_data.get("default_reps", 0)
+                default_reps = context.user_data.get("default_reps", 0)
 
             await update.message.reply_text(
                 f"Weight: {weight}kg\nSelect reps (default: {default_reps}):",
@@ -1097,7 +1013,6 @@ async def log_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if context.user_data.get("is_template_edit"):
                 return await handle_template_set_finish(update, context, weight, reps)
 
-            exercise_idx = context.user_data.get("pending_exercise_idx", 0)
             set_num = context.user_data.get("pending_set_num", 1)
 
             if weight is None:
@@ -1105,28 +1020,19 @@ async def log_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await process_next_exercise(update.message, context, user_id)
                 return WORKOUT_EXERCISE_CONFIRM
 
-            workout_data = context.user_data.get("current_workout", {})
-            if "logged_sets" not in workout_data:
-                workout_data["logged_sets"] = {}
-            if exercise_idx not in workout_data["logged_sets"]:
-                workout_data["logged_sets"][exercise_idx] = []
-
-            logged_sets = workout_data["logged_sets"][exercise_idx]
-            while len(logged_sets) < set_num:
-                logged_sets.append({"weight": None, "reps": None})
-
-            logged_sets[set_num - 1] = {"weight": weight, "reps": reps}
-
-            ex_data = workout_data["exercises"][exercise_idx]
+            workout = context.user_data["current_workout"]
+            exercise = _pending_exercise(context)
+            if exercise is None:
+                return await _exercise_gone(update.message, workout, edit=False)
+            exercise.log(set_num, weight, reps)
+            _journal_set(user_id, workout, exercise, set_num, weight, reps)
             await update.message.edit_text(
                 f"Set {set_num} logged: {weight}kg x {reps} reps\n\n"
-                f"Progress: {len(logged_sets)}/{ex_data['default_sets']} sets completed",
+                f"Progress: {exercise.logged_count}/{exercise.default_sets} sets completed",
                 reply_markup=build_set_keyboard(
-                    exercise_idx,
-                    ex_data,
-                    logged_sets,
+                    exercise,
                     context,
-                    len(logged_sets) >= ex_data["default_sets"],
+                    exercise.logged_count >= exercise.default_sets,
                 ),
             )
             return WORKOUT_EXERCISE_CONFIRM
@@ -1145,26 +1051,18 @@ async def log_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get("is_template_edit"):
         return await handle_template_set_finish(update, context, weight, reps)
 
-    exercise_idx = context.user_data.get("pending_exercise_idx", 0)
     set_num = context.user_data.get("pending_set_num", 1)
 
-    workout_data = context.user_data.get("current_workout", {})
-    if "logged_sets" not in workout_data:
-        workout_data["logged_sets"] = {}
-
-    if exercise_idx not in workout_data["logged_sets"]:
-        workout_data["logged_sets"][exercise_idx] = []
-
-    logged_sets = workout_data["logged_sets"][exercise_idx]
-
-    while len(logged_sets) < set_num:
-        logged_sets.append({"weight": None, "reps": None})
-
-    logged_sets[set_num - 1] = {"weight": weight, "reps": reps}
+    workout = context.user_data["current_workout"]
+    exercise = _pending_exercise(context)
+    if exercise is None:
+        return await _exercise_gone(update.message, workout, edit=False)
+    exercise.log(set_num, weight, reps)
+    _journal_set(user_id, workout, exercise, set_num, weight, reps)
 
     context.user_data.pop("pending_weight", None)
     context.user_data.pop("pending_reps", None)
-    context.user_data.pop("pending_exercise_idx", None)
+    context.user_data.pop("pending_exercise_id", None)
     context.user_data.pop("pending_set_num", None)
 
     await update.message.delete()
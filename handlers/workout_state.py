@@ -0,0 +1,386 @@
+"""Compact, typed state of a live workout session.
+
+A workout used to live in user_data as nested dicts with every field name
+repeated per exercise and per logged set. WorkoutState and ExerciseState are
+slotted dataclasses that keep per-set weights and reps in `array` storage, and
+pickle through a small versioned binary encoding (to_bytes/from_bytes), so
+whatever persistence backend stores user_data stores the compact form.
+Workouts persisted in the old form are converted when the bot starts
+(upgrade_legacy_workout).
+
+Exercises are keyed by an id that is stable for the whole session; display
+order is a separate list and finished exercises go into a completed set, so
+skipping or completing one never shifts the others and a button rendered
+before the change still addresses the exercise it was drawn for.
+"""
+
+import math
+import struct
+from array import array
+from dataclasses import dataclass, field
+
+ENCODING_MAGIC = b"WS"
+ENCODING_VERSION = 2
+
+# Logged-set placeholders for sets skipped over (e.g. set 3 logged before set 2)
+UNLOGGED_WEIGHT = math.nan
+UNLOGGED_REPS = -1
+
+
+def _weights(values=()) -> array:
+    return array("d", values)
+
+
+def _reps(values=()) -> array:
+    return array("i", values)
+
+
+@dataclass(slots=True)
+class ExerciseState:
+    id: int
+    name: str
+    catalog_id: int | None
+    default_sets: int
+    default_weight: float
+    default_reps: int
+    # Planned weight/reps per set (from the template's sets_config)
+    plan_weights: array = field(default_factory=_weights)
+    plan_reps: array = field(default_factory=_reps)
+    # Logged weight/reps per set; UNLOGGED_* marks a gap
+    weights: array = field(default_factory=_weights)
+    reps: array = field(default_factory=_reps)
+
+    @classmethod
+    def create(
+        cls,
+        id: int,
+        name: str,
+        catalog_id: int | None,
+        default_sets: int,
+        default_weight: float,
+        default_reps: int,
+        sets_config=None,
+    ) -> "ExerciseState":
+        sets_config = sets_config or []
+        return cls(
+            id=id,
+            name=name,
+            catalog_id=catalog_id,
+            default_sets=default_sets,
+            default_weight=default_weight,
+            default_reps=default_reps,
+            plan_weights=_weights(s["weight"] for s in sets_config),
+            plan_reps=_reps(s["reps"] for s in sets_config),
+        )
+
+    @property
+    def has_plan(self) -> bool:
+        return len(self.plan_weights) > 0
+
+    def planned(self, set_num: int) -> tuple[float, int]:
+        """Target (weight, reps) for a 1-based set number."""
+        if set_num <= len(self.plan_weights):
+            return self.plan_weights[set_num - 1], self.plan_reps[set_num - 1]
+        return self.default_weight, self.default_reps
+
+    def plan(self) -> list[tuple[float, int]]:
+        return list(zip(self.plan_weights, self.plan_reps))
+
+    @property
+    def logged_count(self) -> int:
+        """Sets touched so far, gaps included (what the progress line shows)."""
+        return len(self.weights)
+
+    def logged(self, set_num: int) -> tuple[float, int] | None:
+        """Logged (weight, reps) for a 1-based set number, or None."""
+        if set_num > len(self.weights) or self.reps[set_num - 1] == UNLOGGED_REPS:
+            return None
+        return self.weights[set_num - 1], self.reps[set_num - 1]
+
+    def log(self, set_num: int, weight: float, reps: int):
+        while len(self.weights) < set_num:
+            self.weights.append(UNLOGGED_WEIGHT)
+            self.reps.append(UNLOGGED_REPS)
+        self.weights[set_num - 1] = weight
+        self.reps[set_num - 1] = reps
+
+    def completed_sets(self):
+        """Yield (weight, reps) of every fully logged set."""
+        for weight, reps in zip(self.weights, self.reps):
+            if reps != UNLOGGED_REPS:
+                yield weight, reps
+
+
+@dataclass(slots=True)
+class WorkoutState:
+    session_id: int | None
+    template_name: str
+    # {exercise id: state}; skipped/removed exercises are dropped from here
+    exercises: dict[int, ExerciseState] = field(default_factory=dict)
+    # Display order of exercise ids (may still list dropped ones)
+    order: list[int] = field(default_factory=list)
+    completed: set[int] = field(default_factory=set)
+    next_exercise_id: int = 0
+    current_id: int | None = None
+    # {exercise_name: (sets, weight, reps) or None}, prefetched at start
+    previous: dict = field(default_factory=dict)
+    set_count: int = 0
+    total_volume: float = 0.0
+
+    def add_exercise(
+        self,
+        name: str,
+        catalog_id: int | None,
+        default_sets: int,
+        default_weight: float,
+        default_reps: int,
+        sets_config=None,
+    ) -> ExerciseState:
+        exercise = ExerciseState.create(
+            self.next_exercise_id,
+            name,
+            catalog_id,
+            default_sets,
+            default_weight,
+            default_reps,
+            sets_config,
+        )
+        self.next_exercise_id += 1
+        self.exercises[exercise.id] = exercise
+        self.order.append(exercise.id)
+        return exercise
+
+    def get(self, exercise_id: int) -> ExerciseState | None:
+        """The exercise if it is still part of the workout, else None."""
+        if exercise_id in self.completed:
+            return None
+        return self.exercises.get(exercise_id)
+
+    def active(self) -> list[ExerciseState]:
+        """Exercises still to do, in display order."""
+        return [
+            self.exercises[exercise_id]
+            for exercise_id in self.order
+            if exercise_id in self.exercises and exercise_id not in self.completed
+        ]
+
+    def drop(self, exercise_id: int) -> ExerciseState | None:
+        """Remove a skipped/removed exercise; its logged sets go with it."""
+        if exercise_id in self.completed:
+            return None
+        return self.exercises.pop(exercise_id, None)
+
+    def complete(self, exercise_id: int) -> ExerciseState | None:
+        """Mark an exercise done and add its sets to the session totals."""
+        exercise = self.get(exercise_id)
+        if exercise is not None:
+            self.completed.add(exercise_id)
+            self.tally(exercise)
+        return exercise
+
+    def next_active(self, after_id: int) -> int | None:
+        """Id of the exercise following after_id, or the last one left."""
+        active = [ex.id for ex in self.active()]
+        if not active:
+            return None
+        if after_id in self.order:
+            position = self.order.index(after_id)
+            for exercise_id in self.order[position + 1 :]:
+                if exercise_id in active:
+                    return exercise_id
+        return active[-1]
+
+    def tally(self, exercise: ExerciseState):
+        """Add an exercise's fully logged sets to the running session totals."""
+        for weight, reps in exercise.completed_sets():
+            self.set_count += 1
+            self.total_volume += weight * reps
+
+    # --- Legacy user_data format ---
+
+    @classmethod
+    def from_legacy(cls, data: dict) -> "WorkoutState":
+        """Convert a workout stored as nested dicts, before WorkoutState existed.
+
+        Legacy workouts list only unfinished exercises, keyed logged sets by
+        list position and marked a gap with a None weight/reps.
+        """
+        state = cls(
+            session_id=data.get("session_id"),
+            template_name=data.get("template_name") or "",
+            previous=dict(data.get("previous") or {}),
+            set_count=data.get("set_count", 0),
+            total_volume=data.get("total_volume", 0.0),
+        )
+        logged_sets = data.get("logged_sets") or {}
+        for position, ex in enumerate(data.get("exercises", [])):
+            exercise = ExerciseState.create(
+                ex.get("id", position),
+                ex["name"],
+                ex.get("catalog_id"),
+                ex.get("default_sets", 3),
+                ex.get("default_weight", 0.0),
+                ex.get("default_reps", 0),
+                ex.get("sets_config"),
+            )
+            for set_num, logged in enumerate(logged_sets.get(position, []), start=1):
+                if logged.get("weight") is None or logged.get("reps") is None:
+                    exercise.log(set_num, UNLOGGED_WEIGHT, UNLOGGED_REPS)
+                else:
+                    exercise.log(set_num, logged["weight"], logged["reps"])
+            state.exercises[exercise.id] = exercise
+            state.order.append(exercise.id)
+        state.next_exercise_id = max(
+            data.get("next_exercise_id", 0), max(state.order, default=-1) + 1
+        )
+        current = data.get("current_index", 0)
+        if 0 <= current < len(state.order):
+            state.current_id = state.order[current]
+        return state
+
+    # --- Versioned binary encoding ---
+
+    def to_bytes(self) -> bytes:
+        out = bytearray(ENCODING_MAGIC)
+        out += struct.pack(
+            "<BqIiId",
+            ENCODING_VERSION,
+            -1 if self.session_id is None else self.session_id,
+            self.next_exercise_id,
+            -1 if self.current_id is None else self.current_id,
+            self.set_count,
+            self.total_volume,
+        )
+        _pack_str(out, self.template_name or "")
+        # Dropped exercises are not written; order is the order written
+        exercises = [self.exercises[i] for i in self.order if i in self.exercises]
+        out += struct.pack("<H", len(exercises))
+        for ex in exercises:
+            out += struct.pack(
+                "<IidHiB",
+                ex.id,
+                -1 if ex.catalog_id is None else ex.catalog_id,
+                ex.default_weight,
+                ex.default_sets,
+                ex.default_reps,
+                ex.id in self.completed,
+            )
+            _pack_str(out, ex.name)
+            _pack_sets(out, ex.plan_weights, ex.plan_reps)
+            _pack_sets(out, ex.weights, ex.reps)
+        out += struct.pack("<H", len(self.previous))
+        for name, performance in self.previous.items():
+            _pack_str(out, name)
+            if performance is None:
+                out += struct.pack("<B", 0)
+            else:
+                sets, weight, reps = performance
+                out += struct.pack("<BHdi", 1, sets, weight, reps)
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "WorkoutState":
+        if data[:2] != ENCODING_MAGIC:
+            raise ValueError("Not an encoded WorkoutState")
+        reader = _Reader(data, 2)
+        version = reader.unpack("<B")[0]
+        if version not in (1, ENCODING_VERSION):
+            raise ValueError(f"Unsupported WorkoutState encoding version {version}")
+        session_id, next_id, current, set_count, total_volume = reader.unpack(
+            "<qIiId"
+        )
+        state = cls(
+            session_id=None if session_id == -1 else session_id,
+            template_name=reader.string(),
+            next_exercise_id=next_id,
+            set_count=set_count,
+            total_volume=total_volume,
+        )
+        for _ in range(reader.unpack("<H")[0]):
+            if version == 1:
+                ex_id, catalog_id, default_weight, default_sets, default_reps = (
+                    reader.unpack("<IidHi")
+                )
+                done = False
+            else:
+                ex_id, catalog_id, default_weight, default_sets, default_reps, done = (
+                    reader.unpack("<IidHiB")
+                )
+            name = reader.string()
+            plan_weights, plan_reps = reader.sets()
+            weights, reps = reader.sets()
+            state.order.append(ex_id)
+            if done:
+                state.completed.add(ex_id)
+            state.exercises[ex_id] = ExerciseState(
+                id=ex_id,
+                name=name,
+                catalog_id=None if catalog_id == -1 else catalog_id,
+                default_sets=default_sets,
+                default_weight=default_weight,
+                default_reps=default_reps,
+                plan_weights=plan_weights,
+                plan_reps=plan_reps,
+                weights=weights,
+                reps=reps,
+            )
+        if version == 1:
+            # Version 1 stored a list position rather than an exercise id
+            current = state.order[current] if 0 <= current < len(state.order) else -1
+        state.current_id = None if current == -1 else current
+        for _ in range(reader.unpack("<H")[0]):
+            name = reader.string()
+            if reader.unpack("<B")[0]:
+                state.previous[name] = reader.unpack("<Hdi")
+            else:
+                state.previous[name] = None
+        return state
+
+    def __reduce__(self):
+        return (WorkoutState.from_bytes, (self.to_bytes(),))
+
+
+def upgrade_legacy_workout(user_data: dict) -> bool:
+    """Replace a legacy dict current_workout with a WorkoutState, in place.
+
+    Returns True if user_data was changed.
+    """
+    workout = user_data.get("current_workout")
+    if not isinstance(workout, dict):
+        return False
+    user_data["current_workout"] = WorkoutState.from_legacy(workout)
+    return True
+
+
+def _pack_str(out: bytearray, value: str):
+    encoded = value.encode("utf-8")
+    out += struct.pack("<H", len(encoded))
+    out += encoded
+
+
+def _pack_sets(out: bytearray, weights: array, reps: array):
+    count = len(weights)
+    out += struct.pack(f"<H{count}d{count}i", count, *weights, *reps)
+
+
+class _Reader:
+    def __init__(self, data: bytes, offset: int):
+        self.data = data
+        self.offset = offset
+
+    def unpack(self, fmt: str) -> tuple:
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def string(self) -> str:
+        (length,) = self.unpack("<H")
+        value = self.data[self.offset : self.offset + length].decode("utf-8")
+        self.offset += length
+        return value
+
+    def sets(self) -> tuple[array, array]:
+        (count,) = self.unpack("<H")
+        weights = _weights(self.unpack(f"<{count}d"))
+        reps = _reps(self.unpack(f"<{count}i"))
+        return weights, reps
@@ -0,0 +1,128 @@
+"""Shrink workout-plan photos before they are sent to the vision model.
+
+Telegram offers every photo in several sizes. pick_photo_size() takes the
+smallest one whose long side still reaches VISION_IMAGE_SIDE, so a phone
+photo is no longer downloaded and inlined at full resolution. The download
+is then converted to grayscale, contrast-normalized (plans are text; colour
+only costs bytes) and recompressed as JPEG with Pillow in a worker thread.
+
+The SHA-256 of the prepared bytes identifies the image for the LLM cache.
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+VISION_IMAGE_SIDE = int(os.getenv("VISION_IMAGE_SIDE", 1024))  # pixels, long side
+JPEG_QUALITY = 70
+
+
+@dataclass(slots=True)
+class PreparedImage:
+    data: bytes
+    digest: str
+    # Size of the largest PhotoSize, i.e. what used to be sent
+    original_bytes: int
+    downloaded_bytes: int
+    download_seconds: float
+    prep_seconds: float
+
+
+class ImageStats:
+    """Payload and latency of vision requests, to see what preprocessing saves."""
+
+    def __init__(self):
+        self.requests = 0
+        self.original_bytes = 0
+        self.sent_bytes = 0
+        self.download_seconds = 0.0
+        self.prep_seconds = 0.0
+        self.llm_seconds = 0.0
+
+    def record(self, image: PreparedImage, llm_seconds: float):
+        self.requests += 1
+        self.original_bytes += image.original_bytes
+        self.sent_bytes += len(image.data)
+        self.download_seconds += image.download_seconds
+        self.prep_seconds += image.prep_seconds
+        self.llm_seconds += llm_seconds
+        logger.info(
+            f"Vision request: {image.original_bytes} -> {len(image.data)} bytes, "
+            f"download {image.download_seconds:.2f}s, prep {image.prep_seconds:.2f}s, "
+            f"LLM {llm_seconds:.2f}s"
+        )
+
+    def snapshot(self) -> dict:
+        n = self.requests or 1
+        return {
+            "requests": self.requests,
+            "avg_original_bytes": self.original_bytes / n,
+            "avg_sent_bytes": self.sent_bytes / n,
+            "payload_reduction": (
+                1 - self.sent_bytes / self.original_bytes if self.original_bytes else 0.0
+            ),
+            "avg_download_s": self.download_seconds / n,
+            "avg_prep_s": self.prep_seconds / n,
+            "avg_llm_s": self.llm_seconds / n,
+        }
+
+
+image_stats = ImageStats()
+
+
+def pick_photo_size(photos, side: int = VISION_IMAGE_SIDE):
+    """Smallest PhotoSize whose long side is at least `side`, else the largest."""
+    by_area = sorted(photos, key=lambda p: p.width * p.height)
+    for photo in by_area:
+        if max(photo.width, photo.height) >= side:
+            return photo
+    return by_area[-1]
+
+
+def preprocess(data: bytes, side: int = VISION_IMAGE_SIDE) -> bytes:
+    """Grayscale, autocontrast, fit within side x side and recompress (blocking)."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img).convert("L")
+            img = ImageOps.autocontrast(img, cutoff=1)
+            img.thumbnail((side, side))
+            out = io.BytesIO()
+            img.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed, sending it unchanged: {e}")
+        return data
+    processed = out.getvalue()
+    return processed if len(processed) < len(data) else data
+
+
+async def prepare_photo(bot, photos, side: int = VISION_IMAGE_SIDE) -> PreparedImage:
+    """Download the best-fitting size of a Telegram photo and preprocess it."""
+    photo = pick_photo_size(photos, side)
+    start = time.perf_counter()
+    file = await bot.get_file(photo.file_id)
+    buffer = io.BytesIO()
+    await file.download_to_memory(buffer)
+    downloaded = buffer.getvalue()
+    download_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = await asyncio.to_thread(preprocess, downloaded, side)
+    prep_seconds = time.perf_counter() - start
+
+    largest = max(photos, key=lambda p: p.width * p.height)
+    return PreparedImage(
+        data=data,
+        digest=hashlib.sha256(data).hexdigest(),
+        original_bytes=largest.file_size or len(downloaded),
+        downloaded_bytes=len(downloaded),
+        download_seconds=download_seconds,
+        prep_seconds=prep_seconds,
+    )
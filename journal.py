@@ -0,0 +1,365 @@
+"""Write-behind journal for logged workout sets.
+
+Every logged set is recorded here immediately and mirrored to a small local
+append-only file. When its exercise is completed (or the workout ends) the
+sets are committed, and a background task drains committed sets to
+workout_logs in batches, either once FLUSH_BATCH_SIZE rows are ready or every
+FLUSH_INTERVAL_SECONDS. On startup the file is replayed, so a restart in the
+middle of a workout loses nothing that was already logged.
+
+Each set gets a journal id that is stored with its workout_logs row, so a
+replay after a crash between a flush and the file compaction skips the rows
+that already made it to the database. File writes never block the handlers:
+appends are buffered and written (and fsynced) in groups by a writer task.
+A row the database keeps rejecting is moved to a dead-letter file instead of
+holding up every set logged after it.
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import os
+import uuid
+
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from queries import save_workout_logs, stored_journal_ids
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = os.getenv("SET_JOURNAL_PATH", "set_journal.log")
+FLUSH_BATCH_SIZE = 200
+FLUSH_INTERVAL_SECONDS = 5.0
+# Failed saves of a batch before it is split up to find the bad rows
+MAX_SAVE_ATTEMPTS = 3
+
+
+def _encode_row(row: dict) -> dict:
+    encoded = dict(row)
+    if isinstance(encoded.get("timestamp"), datetime.datetime):
+        encoded["timestamp"] = encoded["timestamp"].isoformat()
+    return encoded
+
+
+def _decode_row(row: dict) -> dict:
+    decoded = dict(row)
+    if isinstance(decoded.get("timestamp"), str):
+        decoded["timestamp"] = datetime.datetime.fromisoformat(decoded["timestamp"])
+    return decoded
+
+
+def _matches(key: tuple, user_id, workout_id, exercise_id=None) -> bool:
+    return (
+        key[0] == user_id
+        and key[1] == workout_id
+        and (exercise_id is None or key[2] == exercise_id)
+    )
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a failed save is worth retrying as is (the database is unreachable)."""
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(
+        error,
+        (OSError, ConnectionError, asyncio.TimeoutError, OperationalError, InterfaceError),
+    )
+
+
+class SetJournal:
+    """In-process buffer of logged sets, keyed by (user, workout, exercise, set)."""
+
+    def __init__(
+        self,
+        path: str,
+        save=save_workout_logs,
+        stored=stored_journal_ids,
+        batch_size: int = FLUSH_BATCH_SIZE,
+        interval: float = FLUSH_INTERVAL_SECONDS,
+    ):
+        self.path = path
+        self.dead_letter_path = path + ".dead"
+        self._save = save
+        self._stored = stored
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pending: dict[tuple, dict] = {}  # logged, exercise not finished yet
+        self._ready: dict[str, dict] = {}  # committed, by journal id
+        self._attempts: dict[str, int] = {}  # failed saves, by journal id
+        self._saved_this_pass = 0
+        self._dead_this_pass = 0
+        self._buffer: list[str] = []  # appended lines not yet written
+        self._file = None
+        self._task = None
+        self._writer = None
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._dirty = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._io_lock = asyncio.Lock()
+
+    # --- Handler API (synchronous, no DB round-trips or disk I/O) ---
+
+    def record(self, user_id, workout_id, exercise_id, set_num, row: dict):
+        """Record (or overwrite) one logged set."""
+        key = (user_id, workout_id, exercise_id, set_num)
+        row = dict(row, journal_id=uuid.uuid4().hex)
+        self._append({"op": "record", "key": list(key), "row": _encode_row(row)})
+        self._pending[key] = row
+
+    def commit(self, user_id, workout_id, exercise_id=None) -> int:
+        """Mark an exercise's sets (or a whole workout's) ready to be written."""
+        ids = self._pending_ids(user_id, workout_id, exercise_id)
+        if ids:
+            self._append({"op": "commit", "ids": ids})
+        count = self._apply_commit(ids)
+        if len(self._ready) >= self.batch_size:
+            self._wake.set()
+        return count
+
+    def discard(self, user_id, workout_id, exercise_id=None) -> int:
+        """Drop uncommitted sets of a skipped exercise or abandoned workout."""
+        ids = self._pending_ids(user_id, workout_id, exercise_id)
+        if ids:
+            self._append({"op": "discard", "ids": ids})
+        return self._apply_discard(ids)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    @property
+    def ready_count(self) -> int:
+        return len(self._ready)
+
+    # --- Lifecycle ---
+
+    async def start(self):
+        """Replay the journal file and start the background writer and flusher."""
+        self._stopping = False
+        self._replay()
+        await self._skip_stored()
+        await self._rewrite()
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        if self._ready:
+            self._wake.set()
+
+    async def stop(self):
+        """Stop the background tasks and write out everything that is committed."""
+        self._stopping = True
+        self._wake.set()
+        self._dirty.set()
+        for task in (self._task, self._writer):
+            if task is not None:
+                await task
+        self._task = self._writer = None
+        await self.flush()
+        await self.sync()
+        async with self._io_lock:
+            if self._file is not None:
+                await asyncio.to_thread(self._file.close)
+                self._file = None
+
+    async def sync(self):
+        """Write and fsync the buffered appends (one group commit)."""
+        async with self._io_lock:
+            lines, self._buffer = self._buffer, []
+            if lines:
+                await asyncio.to_thread(self._write_lines, lines)
+
+    async def flush(self) -> int:
+        """Write all committed sets to the database in batches; return rows written."""
+        async with self._flush_lock:
+            self._saved_this_pass = self._dead_this_pass = 0
+            try:
+                while self._ready:
+                    await self._save_batch(list(self._ready)[: self.batch_size])
+            except Exception as e:
+                logger.error(f"Set journal flush failed, will retry: {e}")
+            if self._saved_this_pass or self._dead_this_pass:
+                await self._rewrite()
+            return self._saved_this_pass
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._stopping:
+                await self.flush()
+
+    async def _write_loop(self):
+        while not self._stopping:
+            await self._dirty.wait()
+            self._dirty.clear()
+            await self.sync()
+
+    # --- Saving ---
+
+    async def _save_batch(self, ids: list[str]):
+        """Save one batch, splitting it to isolate rows that keep failing.
+
+        Re-raises transient errors (the database is down) so the flush stops
+        and retries later; rows that fail on their own are dead-lettered.
+        """
+        try:
+            await self._save([self._ready[i] for i in ids])
+        except Exception as e:
+            for i in ids:
+                self._attempts[i] = self._attempts.get(i, 0) + 1
+            transient = _is_transient(e)
+            if transient and max(self._attempts[i] for i in ids) < MAX_SAVE_ATTEMPTS:
+                raise
+            if len(ids) == 1:
+                if transient and not self._saved_this_pass:
+                    raise
+                await self._dead_letter(ids[0], e)
+                return
+            middle = len(ids) // 2
+            await self._save_batch(ids[:middle])
+            await self._save_batch(ids[middle:])
+            return
+        for i in ids:
+            self._ready.pop(i, None)
+            self._attempts.pop(i, None)
+        self._saved_this_pass += len(ids)
+
+    async def _dead_letter(self, journal_id: str, error: Exception):
+        row = self._ready.pop(journal_id)
+        self._attempts.pop(journal_id, None)
+        line = json.dumps({"row": _encode_row(row), "error": str(error)}) + "\n"
+        await asyncio.to_thread(self._append_dead_letter, line)
+        self._dead_this_pass += 1
+        logger.error(
+            f"Set journal gave up on a {row.get('exercise_name')} set of user "
+            f"{row.get('user_id')}, moved to {self.dead_letter_path}: {error}"
+        )
+
+    async def _skip_stored(self):
+        """Drop replayed sets whose rows were saved before the file was compacted."""
+        if not self._ready:
+            return
+        try:
+            stored = await self._stored(list(self._ready))
+        except Exception as e:
+            # The flush inserts with ON CONFLICT DO NOTHING, so keeping them is safe
+            logger.warning(f"Could not check replayed sets against the database: {e}")
+            return
+        for journal_id in stored:
+            self._ready.pop(journal_id, None)
+        if stored:
+            logger.info(f"Set journal skipped {len(stored)} sets already saved")
+
+    # --- State transitions shared by the live API and replay ---
+
+    def _pending_ids(self, user_id, workout_id, exercise_id) -> list[str]:
+        return [
+            row["journal_id"]
+            for key, row in self._pending.items()
+            if _matches(key, user_id, workout_id, exercise_id)
+        ]
+
+    def _apply_commit(self, ids) -> int:
+        ids = set(ids)
+        keys = [k for k, row in self._pending.items() if row["journal_id"] in ids]
+        for k in keys:
+            row = self._pending.pop(k)
+            self._ready[row["journal_id"]] = row
+        return len(keys)
+
+    def _apply_discard(self, ids) -> int:
+        ids = set(ids)
+        keys = [k for k, row in self._pending.items() if row["journal_id"] in ids]
+        for k in keys:
+            del self._pending[k]
+        return len(keys)
+
+    # --- File handling ---
+
+    def _append(self, entry: dict):
+        self._buffer.append(json.dumps(entry) + "\n")
+        self._dirty.set()
+
+    def _write_lines(self, lines: list[str]):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.writelines(lines)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _append_dead_letter(self, line: str):
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    logger.warning("Skipping corrupt set journal entry")
+                    continue
+                op = entry.get("op")
+                if op == "record":
+                    row = _decode_row(entry["row"])
+                    # Files written before journal ids existed
+                    row.setdefault("journal_id", uuid.uuid4().hex)
+                    self._pending[tuple(entry["key"])] = row
+                elif op == "ready":
+                    row = _decode_row(entry["row"])
+                    self._ready[row["journal_id"]] = row
+                elif op in ("commit", "discard"):
+                    ids = entry.get("ids")
+                    if ids is None:
+                        ids = self._pending_ids(
+                            entry["user_id"], entry["workout_id"], entry["exercise_id"]
+                        )
+                    if op == "commit":
+                        self._apply_commit(ids)
+                    else:
+                        self._apply_discard(ids)
+        logger.info(
+            f"Set journal replayed: {len(self._pending)} pending, "
+            f"{len(self._ready)} ready"
+        )
+
+    async def _rewrite(self):
+        """Compact the file down to the entries that are still buffered."""
+        async with self._io_lock:
+            # The snapshot already reflects every buffered append
+            self._buffer = []
+            lines = [
+                json.dumps({"op": "ready", "row": _encode_row(row)}) + "\n"
+                for row in self._ready.values()
+            ]
+            lines += [
+                json.dumps({"op": "record", "key": list(key), "row": _encode_row(row)})
+                + "\n"
+                for key, row in self._pending.items()
+            ]
+            await asyncio.to_thread(self._rewrite_file, lines)
+
+    def _rewrite_file(self, lines: list[str]):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+set_journal = SetJournal(JOURNAL_PATH)
@@ -0,0 +1,154 @@
+"""Incremental, truncation-tolerant JSON reader for streamed LLM output.
+
+The LLM answers with one object of the shape
+
+    {"template_name": "...", "notes": "...", "exercises": [{...}, {...}]}
+
+and streams it a few characters at a time. ItemStream is fed those chunks and
+yields every object of the items array (e.g. "exercises") as soon as its
+closing brace arrives, and remembers the top-level scalar fields. If the
+stream stops early, result() still returns every complete item instead of
+failing on the unterminated document.
+"""
+
+import json
+
+# Scanner states
+_VALUE = 0  # expecting a value (or the end of a container)
+_KEY = 1  # expecting an object key
+_AFTER = 2  # after a key or value, expecting ':' ',' or a closing bracket
+
+
+class _Container:
+    __slots__ = ("kind", "key", "start", "pending_key", "state")
+
+    def __init__(self, kind: str, key, start: int):
+        self.kind = kind  # "{" or "["
+        self.key = key  # key in the parent object (None inside arrays)
+        self.start = start
+        self.pending_key = None
+        self.state = _KEY if kind == "{" else _VALUE
+
+
+class ItemStream:
+    """Yield the objects of one top-level array while the JSON is still arriving."""
+
+    def __init__(self, items_key: str = "exercises"):
+        self.items_key = items_key
+        self.items: list[dict] = []
+        self.fields: dict = {}
+        self.complete = False
+        self.text = ""
+        self._stack: list[_Container] = []
+        self._in_string = False
+        self._escape = False
+        self._token_start = None  # start of the current string or scalar
+
+    def feed(self, chunk: str) -> list[dict]:
+        """Consume a chunk; return the items that completed in it."""
+        if not chunk:
+            return []
+        start = len(self.text)
+        self.text += chunk
+        done = []
+        for pos in range(start, len(self.text)):
+            item = self._step(self.text, pos)
+            if item is not None:
+                done.append(item)
+        return done
+
+    def result(self) -> dict:
+        """The whole document if it parsed, else the fields and items seen so far."""
+        try:
+            data = json.loads(self.text)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            return data
+        return {**self.fields, self.items_key: list(self.items)}
+
+    # --- Scanner ---
+
+    def _step(self, text: str, pos: int):
+        char = text[pos]
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                self._end_token(text[self._token_start : pos + 1])
+            return None
+
+        if self._token_start is not None and (char in ",:]}" or char.isspace()):
+            # End of a bare scalar (number, true, false, null)
+            self._end_token(text[self._token_start : pos])
+
+        if char.isspace():
+            return None
+        top = self._stack[-1] if self._stack else None
+        if char == '"':
+            self._in_string = True
+            self._token_start = pos
+        elif char in "{[":
+            key = None
+            if top is not None:
+                key = top.pending_key if top.kind == "{" else None
+                top.state = _AFTER
+            self._stack.append(_Container(char, key, pos))
+        elif char in "}]":
+            if top is None:
+                return None
+            self._stack.pop()
+            if not self._stack:
+                self.complete = True
+                return None
+            parent = self._stack[-1]
+            parent.state = _AFTER
+            if char == "}" and self._is_items_array(parent):
+                return self._emit(text[top.start : pos + 1])
+        elif char == ":":
+            if top is not None:
+                top.state = _VALUE
+        elif char == ",":
+            if top is not None:
+                top.state = _KEY if top.kind == "{" else _VALUE
+                top.pending_key = None
+        elif self._token_start is None:
+            self._token_start = pos
+        return None
+
+    def _end_token(self, raw: str):
+        self._token_start = None
+        top = self._stack[-1] if self._stack else None
+        if top is None:
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        if top.kind == "{" and top.state == _KEY:
+            top.pending_key = value
+            top.state = _AFTER
+            return
+        if len(self._stack) == 1 and top.kind == "{" and top.pending_key is not None:
+            self.fields[top.pending_key] = value
+        top.state = _AFTER
+
+    def _is_items_array(self, container: _Container) -> bool:
+        return (
+            container.kind == "["
+            and len(self._stack) == 2
+            and container.key == self.items_key
+        )
+
+    def _emit(self, raw: str):
+        try:
+            item = json.loads(raw)
+        except ValueError:
+            return None
+        if not isinstance(item, dict):
+            return None
+        self.items.append(item)
+        return item
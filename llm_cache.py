@@ -0,0 +1,360 @@
+"""Content-addressed cache for LLM chat completions.
+
+A completion is keyed by a SHA-256 of the canonical JSON of its request
+(model, messages, response_format and any other parameters), so the same
+routine text sent twice, or the same coach prompt, is answered without a
+second call. Entries live in an in-memory LRU and, when LLM_CACHE_PATH is
+set, in an SQLite file that survives restarts. Both tiers expire entries
+after LLM_CACHE_TTL seconds and evict the oldest once they are full.
+
+Identical requests made while one is still in flight don't start a call
+of their own: they wait for the first and, when streaming, receive its
+deltas as they arrive. The `coalesced` metric counts them.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable
+
+from lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")  # unset: memory only
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+MEMORY_ENTRIES = 256
+DISK_ENTRIES = 5000
+
+
+def cache_key(**request) -> str:
+    """SHA-256 of the request's canonical JSON form."""
+    canonical = json.dumps(
+        request, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """One call in progress and everyone waiting for its answer."""
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.waiters = 0
+        self.parts: list[str] = []
+        self.content: str | None = None
+        self.error: Exception | None = None
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def add(self, delta: str):
+        self.parts.append(delta)
+        self._changed.set()
+
+    def finish(self, content: str):
+        self._end(content=content)
+
+    def fail(self, error: Exception):
+        self._end(error=error)
+
+    def abandon(self):
+        self._end()
+
+    def _end(self, content=None, error=None):
+        if self.done:
+            return
+        self.done = True
+        self.content = content
+        self.error = error
+        self._changed.set()
+
+    async def follow(self, on_text) -> str:
+        """Pass every delta (so far and to come) to on_text; the content.
+
+        Raises the call's error if it failed.
+        """
+        sent = 0
+        while True:
+            while sent < len(self.parts):
+                if on_text is not None:
+                    await on_text(self.parts[sent])
+                sent += 1
+            if self.done:
+                break
+            self._changed.clear()
+            await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+        return self.content
+
+
+class LLMCache:
+    def __init__(
+        self,
+        path: str | None = LLM_CACHE_PATH,
+        ttl: float = LLM_CACHE_TTL,
+        memory_entries: int = MEMORY_ENTRIES,
+        disk_entries: int = DISK_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.disk_entries = disk_entries
+        # key -> (expires_at, content, tokens)
+        self._memory = LRUCache(memory_entries)
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        self._flights: dict[str, _Flight] = {}
+        self._tasks: set[asyncio.Task] = set()
+        # Metrics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.coalesced = 0  # calls that joined an identical one in flight
+        self.call_seconds = 0.0  # total latency of the calls that missed
+
+    async def complete(
+        self,
+        client,
+        *,
+        refresh: bool = False,
+        validate: Callable[[str], bool] | None = None,
+        key: str | None = None,
+        **request,
+    ) -> str:
+        """Content of client.chat.completions.create(**request), cached.
+
+        refresh skips the lookup (e.g. "regenerate as-is") but still stores
+        the new answer. Content failing `validate` is returned, not cached.
+        `key` replaces the request hash, e.g. to key an inlined image by
+        its digest.
+        """
+
+        async def call(emit):
+            response = await client.chat.completions.create(**request)
+            content = response.choices[0].message.content
+            if content:
+                emit(content)
+            return content, _total_tokens(response)
+
+        key = key or cache_key(**request)
+        return await self._single_flight(key, refresh, validate, None, call)
+
+    async def stream(
+        self,
+        client,
+        on_text: Callable[[str], Awaitable],
+        *,
+        refresh: bool = False,
+        validate: Callable[[str], bool] | None = None,
+        key: str | None = None,
+        **request,
+    ) -> str:
+        """Like complete(), but streamed: on_text is awaited with each delta.
+
+        A cached answer is passed to on_text in one piece. A stream that
+        stops early returns what arrived (and fails `validate`, if given).
+        """
+
+        async def call(emit):
+            parts = []
+            tokens = 0
+            stream = await client.chat.completions.create(stream=True, **request)
+            try:
+                async for chunk in stream:
+                    # Only some providers send usage, on the last chunk
+                    tokens = _total_tokens(chunk) or tokens
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        emit(delta)
+            finally:
+                # Free the connection (and gateway slot) if we stopped early
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    await close()
+            return "".join(parts), tokens
+
+        key = key or cache_key(**request)
+        return await self._single_flight(key, refresh, validate, on_text, call)
+
+    async def _single_flight(self, key, refresh, validate, on_text, call) -> str:
+        """Serve `key` from the cache, an identical call in flight, or call()."""
+        if not refresh:
+            content = await self.get(key)
+            if content is not None:
+                if on_text is not None:
+                    await on_text(content)
+                return content
+
+        # Single flight: identical concurrent requests (a double-tapped
+        # "Regenerate", a re-sent routine) wait on the first one's call
+        flight = self._flights.get(key)
+        if flight is None or flight.task.done() or flight.task.cancelling():
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._call(key, flight, call, validate))
+            self._tasks.add(flight.task)
+            flight.task.add_done_callback(self._tasks.discard)
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            return await flight.follow(on_text)
+        finally:
+            flight.waiters -= 1
+            # Nobody wants the answer any more (e.g. /cancel): stop the call
+            if flight.waiters == 0 and not flight.done:
+                flight.task.cancel()
+
+    async def _call(self, key, flight, call, validate):
+        """Make the flight's call (as a task, so no single waiter owns it)."""
+        self.misses += 1
+        start = time.perf_counter()
+        try:
+            try:
+                content, tokens = await call(flight.add)
+            except Exception as e:
+                flight.fail(e)
+                return
+            self.call_seconds += time.perf_counter() - start
+            # Stored before anyone gets the answer, so a caller that closes
+            # the cache next never cuts off the write
+            try:
+                await self._store(key, content, tokens, validate)
+            except Exception as e:
+                logger.warning(f"Could not cache LLM answer: {e}")
+            flight.finish(content)
+        finally:
+            flight.abandon()
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def get(self, key: str) -> str | None:
+        now = time.time()
+        entry = self._memory.get(key, None)
+        if entry is not None:
+            expires_at, content, tokens = entry
+            if expires_at > now:
+                self.memory_hits += 1
+                self.tokens_saved += tokens
+                return content
+            self._memory.pop(key)
+
+        if self.path is None:
+            return None
+        row = await self._run(self._fetch_sync, key, now)
+        if row is None:
+            return None
+        expires_at, content, tokens = row
+        self._memory.put(key, (expires_at, content, tokens))
+        self.disk_hits += 1
+        self.tokens_saved += tokens
+        return content
+
+    async def _store(self, key, content, tokens, validate):
+        if content and (validate is None or validate(content)):
+            await self.put(key, content, tokens)
+
+    async def put(self, key: str, content: str, tokens: int = 0):
+        expires_at = time.time() + self.ttl
+        self._memory.put(key, (expires_at, content, tokens))
+        if self.path is not None:
+            await self._run(self._store_sync, key, expires_at, content, tokens)
+
+    def snapshot(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        avg_call = self.call_seconds / self.misses if self.misses else 0.0
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "coalesced": self.coalesced,
+            # Estimated from the average latency of the calls that were made
+            "seconds_saved": hits * avg_call,
+            "memory_entries": len(self._memory),
+        }
+
+    def clear(self):
+        """Drop the in-memory tier (the SQLite file is left alone)."""
+        self._memory.clear()
+
+    async def close(self):
+        # Let calls in flight finish their writes first
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+
+    # --- SQLite tier ---
+
+    def _run(self, fn, *args):
+        def call():
+            with self._conn_lock:
+                if self._conn is None:
+                    self._open()
+                return fn(*args)
+
+        return asyncio.to_thread(call)
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, "
+            "content TEXT NOT NULL, tokens INTEGER NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def _fetch_sync(self, key, now):
+        return self._conn.execute(
+            "SELECT expires_at, content, tokens FROM llm_cache "
+            "WHERE key = ? AND expires_at > ?",
+            (key, now),
+        ).fetchone()
+
+    def _store_sync(self, key, expires_at, content, tokens):
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO llm_cache (key, expires_at, content, tokens) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "expires_at = excluded.expires_at, content = excluded.content, "
+                "tokens = excluded.tokens",
+                (key, expires_at, content, tokens),
+            )
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),)
+            )
+            # All entries share one TTL, so the earliest expiry is the oldest write
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache "
+                "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_entries,),
+            )
+
+
+def _total_tokens(response) -> int:
+    tokens = getattr(getattr(response, "usage", None), "total_tokens", 0)
+    return tokens if isinstance(tokens, int) else 0
+
+
+def is_json(content: str) -> bool:
+    try:
+        json.loads(content)
+    except ValueError:
+        return False
+    return True
+
+
+llm_cache = LLMCache()
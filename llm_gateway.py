@@ -0,0 +1,413 @@
+"""Shared, rate-limited access to the LLM API.
+
+Every AI flow gets its client from the gateway (through handlers.common's
+get_client(flow, user_id)) instead of its own AsyncOpenAI. The gateway owns
+one AsyncOpenAI on a pooled httpx client and wraps chat.completions.create
+with:
+
+- a global cap on concurrent calls (LLM_MAX_CONCURRENCY) and a smaller
+  per-user cap (LLM_MAX_PER_USER), held for the whole call or stream;
+- a per-flow deadline (FLOW_TIMEOUTS) covering the request and, for
+  streams, every chunk up to the last;
+- retries with exponential backoff for timeouts, connection errors, 429s
+  and 5xx responses (before the first streamed chunk only);
+- optional hedging (LLM_HEDGE=1): when a call outlives the flow's recent
+  p95 latency, a second identical call is started and the first to answer
+  wins;
+- a circuit breaker: after LLM_BREAKER_FAILURES consecutive failed calls
+  (timeouts, connection errors, 429s, 5xx) calls fail at once with
+  CircuitOpenError for LLM_BREAKER_RESET seconds, after which calls are
+  let through again until one fails. Flows can check `breaker.is_open` to
+  skip the provider altogether.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+
+import httpx
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
+
+logger = logging.getLogger(__name__)
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.publicai.co/v1")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+LLM_MAX_PER_USER = int(os.getenv("LLM_MAX_PER_USER", 3))
+LLM_HEDGE = os.getenv("LLM_HEDGE") == "1"
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", 30))  # seconds
+
+# Seconds for a whole call (streams: until the last chunk)
+FLOW_TIMEOUTS = {
+    "template_text": 60.0,
+    "template_file": 90.0,
+    "coach": 90.0,
+}
+DEFAULT_TIMEOUT = 60.0
+MAX_RETRIES = 2
+RETRY_BACKOFF_SECONDS = 0.5  # doubled per attempt, plus jitter
+# Hedging needs this many latency samples of a flow before it kicks in
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+RETRYABLE_ERRORS = (
+    APITimeoutError,
+    APIConnectionError,
+    RateLimitError,
+    InternalServerError,
+    TimeoutError,
+)
+
+
+class CircuitOpenError(Exception):
+    """The provider is failing; the call was not attempted."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open -> closed."""
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset: float = LLM_BREAKER_RESET):
+        self.max_failures = failures
+        self.reset = reset
+        self.failures = 0
+        self.opened_at: float | None = None
+        # Metrics
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset:
+            return "open"
+        return "half-open"
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        # A failed trial call while half-open re-opens at once
+        if self.opened_at is not None or self.failures >= self.max_failures:
+            if self.state != "open":
+                self.trips += 1
+                logger.warning(f"LLM circuit opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+
+class _UserSlots:
+    __slots__ = ("semaphore", "users")
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0  # calls holding or waiting for a slot
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        api_key: str | None = None,
+        base_url: str = LLM_BASE_URL,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_per_user: int = LLM_MAX_PER_USER,
+        timeouts: dict[str, float] | None = None,
+        retries: int = MAX_RETRIES,
+        backoff: float = RETRY_BACKOFF_SECONDS,
+        hedge: bool = LLM_HEDGE,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.timeouts = {**FLOW_TIMEOUTS, **(timeouts or {})}
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self._openai: AsyncOpenAI | None = None
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._users: dict[int, _UserSlots] = {}
+        self._latencies: dict[str, deque] = {}
+        # Metrics
+        self.calls = 0
+        self.in_flight = 0
+        self.retried = 0
+        self.timeouts_hit = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def openai(self) -> AsyncOpenAI:
+        """The shared AsyncOpenAI, created on first use."""
+        if self._openai is None:
+            api_key = (
+                self.api_key
+                or os.getenv("OPENAI_API_KEY")
+                or os.getenv("API_TOKEN")
+                # Fallback for testing or incomplete setup
+                or "sk-dummy"
+            )
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency * 2,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                timeout=httpx.Timeout(max(self.timeouts.values(), default=DEFAULT_TIMEOUT)),
+            )
+            self._openai = AsyncOpenAI(
+                api_key=api_key,
+                base_url=self.base_url,
+                http_client=http_client,
+                max_retries=0,  # retried here, within the flow's deadline
+            )
+        return self._openai
+
+    def client(self, flow: str | None = None, user_id: int | None = None) -> "FlowClient":
+        """An AsyncOpenAI look-alike whose calls go through the gateway."""
+        return FlowClient(self, flow or "default", user_id)
+
+    async def aclose(self):
+        if self._openai is not None:
+            await self._openai.close()
+            self._openai = None
+
+    def p95(self, flow: str) -> float | None:
+        samples = self._latencies.get(flow)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "in_flight": self.in_flight,
+            "retried": self.retried,
+            "timeouts": self.timeouts_hit,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "breaker_rejected": self.breaker.rejected,
+            "p95_s": {flow: self.p95(flow) for flow in self._latencies},
+        }
+
+    # --- Calls ---
+
+    async def create(self, flow: str, user_id: int | None, **request):
+        """chat.completions.create with limits, deadline, retries and hedging.
+
+        For stream=True the returned stream keeps its concurrency slots
+        until it is exhausted or closed. Raises CircuitOpenError while the
+        breaker is open.
+        """
+        if self.breaker.is_open:
+            self.breaker.rejected += 1
+            raise CircuitOpenError("LLM provider unavailable; try again shortly")
+        deadline = asyncio.get_running_loop().time() + self.timeouts.get(
+            flow, DEFAULT_TIMEOUT
+        )
+        release = await self._acquire(user_id)
+        self.calls += 1
+        try:
+            response = await self._create_with_retries(flow, deadline, request)
+        except BaseException as e:
+            release()
+            if isinstance(e, RETRYABLE_ERRORS):
+                self.breaker.record_failure()
+            raise
+        if request.get("stream"):
+            # Judged once the stream ends
+            return _GuardedStream(self, response, deadline, release)
+        release()
+        self.breaker.record_success()
+        return response
+
+    async def _acquire(self, user_id):
+        slots = None
+        if user_id is not None:
+            slots = self._users.get(user_id)
+            if slots is None:
+                slots = self._users[user_id] = _UserSlots(self.max_per_user)
+            slots.users += 1
+        try:
+            if slots is not None:
+                await slots.semaphore.acquire()
+            try:
+                await self._global.acquire()
+            except BaseException:
+                if slots is not None:
+                    slots.semaphore.release()
+                raise
+        except BaseException:
+            self._drop_user(user_id, slots)
+            raise
+        self.in_flight += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            self.in_flight -= 1
+            self._global.release()
+            if slots is not None:
+                slots.semaphore.release()
+                self._drop_user(user_id, slots)
+
+        return release
+
+    def _drop_user(self, user_id, slots):
+        if slots is None:
+            return
+        slots.users -= 1
+        if slots.users == 0:
+            self._users.pop(user_id, None)
+
+    async def _create_with_retries(self, flow, deadline, request):
+        for attempt in range(self.retries + 1):
+            try:
+                async with asyncio.timeout_at(deadline):
+                    return await self._create_hedged(flow, request)
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, TimeoutError):
+                    self.timeouts_hit += 1
+                delay = self.backoff * 2**attempt * (1 + random.random() / 2)
+                loop_time = asyncio.get_running_loop().time()
+                if attempt == self.retries or loop_time + delay >= deadline:
+                    self.failures += 1
+                    raise
+                self.retried += 1
+                logger.warning(
+                    f"LLM call ({flow}) failed: {e!r}; retry {attempt + 1} in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+            except Exception:
+                self.failures += 1
+                raise
+
+    async def _create_hedged(self, flow, request):
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(self.openai.chat.completions.create(**request))]
+        hedge_after = self.p95(flow) if self.hedge else None
+        winner = None
+        try:
+            if hedge_after is not None:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+                if not done and not self._global.locked():
+                    # The hedge borrows a free global slot for its duration
+                    await self._global.acquire()
+                    self.hedges += 1
+                    hedge = asyncio.create_task(
+                        self.openai.chat.completions.create(**request)
+                    )
+                    hedge.add_done_callback(lambda _: self._global.release())
+                    tasks.append(hedge)
+            winner = await _first_success(tasks)
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif request.get("stream") and not task.cancelled() and task.exception() is None:
+                    # Both answered: drop the losing stream's connection
+                    await task.result().close()
+        if winner is not tasks[0]:
+            self.hedge_wins += 1
+        self._record(flow, time.perf_counter() - start)
+        return winner.result()
+
+    def _record(self, flow, seconds):
+        samples = self._latencies.get(flow)
+        if samples is None:
+            samples = self._latencies[flow] = deque(maxlen=LATENCY_WINDOW)
+        samples.append(seconds)
+
+
+async def _first_success(tasks: list[asyncio.Task]) -> asyncio.Task:
+    """The first task to succeed; the last error if all of them fail."""
+    pending = set(tasks)
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                return task
+            error = task.exception()
+    raise error
+
+
+class _GuardedStream:
+    """A streamed response that holds its concurrency slots until it ends."""
+
+    def __init__(self, gateway, stream, deadline, release):
+        self._gateway = gateway
+        self._stream = stream
+        self._iter = stream.__aiter__()
+        self._deadline = deadline
+        self._release = release
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            async with asyncio.timeout_at(self._deadline):
+                return await self._iter.__anext__()
+        except StopAsyncIteration:
+            self._gateway.breaker.record_success()
+            await self.close()
+            raise
+        except BaseException as e:
+            if isinstance(e, TimeoutError):
+                self._gateway.timeouts_hit += 1
+            if isinstance(e, RETRYABLE_ERRORS):
+                self._gateway.breaker.record_failure()
+            await self.close()
+            raise
+
+    async def close(self):
+        self._release()
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            try:
+                await close()
+            except Exception:
+                pass
+
+
+class FlowClient:
+    """Stands in for AsyncOpenAI: client.chat.completions.create(...) via the gateway."""
+
+    def __init__(self, gateway: LLMGateway, flow: str, user_id: int | None):
+        self.chat = self
+        self.completions = self
+        self._gateway = gateway
+        self._flow = flow
+        self._user_id = user_id
+
+    async def create(self, **request):
+        return await self._gateway.create(self._flow, self._user_id, **request)
+
+
+llm_gateway = LLMGateway()
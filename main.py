@@ -73,14 +73,46 @@ from handlers import (
     AI_COACH_REVIEW,
     AI_COACH_REGEN_COMMENT,
 )
+from handlers.ai_coach import EXERCISE_MUSCLE_MAP
+from handlers.ai_parser import fast_path_stats
+from handlers.common import AIJobResultHandler, message_tracker
+from handlers.workout_state import upgrade_legacy_workout
 from database import init_db
+from catalog import exercise_catalog
+from queries import check_query_plans
+from journal import set_journal
+from ai_jobs import ai_jobs
+from llm_cache import llm_cache
+from image_prep import image_stats
+from llm_gateway import llm_gateway
+from persistence import PostgresPersistence, SQLitePersistence
+from update_processor import PerUserUpdateProcessor
 from dotenv import load_dotenv
 
 load_dotenv()
 
 TOKEN = os.getenv("BOT_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
-persistence = PicklePersistence(filepath="storage.pickle")
+PERSISTENCE_BACKEND = os.getenv("PERSISTENCE_BACKEND", "postgres")  # sqlite, pickle
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "storage.sqlite3")
+# Imported into an empty sqlite/postgres store on first start
+LEGACY_PICKLE_PATH = "storage.pickle"
+# Keep each chat's tracked message id in bot_data so it survives a restart
+PERSIST_MESSAGE_TRACKER = os.getenv("PERSIST_MESSAGE_TRACKER", "1") == "1"
+UPDATE_METRICS_INTERVAL = 300  # seconds between update-processor metric logs
+
+
+def build_persistence():
+    if PERSISTENCE_BACKEND == "pickle":
+        return PicklePersistence(filepath=LEGACY_PICKLE_PATH)
+    if PERSISTENCE_BACKEND == "sqlite":
+        return SQLitePersistence(PERSISTENCE_PATH, legacy_pickle=LEGACY_PICKLE_PATH)
+    return PostgresPersistence(
+        shared=os.getenv("PERSISTENCE_SHARED") == "1", legacy_pickle=LEGACY_PICKLE_PATH
+    )
+
+
+persistence = build_persistence()
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
@@ -96,8 +128,10 @@ def main():
         ApplicationBuilder()
         .token(TOKEN)
         .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .job_queue(JobQueue())
         .persistence(persistence)
+        .concurrent_updates(PerUserUpdateProcessor())
         .build()
     )
 
@@ -161,7 +195,10 @@ def main():
                 CallbackQueryHandler(handle_delete_template_confirm, pattern="^etdel_"),
             ],
         },
-        fallbacks=[CommandHandler("cancel", cancel)],
+        fallbacks=[
+            CommandHandler("cancel", cancel),
+            AIJobResultHandler("template_text", "template_file"),
+        ],
     )
 
     workout_conv = ConversationHandler(
@@ -230,6 +267,7 @@ def main():
             ],
             AI_COACH_GOALS: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, ai_coach_goals),
+                CallbackQueryHandler(ai_coach_goals, pattern="^coach_quick$"),
             ],
             AI_COACH_REVIEW: [
                 CallbackQueryHandler(ai_coach_review, pattern="^coach_"),
@@ -239,7 +277,7 @@ def main():
                 CallbackQueryHandler(ai_coach_regen_comment, pattern="^coach_regen_skip$"),
             ],
         },
-        fallbacks=[CommandHandler("cancel", cancel)],
+        fallbacks=[CommandHandler("cancel", cancel), AIJobResultHandler("coach")],
     )
 
     application.add_handler(CommandHandler("start", start))
@@ -286,6 +324,43 @@ def main():
 
 async def post_init(application):
     await init_db()
+    await check_query_plans()
+    await exercise_catalog.load(EXERCISE_MUSCLE_MAP)
+    await set_journal.start()
+    await ai_jobs.start()
+    # Workouts persisted as nested dicts by older versions
+    upgraded = [
+        user_id
+        for user_id, user_data in application.user_data.items()
+        if upgrade_legacy_workout(user_data)
+    ]
+    if upgraded:
+        application.mark_data_for_update_persistence(user_ids=upgraded)
+        logging.getLogger(__name__).info(f"Upgraded {len(upgraded)} legacy workouts")
+    if PERSIST_MESSAGE_TRACKER and application.persistence is not None:
+        message_tracker.attach(application.bot_data.setdefault("last_messages", {}))
+    application.job_queue.run_repeating(
+        log_update_metrics,
+        interval=UPDATE_METRICS_INTERVAL,
+        first=UPDATE_METRICS_INTERVAL,
+    )
+
+
+async def log_update_metrics(context):
+    stats = context.application.update_processor.snapshot()
+    logging.getLogger(__name__).info(f"Update processor: {stats}")
+    logging.getLogger(__name__).info(f"AI jobs: {ai_jobs.snapshot()}")
+    logging.getLogger(__name__).info(f"LLM cache: {llm_cache.snapshot()}")
+    logging.getLogger(__name__).info(f"Template fast path: {fast_path_stats.snapshot()}")
+    logging.getLogger(__name__).info(f"Vision images: {image_stats.snapshot()}")
+    logging.getLogger(__name__).info(f"LLM gateway: {llm_gateway.snapshot()}")
+
+
+async def post_shutdown(application):
+    await ai_jobs.stop()
+    await llm_cache.close()
+    await llm_gateway.aclose()
+    await set_journal.stop()
 
 
 if __name__ == "__main__":
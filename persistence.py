@@ -0,0 +1,434 @@
+"""Key-value persistence for user/chat/bot data and conversation states.
+
+PicklePersistence rewrites one file holding every user's data. Here each
+entry is its own record keyed by (kind, key), and only entries whose contents
+changed since they were last written are stored. All changes handed over by
+one Application.update_persistence run go out as a single batch, so flush
+cost follows active users rather than total users.
+
+Two stores are provided: PostgresPersistence (the `persistence_entries`
+table, shareable between bot instances) and SQLitePersistence (an embedded
+WAL-mode database file for single-node deploys). Given `legacy_pickle`, a
+store that is still empty imports that storage.pickle the first time it is
+loaded, so switching backends does not start the bot with no state.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from abc import abstractmethod
+
+from sqlalchemy import select, delete, tuple_, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from telegram.ext import BasePersistence, PersistenceInput, PicklePersistence
+
+from database import engine, PersistenceEntry
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = "user_data"
+CHAT_DATA = "chat_data"
+BOT_DATA = "bot_data"
+CALLBACK_DATA = "callback_data"
+CONVERSATION_PREFIX = "conversation:"
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _conversation_key(key: tuple) -> str:
+    return json.dumps(list(key))
+
+
+class KeyValuePersistence(BasePersistence):
+    """BasePersistence storing one record per user, chat and conversation key.
+
+    Subclasses provide the store: _setup, _is_empty, _fetch_all, _fetch_one
+    and _store. With `shared=True` user, chat and bot data are re-read before
+    each update, for stores that several bot instances write to.
+    """
+
+    def __init__(
+        self,
+        store_data: PersistenceInput | None = None,
+        update_interval: float = 60,
+        shared: bool = False,
+        legacy_pickle: str | None = None,
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.shared = shared
+        self.legacy_pickle = legacy_pickle
+        self._ready = False
+        self._written: dict[tuple[str, str], bytes] = {}  # digest of stored value
+        self._dirty: dict[tuple[str, str], bytes | None] = {}  # None = delete
+        self._write_lock = asyncio.Lock()
+
+    # --- Store interface ---
+
+    @abstractmethod
+    async def _setup(self):
+        """Create the backing table if needed."""
+
+    @abstractmethod
+    async def _is_empty(self) -> bool:
+        """Whether nothing at all is stored yet."""
+
+    @abstractmethod
+    async def _fetch_all(self, kind: str) -> dict[str, bytes]:
+        """Every stored key of `kind` with its pickled value."""
+
+    @abstractmethod
+    async def _fetch_one(self, kind: str, key: str) -> bytes | None:
+        """The pickled value of one entry, None if it isn't stored."""
+
+    @abstractmethod
+    async def _store(self, upserts: list[dict], deletes: list[tuple[str, str]]):
+        """Write `upserts` ({kind, key, data} dicts) and `deletes` atomically."""
+
+    # --- Change tracking ---
+
+    async def _load(self, kind: str) -> dict[str, bytes]:
+        # Persistence is loaded before post_init runs
+        if not self._ready:
+            await self._setup()
+            self._ready = True
+            await self._import_legacy_pickle()
+        rows = await self._fetch_all(kind)
+        for key, data in rows.items():
+            self._written[(kind, key)] = _digest(data)
+        return rows
+
+    def _mark(self, kind: str, key: str, value):
+        """Queue `value` for writing unless it matches what is stored already."""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        entry = (kind, key)
+        if self._written.get(entry) == _digest(data) and entry not in self._dirty:
+            return
+        self._dirty[entry] = data
+
+    def _mark_deleted(self, kind: str, key: str):
+        entry = (kind, key)
+        if entry in self._written or entry in self._dirty:
+            self._dirty[entry] = None
+
+    async def _write_dirty(self):
+        # Let the other update_* calls of this persistence run queue their
+        # changes first, so they all go out in one batch.
+        await asyncio.sleep(0)
+        async with self._write_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            upserts = [
+                {"kind": kind, "key": key, "data": data}
+                for (kind, key), data in batch.items()
+                if data is not None
+            ]
+            deletes = [entry for entry, data in batch.items() if data is None]
+            try:
+                await self._store(upserts, deletes)
+            except Exception:
+                # Keep the batch for the next run unless it was superseded
+                for entry, data in batch.items():
+                    self._dirty.setdefault(entry, data)
+                raise
+            for entry, data in batch.items():
+                if data is None:
+                    self._written.pop(entry, None)
+                else:
+                    self._written[entry] = _digest(data)
+            logger.debug(
+                f"Persistence flush: {len(upserts)} written, {len(deletes)} deleted"
+            )
+
+    async def import_data(
+        self,
+        user_data: dict,
+        chat_data: dict,
+        bot_data: dict | None = None,
+        callback_data=None,
+        conversations: dict | None = None,
+    ):
+        """Store a complete snapshot (e.g. from storage.pickle) in one batch."""
+        if not self._ready:
+            await self._setup()
+            self._ready = True
+        for user_id, data in user_data.items():
+            self._mark(USER_DATA, str(user_id), data)
+        for chat_id, data in chat_data.items():
+            self._mark(CHAT_DATA, str(chat_id), data)
+        if bot_data:
+            self._mark(BOT_DATA, "", bot_data)
+        if callback_data is not None:
+            self._mark(CALLBACK_DATA, "", callback_data)
+        for name, states in (conversations or {}).items():
+            for key, state in states.items():
+                self._mark(CONVERSATION_PREFIX + name, _conversation_key(key), state)
+        await self._write_dirty()
+
+    async def import_pickle(self, path: str) -> int:
+        """Copy a PicklePersistence file into the store; return the user count."""
+        pickled = PicklePersistence(filepath=path)
+        user_data = await pickled.get_user_data()
+        await self.import_data(
+            user_data,
+            await pickled.get_chat_data(),
+            bot_data=await pickled.get_bot_data(),
+            callback_data=await pickled.get_callback_data(),
+            conversations=pickled.conversations,
+        )
+        return len(user_data)
+
+    async def _import_legacy_pickle(self):
+        if not self.legacy_pickle or not os.path.exists(self.legacy_pickle):
+            return
+        if not await self._is_empty():
+            return
+        users = await self.import_pickle(self.legacy_pickle)
+        logger.warning(
+            f"Imported {users} users from {self.legacy_pickle} into the empty "
+            f"{type(self).__name__} store"
+        )
+
+    # --- BasePersistence: loading ---
+
+    async def get_user_data(self) -> dict[int, dict]:
+        rows = await self._load(USER_DATA)
+        return {int(key): pickle.loads(data) for key, data in rows.items()}
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        rows = await self._load(CHAT_DATA)
+        return {int(key): pickle.loads(data) for key, data in rows.items()}
+
+    async def get_bot_data(self) -> dict:
+        rows = await self._load(BOT_DATA)
+        return pickle.loads(rows[""]) if "" in rows else {}
+
+    async def get_callback_data(self):
+        rows = await self._load(CALLBACK_DATA)
+        return pickle.loads(rows[""]) if "" in rows else None
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = await self._load(CONVERSATION_PREFIX + name)
+        return {
+            tuple(json.loads(key)): pickle.loads(data) for key, data in rows.items()
+        }
+
+    # --- BasePersistence: updates ---
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._mark(USER_DATA, str(user_id), data)
+        await self._write_dirty()
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        self._mark(CHAT_DATA, str(chat_id), data)
+        await self._write_dirty()
+
+    async def update_bot_data(self, data: dict):
+        self._mark(BOT_DATA, "", data)
+        await self._write_dirty()
+
+    async def update_callback_data(self, data):
+        self._mark(CALLBACK_DATA, "", data)
+        await self._write_dirty()
+
+    async def update_conversation(self, name: str, key: tuple, new_state):
+        kind, row_key = CONVERSATION_PREFIX + name, _conversation_key(key)
+        if new_state is None:
+            self._mark_deleted(kind, row_key)
+        else:
+            self._mark(kind, row_key, new_state)
+        await self._write_dirty()
+
+    async def drop_user_data(self, user_id: int):
+        self._mark_deleted(USER_DATA, str(user_id))
+        await self._write_dirty()
+
+    async def drop_chat_data(self, chat_id: int):
+        self._mark_deleted(CHAT_DATA, str(chat_id))
+        await self._write_dirty()
+
+    # --- BasePersistence: refresh (only needed when instances share state) ---
+
+    async def _refresh(self, kind: str, key: str, data: dict):
+        if not self.shared:
+            return
+        stored = await self._fetch_one(kind, key)
+        if stored is None or self._written.get((kind, key)) == _digest(stored):
+            return
+        data.clear()
+        data.update(pickle.loads(stored))
+        self._written[(kind, key)] = _digest(stored)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        await self._refresh(USER_DATA, str(user_id), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        await self._refresh(CHAT_DATA, str(chat_id), chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict):
+        await self._refresh(BOT_DATA, "", bot_data)
+
+    async def flush(self):
+        await self._write_dirty()
+
+
+class PostgresPersistence(KeyValuePersistence):
+    """Rows in the persistence_entries table, through the app's async engine."""
+
+    def __init__(
+        self,
+        store_data: PersistenceInput | None = None,
+        update_interval: float = 60,
+        shared: bool = False,
+        db_engine=engine,
+        legacy_pickle: str | None = None,
+    ):
+        super().__init__(
+            store_data=store_data,
+            update_interval=update_interval,
+            shared=shared,
+            legacy_pickle=legacy_pickle,
+        )
+        self._engine = db_engine
+
+    async def _setup(self):
+        async with self._engine.begin() as conn:
+            await conn.run_sync(PersistenceEntry.__table__.create, checkfirst=True)
+
+    async def _is_empty(self) -> bool:
+        async with self._engine.connect() as conn:
+            result = await conn.execute(select(PersistenceEntry.kind).limit(1))
+            return result.first() is None
+
+    async def _fetch_all(self, kind: str) -> dict[str, bytes]:
+        async with self._engine.connect() as conn:
+            result = await conn.execute(
+                select(PersistenceEntry.key, PersistenceEntry.data).where(
+                    PersistenceEntry.kind == kind
+                )
+            )
+            return {key: data for key, data in result.all()}
+
+    async def _fetch_one(self, kind: str, key: str) -> bytes | None:
+        async with self._engine.connect() as conn:
+            result = await conn.execute(
+                select(PersistenceEntry.data).where(
+                    PersistenceEntry.kind == kind, PersistenceEntry.key == key
+                )
+            )
+            return result.scalar_one_or_none()
+
+    async def _store(self, upserts: list[dict], deletes: list[tuple[str, str]]):
+        async with self._engine.begin() as conn:
+            if upserts:
+                stmt = pg_insert(PersistenceEntry)
+                await conn.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[PersistenceEntry.kind, PersistenceEntry.key],
+                        set_={"data": stmt.excluded.data, "updated_at": func.now()},
+                    ),
+                    upserts,
+                )
+            if deletes:
+                await conn.execute(
+                    delete(PersistenceEntry).where(
+                        tuple_(PersistenceEntry.kind, PersistenceEntry.key).in_(deletes)
+                    )
+                )
+
+
+class SQLitePersistence(KeyValuePersistence):
+    """Records in an embedded SQLite database (WAL mode, one row per entry).
+
+    sqlite3 calls run in a worker thread so they never block the event loop.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        store_data: PersistenceInput | None = None,
+        update_interval: float = 60,
+        legacy_pickle: str | None = None,
+    ):
+        super().__init__(
+            store_data=store_data,
+            update_interval=update_interval,
+            legacy_pickle=legacy_pickle,
+        )
+        self.path = path
+        self._conn = None
+        self._conn_lock = threading.Lock()
+
+    def _run(self, fn, *args):
+        def call():
+            with self._conn_lock:
+                return fn(*args)
+
+        return asyncio.to_thread(call)
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL stays consistent on power loss, only the last commits can be lost
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS persistence_entries ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, data BLOB NOT NULL, "
+            "PRIMARY KEY (kind, key)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    async def _setup(self):
+        if self._conn is None:
+            await self._run(self._open)
+
+    async def _is_empty(self) -> bool:
+        row = await self._run(
+            lambda: self._conn.execute("SELECT 1 FROM persistence_entries LIMIT 1").fetchone()
+        )
+        return row is None
+
+    async def _fetch_all(self, kind: str) -> dict[str, bytes]:
+        rows = await self._run(
+            lambda: self._conn.execute(
+                "SELECT key, data FROM persistence_entries WHERE kind = ?", (kind,)
+            ).fetchall()
+        )
+        return dict(rows)
+
+    async def _fetch_one(self, kind: str, key: str) -> bytes | None:
+        row = await self._run(
+            lambda: self._conn.execute(
+                "SELECT data FROM persistence_entries WHERE kind = ? AND key = ?",
+                (kind, key),
+            ).fetchone()
+        )
+        return row[0] if row else None
+
+    def _store_sync(self, upserts, deletes):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO persistence_entries (kind, key, data) VALUES (?, ?, ?) "
+                "ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data",
+                [(row["kind"], row["key"], row["data"]) for row in upserts],
+            )
+            self._conn.executemany(
+                "DELETE FROM persistence_entries WHERE kind = ? AND key = ?", deletes
+            )
+
+    async def _store(self, upserts: list[dict], deletes: list[tuple[str, str]]):
+        await self._setup()
+        await self._run(self._store_sync, upserts, deletes)
+
+    async def flush(self):
+        await super().flush()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
@@ -0,0 +1,560 @@
+"""Query layer for the hot workout_logs / workout_sessions access paths.
+
+Each builder is shaped to be served by one of the composite indexes declared
+in database.py, and check_query_plans() verifies that at startup. Batched log
+inserts also maintain the daily_workout_summary rollup and the
+user_exercise_last table in the same transaction, so /history never has to
+scan individual sets and the set screen reads "Previous" by primary key
+(through an in-process LRU in front of it).
+"""
+
+import datetime
+import logging
+
+from sqlalchemy import (
+    select,
+    desc,
+    update,
+    text,
+    func,
+    cast,
+    distinct,
+    tuple_,
+    literal_column,
+    DateTime,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from database import (
+    engine,
+    AsyncSessionLocal,
+    WorkoutLog,
+    WorkoutSession,
+    DailyWorkoutSummary,
+    UserExerciseLast,
+    Exercise,
+    REBUILD_DAILY_SUMMARY,
+)
+from lru import LRUCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+LAST_PERFORMANCE_CACHE_SIZE = 10_000
+
+# (user_id, exercise_name) -> (sets, weight, reps), or None for no history
+last_performance_cache = LRUCache(LAST_PERFORMANCE_CACHE_SIZE)
+
+ONE_DAY = literal_column("interval '1 day'")
+
+
+def last_log_query(user_id: int, exercise_name: str):
+    """Most recent log for one exercise (ix_workout_logs_user_exercise_ts)."""
+    return (
+        select(WorkoutLog)
+        .where(
+            WorkoutLog.user_id == user_id,
+            WorkoutLog.exercise_name == exercise_name,
+        )
+        .order_by(desc(WorkoutLog.timestamp))
+        .limit(1)
+    )
+
+
+def exercise_last_query(user_id: int, exercise_name: str):
+    """Last performance for one exercise (user_exercise_last pkey)."""
+    return select(UserExerciseLast).where(
+        UserExerciseLast.user_id == user_id,
+        UserExerciseLast.exercise_name == exercise_name,
+    )
+
+
+def exercises_last_query(user_id: int, exercise_names: list[str]):
+    """Last performance for many exercises at once (user_exercise_last pkey)."""
+    return select(UserExerciseLast).where(
+        UserExerciseLast.user_id == user_id,
+        UserExerciseLast.exercise_name.in_(exercise_names),
+    )
+
+
+def latest_logs_query(user_id: int, exercise_names: list[str]):
+    """Newest log of each exercise in one pass (DISTINCT ON over
+    ix_workout_logs_user_exercise_ts)."""
+    return (
+        select(WorkoutLog)
+        .where(
+            WorkoutLog.user_id == user_id,
+            WorkoutLog.exercise_name.in_(exercise_names),
+        )
+        .order_by(WorkoutLog.exercise_name, desc(WorkoutLog.timestamp))
+        .distinct(WorkoutLog.exercise_name)
+    )
+
+
+def muscle_group_volume_query(user_id: int, since: datetime.datetime):
+    """Sets and volume per muscle group since `since`, via the exercise catalog."""
+    return (
+        select(
+            Exercise.muscle_group,
+            func.sum(WorkoutLog.sets).label("set_count"),
+            func.sum(WorkoutLog.sets * WorkoutLog.weight * WorkoutLog.reps).label(
+                "volume"
+            ),
+        )
+        .join(Exercise, WorkoutLog.exercise_id == Exercise.id)
+        .where(WorkoutLog.user_id == user_id)
+        .where(WorkoutLog.timestamp >= since)
+        .group_by(Exercise.muscle_group)
+    )
+
+
+def session_logs_query(session_id: int):
+    """All logs of one workout session (ix_workout_logs_session)."""
+    return (
+        select(WorkoutLog)
+        .where(WorkoutLog.session_id == session_id)
+        .order_by(WorkoutLog.timestamp)
+    )
+
+
+def session_summary_query(user_id: int, since: datetime.date):
+    """Workout sessions rolled up since `since`, newest first (daily_workout_summary pkey).
+
+    The daily rows of a session that crosses midnight are summed into one row,
+    dated by the day it started.
+    """
+    return (
+        select(
+            DailyWorkoutSummary.session_id,
+            func.min(DailyWorkoutSummary.day).label("day"),
+            func.max(DailyWorkoutSummary.template_name).label("template_name"),
+            func.sum(DailyWorkoutSummary.set_count).label("set_count"),
+            func.sum(DailyWorkoutSummary.exercise_count).label("exercise_count"),
+            func.sum(DailyWorkoutSummary.volume).label("volume"),
+        )
+        .where(DailyWorkoutSummary.user_id == user_id)
+        .where(DailyWorkoutSummary.day >= since)
+        .group_by(DailyWorkoutSummary.session_id)
+        .order_by(desc("day"), desc(DailyWorkoutSummary.session_id))
+    )
+
+
+def summary_day(timestamp: datetime.datetime) -> datetime.date:
+    """The UTC day a log timestamp is rolled up under."""
+    if timestamp.tzinfo is None:
+        return timestamp.date()
+    return timestamp.astimezone(datetime.timezone.utc).date()
+
+
+def summarize_logs(rows: list[dict]) -> list[dict]:
+    """Aggregate workout_logs rows into daily_workout_summary increments.
+
+    Rows without a session are skipped; the workout-sessions backfill assigns
+    them one and backfill_daily_summary rolls them up afterwards.
+    """
+    summaries = {}
+    for row in rows:
+        if row.get("session_id") is None:
+            continue
+        timestamp = row.get("timestamp") or datetime.datetime.now(datetime.timezone.utc)
+        key = (row["user_id"], summary_day(timestamp), row["session_id"])
+        summary = summaries.setdefault(
+            key,
+            {
+                "template_name": row.get("template_name") or "",
+                "set_count": 0,
+                "volume": 0.0,
+                "exercises": set(),
+            },
+        )
+        summary["set_count"] += row["sets"]
+        summary["volume"] += row["sets"] * row["weight"] * row["reps"]
+        summary["exercises"].add(row["exercise_name"])
+    return [
+        {
+            "user_id": user_id,
+            "day": day,
+            "session_id": session_id,
+            "template_name": summary["template_name"],
+            "set_count": summary["set_count"],
+            "exercise_count": len(summary["exercises"]),
+            "volume": summary["volume"],
+        }
+        for (user_id, day, session_id), summary in summaries.items()
+    ]
+
+
+def _upsert_daily_summary(summaries: list[dict]):
+    stmt = pg_insert(DailyWorkoutSummary).values(summaries)
+    return stmt.on_conflict_do_update(
+        index_elements=[
+            DailyWorkoutSummary.user_id,
+            DailyWorkoutSummary.day,
+            DailyWorkoutSummary.session_id,
+        ],
+        set_={
+            "template_name": stmt.excluded.template_name,
+            "set_count": DailyWorkoutSummary.set_count + stmt.excluded.set_count,
+            "volume": DailyWorkoutSummary.volume + stmt.excluded.volume,
+        },
+    )
+
+
+def _recount_daily_exercises(summaries: list[dict]):
+    """Distinct exercises can't be summed across batches, so the touched days
+    are recounted from their own logs. The day is matched as a timestamp range
+    so the (user_id, timestamp) index stays usable."""
+    day_start = func.timezone("UTC", cast(DailyWorkoutSummary.day, DateTime))
+    exercise_count = (
+        select(func.count(distinct(WorkoutLog.exercise_name)))
+        .where(WorkoutLog.user_id == DailyWorkoutSummary.user_id)
+        .where(WorkoutLog.timestamp >= day_start)
+        .where(WorkoutLog.timestamp < day_start + ONE_DAY)
+        .where(WorkoutLog.session_id == DailyWorkoutSummary.session_id)
+        .scalar_subquery()
+    )
+    keys = [(s["user_id"], s["day"], s["session_id"]) for s in summaries]
+    return (
+        update(DailyWorkoutSummary)
+        .where(
+            tuple_(
+                DailyWorkoutSummary.user_id,
+                DailyWorkoutSummary.day,
+                DailyWorkoutSummary.session_id,
+            ).in_(keys)
+        )
+        .values(exercise_count=exercise_count)
+    )
+
+
+def _latest_per_exercise(rows: list[dict]) -> list[dict]:
+    """The newest row of each (user, exercise) in a batch, as user_exercise_last rows."""
+    latest = {}
+    for row in rows:
+        key = (row["user_id"], row["exercise_name"])
+        timestamp = row.get("timestamp") or datetime.datetime.now(datetime.timezone.utc)
+        if key not in latest or timestamp >= latest[key]["timestamp"]:
+            latest[key] = {
+                "user_id": row["user_id"],
+                "exercise_name": row["exercise_name"],
+                "sets": row["sets"],
+                "weight": row["weight"],
+                "reps": row["reps"],
+                "timestamp": timestamp,
+            }
+    return list(latest.values())
+
+
+def _upsert_exercise_last(rows: list[dict]):
+    stmt = pg_insert(UserExerciseLast).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[UserExerciseLast.user_id, UserExerciseLast.exercise_name],
+        set_={
+            "sets": stmt.excluded.sets,
+            "weight": stmt.excluded.weight,
+            "reps": stmt.excluded.reps,
+            "timestamp": stmt.excluded.timestamp,
+        },
+        # Replayed or late batches must not overwrite a newer performance
+        where=UserExerciseLast.timestamp <= stmt.excluded.timestamp,
+    )
+
+
+async def get_last_performance(user_id: int, exercise_name: str):
+    """Return (sets, weight, reps) of the last logged set, or None.
+
+    Served from the LRU when possible, then user_exercise_last, and only for
+    users not yet backfilled from workout_logs itself.
+    """
+    key = (user_id, exercise_name)
+    cached = last_performance_cache.get(key)
+    if cached is not MISSING:
+        return cached
+
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(exercise_last_query(user_id, exercise_name))
+        last = result.scalar_one_or_none()
+        if last is None:
+            result = await session.execute(last_log_query(user_id, exercise_name))
+            last = result.scalar_one_or_none()
+
+    performance = (last.sets, last.weight, last.reps) if last else None
+    last_performance_cache.put(key, performance)
+    return performance
+
+
+async def get_last_performances(
+    user_id: int, exercise_names: list[str], session=None
+) -> dict:
+    """Batch version of get_last_performance for a whole template.
+
+    Returns {exercise_name: (sets, weight, reps) or None}. Names missing from
+    the LRU are fetched with a single user_exercise_last query, plus one
+    DISTINCT ON query over workout_logs for any still unknown. Pass `session`
+    to reuse an open session.
+    """
+    performances = {}
+    missing = []
+    for name in dict.fromkeys(exercise_names):
+        cached = last_performance_cache.get((user_id, name))
+        if cached is MISSING:
+            missing.append(name)
+        else:
+            performances[name] = cached
+    if not missing:
+        return performances
+
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            fetched = await _fetch_last_performances(session, user_id, missing)
+    else:
+        fetched = await _fetch_last_performances(session, user_id, missing)
+
+    for name in missing:
+        performance = fetched.get(name)
+        last_performance_cache.put((user_id, name), performance)
+        performances[name] = performance
+    return performances
+
+
+async def _fetch_last_performances(session, user_id, exercise_names):
+    result = await session.execute(exercises_last_query(user_id, exercise_names))
+    fetched = {
+        last.exercise_name: (last.sets, last.weight, last.reps)
+        for last in result.scalars().all()
+    }
+    unknown = [name for name in exercise_names if name not in fetched]
+    if unknown:
+        result = await session.execute(latest_logs_query(user_id, unknown))
+        for log in result.scalars().all():
+            fetched[log.exercise_name] = (log.sets, log.weight, log.reps)
+    return fetched
+
+
+async def save_workout_logs(rows: list[dict]) -> int:
+    """Insert many workout_logs rows in one statement and one commit.
+
+    Rows whose journal_id is already stored are skipped, so a replayed batch
+    is never written twice. The daily summary rollup and user_exercise_last
+    are updated from the inserted rows in the same transaction, and the
+    affected last-performance cache entries are dropped once it commits.
+    Returns the number of rows written.
+    """
+    if not rows:
+        return 0
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            pg_insert(WorkoutLog)
+            .on_conflict_do_nothing(index_elements=[WorkoutLog.journal_id])
+            .returning(WorkoutLog.journal_id),
+            rows,
+        )
+        inserted = set(result.scalars().all())
+        rows = [
+            row
+            for row in rows
+            if row.get("journal_id") is None or row["journal_id"] in inserted
+        ]
+        if not rows:
+            await session.commit()
+            return 0
+        summaries = summarize_logs(rows)
+        if summaries:
+            await session.execute(_upsert_daily_summary(summaries))
+            await session.execute(_recount_daily_exercises(summaries))
+        latest = _latest_per_exercise(rows)
+        await session.execute(_upsert_exercise_last(latest))
+        await session.commit()
+    for row in latest:
+        last_performance_cache.pop((row["user_id"], row["exercise_name"]))
+    logger.info(f"save_workout_logs: wrote {len(rows)} rows")
+    return len(rows)
+
+
+async def stored_journal_ids(journal_ids: list[str]) -> set[str]:
+    """Return the set journal entry ids that already have a workout_logs row."""
+    if not journal_ids:
+        return set()
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(WorkoutLog.journal_id).where(WorkoutLog.journal_id.in_(journal_ids))
+        )
+        return set(result.scalars().all())
+
+
+async def finalize_workout_session(
+    session_id: int, set_count: int, total_volume: float
+):
+    """Close a workout session with its final set count and volume."""
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(WorkoutSession)
+            .where(WorkoutSession.id == session_id)
+            .values(
+                ended_at=datetime.datetime.now(datetime.timezone.utc),
+                set_count=set_count,
+                total_volume=total_volume,
+            )
+        )
+        await session.commit()
+
+
+async def bump_template_weights(
+    user_id: int, delta: float = 2.5, template_id: int | None = None
+) -> int:
+    """Add `delta` kg to every loaded set of a user's templates in one UPDATE.
+
+    Limited to one template when `template_id` is given. Bodyweight sets (weight
+    0) are left alone. Returns the number of template exercises changed.
+    """
+    params = {"user_id": user_id, "delta": delta}
+    template_filter = ""
+    if template_id is not None:
+        template_filter = "AND t.id = :template_id "
+        params["template_id"] = template_id
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            text(
+                "UPDATE template_exercises AS te SET "
+                "default_weight = CASE WHEN te.default_weight > 0 "
+                "THEN te.default_weight + :delta ELSE te.default_weight END, "
+                "sets_config = CASE WHEN te.sets_config IS NULL THEN NULL ELSE "
+                "(SELECT coalesce(jsonb_agg(CASE WHEN (s->>'weight')::numeric > 0 "
+                "THEN jsonb_set(s, '{weight}', to_jsonb((s->>'weight')::numeric + :delta)) "
+                "ELSE s END ORDER BY ord), '[]'::jsonb) "
+                "FROM jsonb_array_elements(te.sets_config) WITH ORDINALITY AS e(s, ord)) "
+                "END "
+                "FROM templates AS t "
+                "WHERE te.template_id = t.id AND t.user_id = :user_id "
+                + template_filter
+            ),
+            params,
+        )
+        await session.commit()
+    logger.info(f"bump_template_weights: {result.rowcount} exercises +{delta}kg")
+    return result.rowcount
+
+
+async def backfill_workout_sessions() -> int:
+    """Group legacy logs without a session by (user, day, template) into sessions.
+
+    Returns the number of sessions created.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            text(
+                "INSERT INTO workout_sessions "
+                "(user_id, template_name, started_at, ended_at, set_count, total_volume) "
+                "SELECT user_id, template_name, min(timestamp), max(timestamp), "
+                "count(*), sum(sets * weight * reps) "
+                "FROM workout_logs WHERE session_id IS NULL "
+                "GROUP BY user_id, template_name, "
+                "CAST(timezone('UTC', timestamp) AS date)"
+            )
+        )
+        created = result.rowcount
+        await session.execute(
+            text(
+                "UPDATE workout_logs AS l SET session_id = s.id "
+                "FROM workout_sessions AS s "
+                "WHERE l.session_id IS NULL AND s.user_id = l.user_id "
+                "AND s.template_name IS NOT DISTINCT FROM l.template_name "
+                "AND l.timestamp BETWEEN s.started_at AND s.ended_at"
+            )
+        )
+        await session.commit()
+    logger.info(f"backfill_workout_sessions: created {created} sessions")
+    return created
+
+
+async def backfill_daily_summary() -> int:
+    """Rebuild daily_workout_summary from all existing logs.
+
+    Safe to re-run: every (user, day, session) row is recomputed from scratch.
+    Run it after backfill_workout_sessions so legacy logs have a session.
+    Returns the number of summary rows written.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(text(REBUILD_DAILY_SUMMARY))
+        written = result.rowcount
+        await session.commit()
+    logger.info(f"backfill_daily_summary: wrote {written} summary rows")
+    return written
+
+
+async def backfill_exercise_last() -> int:
+    """Rebuild user_exercise_last from the newest log of every (user, exercise).
+
+    Returns the number of rows written.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            text(
+                "INSERT INTO user_exercise_last "
+                "(user_id, exercise_name, sets, weight, reps, timestamp) "
+                "SELECT DISTINCT ON (user_id, exercise_name) "
+                "user_id, exercise_name, sets, weight, reps, timestamp "
+                "FROM workout_logs WHERE timestamp IS NOT NULL "
+                "ORDER BY user_id, exercise_name, timestamp DESC "
+                "ON CONFLICT (user_id, exercise_name) DO UPDATE SET "
+                "sets = excluded.sets, weight = excluded.weight, "
+                "reps = excluded.reps, timestamp = excluded.timestamp"
+            )
+        )
+        written = result.rowcount
+        await session.commit()
+    last_performance_cache.clear()
+    logger.info(f"backfill_exercise_last: wrote {written} rows")
+    return written
+
+
+class explain(Executable, ClauseElement):
+    """EXPLAIN wrapper so bound parameters flow through the normal driver path."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN " + compiler.process(element.statement, **kw)
+
+
+def _hot_queries():
+    """Representative instances of every hot query, for plan checking."""
+    now = datetime.datetime.now()
+    return {
+        "last_log": last_log_query(0, ""),
+        "exercise_last": exercise_last_query(0, ""),
+        "exercises_last": exercises_last_query(0, ["", " "]),
+        "latest_logs": latest_logs_query(0, ["", " "]),
+        "session_logs": session_logs_query(0),
+        "session_summary": session_summary_query(
+            0, now.date() - datetime.timedelta(days=14)
+        ),
+    }
+
+
+async def check_query_plans() -> list[str]:
+    """Log a warning for every hot query whose plan falls back to a Seq Scan.
+
+    Sequential scans are disabled for the check so that the planner only picks
+    one when no usable index exists, regardless of current table size.
+    Returns the names of the offending queries.
+    """
+    offenders = []
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("SET LOCAL enable_seqscan = off"))
+            for name, query in _hot_queries().items():
+                result = await conn.execute(explain(query))
+                plan = "\n".join(row[0] for row in result.fetchall())
+                if "Seq Scan" in plan:
+                    logger.warning(f"Hot query '{name}' uses a sequential scan:\n{plan}")
+                    offenders.append(name)
+    except Exception as e:
+        logger.warning(f"Could not check query plans: {e}")
+    return offenders
@@ -0,0 +1,45 @@
+"""One-off data backfills for tables derived from workout_logs.
+
+Usage (from the repository root):
+    python -m scripts.backfill workout-sessions daily-summary exercise-last exercise-ids
+"""
+
+import argparse
+import asyncio
+import functools
+import logging
+
+from catalog import backfill_exercise_ids
+from database import init_db
+from handlers.ai_coach import EXERCISE_MUSCLE_MAP
+from queries import (
+    backfill_workout_sessions,
+    backfill_daily_summary,
+    backfill_exercise_last,
+)
+
+BACKFILLS = {
+    "workout-sessions": backfill_workout_sessions,
+    "daily-summary": backfill_daily_summary,
+    "exercise-last": backfill_exercise_last,
+    "exercise-ids": functools.partial(backfill_exercise_ids, EXERCISE_MUSCLE_MAP),
+}
+
+
+async def run(names: list[str]):
+    await init_db()
+    for name in names:
+        count = await BACKFILLS[name]()
+        print(f"{name}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("backfill", nargs="+", choices=sorted(BACKFILLS))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args.backfill))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Compare exercise-name matching with thefuzz and the precomputed FuzzyIndex.
+
+Usage (from the repository root):
+    python -m scripts.bench_fuzzy [--names 50] [--candidates 500] [--repeat 5]
+
+Matches a batch of LLM-style exercise names against a candidate list (a
+user's or the catalog's names), as _process_exercises and the catalog do.
+thefuzz re-normalizes every candidate for every name; FuzzyIndex does it
+once when built, so its build time is reported separately.
+"""
+
+import argparse
+import itertools
+import random
+import time
+
+from thefuzz import process as fuzz_process
+
+from fuzzy_index import FuzzyIndex
+from handlers.ai_coach import EXERCISE_MUSCLE_MAP
+
+MODIFIERS = ["", "Barbell ", "Dumbbell ", "Cable ", "Machine ", "Smith Machine ", "Single Arm "]
+SUFFIXES = ["", " (Paused)", " - Wide Grip", " - Close Grip", " Tempo"]
+
+
+def _candidates(count: int) -> list[str]:
+    base = sorted({name.title() for name in EXERCISE_MUSCLE_MAP})
+    names = [m + b + s for s, m, b in itertools.product(SUFFIXES, MODIFIERS, base)]
+    return names[:count]
+
+
+def _queries(candidates: list[str], count: int, rng: random.Random) -> list[str]:
+    """Names as an LLM writes them: typos, reordering, extra words."""
+    queries = []
+    for name in rng.sample(candidates, count):
+        kind = rng.randrange(4)
+        if kind == 0:
+            pos = rng.randrange(len(name))
+            name = name[:pos] + name[pos + 1 :]
+        elif kind == 1:
+            name = " ".join(reversed(name.split()))
+        elif kind == 2:
+            name = f"{name} (3x10)"
+        queries.append(name.lower() if rng.random() < 0.5 else name)
+    return queries
+
+
+def bench_thefuzz(queries, candidates):
+    return [fuzz_process.extractOne(q, candidates) for q in queries]
+
+
+def bench_index(queries, candidates):
+    start = time.perf_counter()
+    index = FuzzyIndex(candidates)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    results = index.best_many(queries)
+    return built, time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--names", type=int, default=50)
+    parser.add_argument("--candidates", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    candidates = _candidates(args.candidates)
+    queries = _queries(candidates, min(args.names, len(candidates)), rng)
+
+    thefuzz_times, build_times, index_times = [], [], []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        expected = bench_thefuzz(queries, candidates)
+        thefuzz_times.append(time.perf_counter() - start)
+        built, matched, results = bench_index(queries, candidates)
+        build_times.append(built)
+        index_times.append(matched)
+    same = sum(a == b for a, b in zip(expected, results))
+
+    best = min(thefuzz_times)
+    print(f"{len(queries)} names x {len(candidates)} candidates, best of {args.repeat}")
+    print(f"  thefuzz extractOne   {best * 1000:>8.2f}ms")
+    print(f"  FuzzyIndex build     {min(build_times) * 1000:>8.2f}ms (once per candidate list)")
+    print(
+        f"  FuzzyIndex match     {min(index_times) * 1000:>8.2f}ms "
+        f"({best / min(index_times):.0f}x faster)"
+    )
+    print(f"  identical results    {same}/{len(queries)}")
+
+
+if __name__ == "__main__":
+    main()
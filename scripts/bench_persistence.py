@@ -0,0 +1,109 @@
+"""Compare persistence flush times for PicklePersistence and SQLitePersistence.
+
+Usage (from the repository root):
+    python -m scripts.bench_persistence [--users 1000 10000 100000] [--changed 100]
+
+PicklePersistence rewrites the whole file on every update_user_data call, so
+its cost is reported per changed user. SQLitePersistence writes the changed
+users of one update_persistence run as a single batch.
+"""
+
+import argparse
+import asyncio
+import copy
+import os
+import tempfile
+import time
+
+from telegram.ext import PicklePersistence
+
+from handlers.workout_state import WorkoutState
+from persistence import SQLitePersistence
+
+
+def _user_data(user_id: int) -> dict:
+    # Roughly what an idle user plus an occasional live workout looks like
+    data = {"default_rest_seconds": 300}
+    if user_id % 10 == 0:
+        workout = WorkoutState(session_id=user_id, template_name="Push Day")
+        for idx in range(6):
+            workout.add_exercise(
+                f"Exercise {idx}", idx, 3, 60.0, 8, [{"weight": 60.0, "reps": 8}] * 3
+            )
+        workout.current_id = 2
+        for set_num in range(1, 4):
+            workout.exercises[0].log(set_num, 60.0, 8)
+        data["current_workout"] = workout
+    return data
+
+
+async def bench_pickle(path: str, users: dict, changed: list[int]) -> float:
+    persistence = PicklePersistence(filepath=path)
+    await persistence.get_user_data()
+    persistence.user_data = users
+    start = time.perf_counter()
+    for user_id in changed:
+        data = copy.deepcopy(users[user_id])  # as Application.update_persistence does
+        data["default_rest_seconds"] += 1
+        await persistence.update_user_data(user_id, data)
+    return time.perf_counter() - start
+
+
+async def bench_sqlite(path: str, users: dict, changed: list[int]) -> tuple:
+    seed = SQLitePersistence(path)
+    start = time.perf_counter()
+    await seed.import_data(users, {})
+    await seed.flush()
+    imported = time.perf_counter() - start
+
+    persistence = SQLitePersistence(path)
+    start = time.perf_counter()
+    await persistence.get_user_data()
+    loaded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    updates = []
+    for user_id in changed:
+        data = copy.deepcopy(users[user_id])
+        data["default_rest_seconds"] += 1
+        updates.append(persistence.update_user_data(user_id, data))
+    await asyncio.gather(*updates)
+    flushed = time.perf_counter() - start
+    await persistence.flush()
+    return imported, loaded, flushed
+
+
+async def run(user_counts: list[int], changed_count: int):
+    print(
+        f"{'users':>8} | {'pickle/update':>13} | {'pickle run':>10} | "
+        f"{'sqlite run':>10} | {'sqlite load':>11} | {'sqlite import':>13}"
+    )
+    for count in user_counts:
+        users = {user_id: _user_data(user_id) for user_id in range(count)}
+        changed = list(range(0, count, max(1, count // changed_count)))[:changed_count]
+        with tempfile.TemporaryDirectory() as tmp:
+            # Pickle is slow enough that a few updates give a stable per-update cost
+            sample = changed[: min(5, len(changed))]
+            pickle_time = await bench_pickle(os.path.join(tmp, "s.pickle"), users, sample)
+            per_update = pickle_time / len(sample)
+            imported, loaded, flushed = await bench_sqlite(
+                os.path.join(tmp, "s.sqlite3"), users, changed
+            )
+        print(
+            f"{count:>8} | {per_update * 1000:>11.1f}ms | "
+            f"{per_update * len(changed):>9.2f}s | {flushed * 1000:>8.1f}ms | "
+            f"{loaded * 1000:>9.1f}ms | {imported * 1000:>11.1f}ms"
+        )
+    print(f"(a run = {changed_count} changed users, as handed over by update_persistence)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--changed", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.changed))
+
+
+if __name__ == "__main__":
+    main()
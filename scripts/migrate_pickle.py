@@ -0,0 +1,38 @@
+"""One-shot copy of storage.pickle into a key-value persistence store.
+
+Usage (from the repository root):
+    python -m scripts.migrate_pickle sqlite --path storage.sqlite3
+    python -m scripts.migrate_pickle postgres
+"""
+
+import argparse
+import asyncio
+import logging
+
+from persistence import PostgresPersistence, SQLitePersistence
+
+
+async def migrate(source: str, target) -> int:
+    users = await target.import_pickle(source)
+    await target.flush()
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("target", choices=["sqlite", "postgres"])
+    parser.add_argument("--source", default="storage.pickle")
+    parser.add_argument("--path", default="storage.sqlite3", help="SQLite file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.target == "sqlite":
+        target = SQLitePersistence(args.path)
+    else:
+        target = PostgresPersistence()
+    users = asyncio.run(migrate(args.source, target))
+    print(f"Migrated {users} users from {args.source} to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ from unittest.mock import AsyncMock, MagicMock
 from telegram import Update, User, Chat, Message
 from telegram.ext import ContextTypes
 
+from llm_cache import llm_cache
+
 @pytest.fixture
 def mock_update():
     update = MagicMock(spec=Update)
@@ -21,3 +23,11 @@ def mock_context():
     context = MagicMock(spec=ContextTypes.DEFAULT_TYPE)
     context.user_data = {}
     return context
+
+
+@pytest.fixture(autouse=True)
+def clear_llm_cache():
+    # Cached completions would otherwise leak between tests with the same prompt
+    llm_cache.clear()
+    yield
+    llm_cache.clear()
@@ -212,3 +212,172 @@ class TestEdgeCases:
     def test_empty_exercise_list(self):
         result = _filter_exercises_for_session([], "PPL", "Push Day")
         assert result == []
+
+
+# ── Progressive generation ───────────────────────────────────────────────
+
+def _session_stream(prompt: str):
+    import json
+    from unittest.mock import MagicMock
+
+    session = prompt.split("Design the '")[1].split("'")[0]
+    muscle = {"Push Day": "chest", "Pull Day": "back", "Legs Day": "quads"}[session]
+    text = json.dumps({
+        "template_name": session,
+        "notes": "",
+        "exercises": [_ex(f"{session} Lift", muscle)],
+    })
+
+    async def chunks():
+        for i in range(0, len(text), 20):
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content=text[i:i + 20]))], usage=None)
+
+    return chunks()
+
+
+class TestProgressiveGeneration:
+    @pytest.mark.asyncio
+    async def test_failed_session_is_retried_then_reported_and_others_kept(
+        self, mock_update, mock_context
+    ):
+        from unittest.mock import AsyncMock, patch
+        from handlers.ai_coach import (
+            AI_COACH_REVIEW,
+            SESSION_ATTEMPTS,
+            _generate_recommendation,
+        )
+
+        mock_context.bot = AsyncMock()
+        mock_context.user_data.update(coach_split="PPL")
+        calls = []
+
+        async def create(**request):
+            prompt = request["messages"][1]["content"]
+            calls.append(prompt)
+            if "'Legs Day'" in prompt and not healthy:
+                raise RuntimeError("upstream timeout")
+            return _session_stream(prompt)
+
+        client = AsyncMock()
+        client.chat.completions.create.side_effect = create
+        with patch("handlers.ai_coach.get_client", return_value=client), \
+             patch("handlers.ai_coach._fetch_canonical_names", AsyncMock(return_value=[])), \
+             patch("handlers.ai_coach.RETRY_BACKOFF_SECONDS", 0):
+            healthy = False
+            state = await _generate_recommendation(mock_update, mock_context)
+
+            assert state == AI_COACH_REVIEW
+            assert [t["session"] for t in mock_context.user_data["coach_templates"]] == [
+                "Push Day", "Pull Day",
+            ]
+            assert mock_context.user_data["coach_failed_sessions"] == ["Legs Day"]
+            assert sum("'Legs Day'" in p for p in calls) == SESSION_ATTEMPTS
+            final = mock_context.bot.edit_message_text.call_args.kwargs
+            assert "coach_retry" in str(final["reply_markup"])
+
+            # Retrying only reruns the failed session
+            healthy = True
+            calls.clear()
+            state = await _generate_recommendation(mock_update, mock_context, retry_failed=True)
+
+        assert state == AI_COACH_REVIEW
+        assert len(calls) == 1
+        assert [t["session"] for t in mock_context.user_data["coach_templates"]] == [
+            "Push Day", "Pull Day", "Legs Day",
+        ]
+        assert mock_context.user_data["coach_failed_sessions"] == []
+
+
+# ── Rule-based generator ─────────────────────────────────────────────────
+
+class TestRuleBasedSession:
+    def test_every_session_is_covered_and_passes_its_filter(self):
+        from handlers.ai_coach import OFFLINE_SESSIONS, rule_based_session
+
+        sbd = {"bench": 100, "squat": 140, "deadlift": 180}
+        for split, sessions in SPLIT_SESSIONS.items():
+            for session in sessions:
+                assert (split, session) in OFFLINE_SESSIONS
+                raw = rule_based_session(split, session, sbd, {"weight": 80})
+                kept = _filter_exercises_for_session(raw["exercises"], split, session)
+                assert kept == raw["exercises"]
+                for ex in raw["exercises"]:
+                    assert len(ex["sets_config"]) == ex["sets"]
+
+    def test_sessions_stay_under_the_volume_guard(self):
+        from handlers.ai_coach import OFFLINE_SESSIONS, _session_template, rule_based_session
+
+        sbd = {"bench": 100, "squat": 140, "deadlift": 180}
+        for split, session in OFFLINE_SESSIONS:
+            for goals in ("", "Build strength"):
+                raw = rule_based_session(split, session, sbd, {"weight": 80}, goals)
+                template = _session_template(split, session, raw, [])
+                assert template["volume_warnings"] == {}, (split, session, goals)
+
+    def test_loads_follow_1rm_percentages(self):
+        from handlers.ai_coach import rule_based_session
+
+        sbd = {"bench": 100, "squat": 140, "deadlift": 180}
+        push = rule_based_session("PPL", "Push Day", sbd, {"weight": 80})
+        bench = push["exercises"][0]
+        assert bench["name"] == "Bench Press"
+        assert bench["sets_config"][0] == {"weight": 75.0, "reps": 8}
+        # Overhead press: 60% of bench as its 1RM, 70% of that, rounded to 2.5 kg
+        assert push["exercises"][1]["sets_config"][0] == {"weight": 42.5, "reps": 10}
+
+        strength = rule_based_session("PPL", "Legs Day", sbd, {}, goals="Build strength")
+        assert strength["exercises"][0]["sets_config"][0] == {"weight": 115.0, "reps": 5}
+
+    def test_missing_1rm_uses_body_weight(self):
+        from handlers.ai_coach import rule_based_session
+
+        raw = rule_based_session("FullBody", "Full Body", {"squat": 0}, {"weight": 80})
+        squat = raw["exercises"][0]
+        assert squat["sets_config"][0]["weight"] == 45.0  # 0.75 x 80 x 75%
+        plank = next(ex for ex in raw["exercises"] if ex["name"] == "Plank")
+        assert plank["sets_config"][0]["weight"] == 0
+
+
+class TestOfflineGeneration:
+    @pytest.mark.asyncio
+    async def test_quick_plan_skips_the_llm(self, mock_update, mock_context):
+        from unittest.mock import AsyncMock, patch
+        from handlers.ai_coach import AI_COACH_REVIEW, _generate_recommendation
+
+        mock_context.bot = AsyncMock()
+        mock_context.user_data.update(
+            coach_split="UpperLower", coach_sbd={"bench": 100, "squat": 140, "deadlift": 180}
+        )
+        client = AsyncMock()
+        with patch("handlers.ai_coach.get_client", return_value=client), \
+             patch("handlers.ai_coach._fetch_canonical_names", AsyncMock(return_value=[])):
+            state = await _generate_recommendation(mock_update, mock_context, quick=True)
+
+        assert state == AI_COACH_REVIEW
+        client.chat.completions.create.assert_not_called()
+        assert [t["session"] for t in mock_context.user_data["coach_templates"]] == [
+            "Upper Body", "Lower Body",
+        ]
+        final = mock_context.bot.edit_message_text.call_args.kwargs
+        assert "Quick plan" in final["text"]
+
+    @pytest.mark.asyncio
+    async def test_open_breaker_falls_back_to_rules(self, mock_update, mock_context):
+        from unittest.mock import AsyncMock, patch
+        from handlers.ai_coach import _generate_recommendation
+        from llm_gateway import CircuitOpenError
+
+        mock_context.bot = AsyncMock()
+        mock_context.user_data.update(coach_split="PPL")
+        client = AsyncMock()
+        client.chat.completions.create.side_effect = CircuitOpenError("down")
+        with patch("handlers.ai_coach.get_client", return_value=client), \
+             patch("handlers.ai_coach._fetch_canonical_names", AsyncMock(return_value=[])):
+            await _generate_recommendation(mock_update, mock_context)
+
+        # One attempt per session, no retries, and every session drafted
+        assert client.chat.completions.create.await_count == 3
+        assert mock_context.user_data["coach_failed_sessions"] == []
+        assert len(mock_context.user_data["coach_templates"]) == 3
+        final = mock_context.bot.edit_message_text.call_args.kwargs
+        assert "unavailable" in final["text"]
@@ -3,6 +3,15 @@ from unittest.mock import patch, AsyncMock, MagicMock
 from handlers import add_template_ai_start, process_ai_template, ADD_TEMPLATE_AI_INPUT, EDIT_TEMPLATE_EXERCISE
 import json
 
+
+def stream_chunks(text, size=7):
+    """What chat.completions.create(stream=True) resolves to, in small deltas."""
+    async def chunks():
+        for i in range(0, len(text), size):
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content=text[i:i + size]))], usage=None)
+    return chunks()
+
+
 @pytest.mark.asyncio
 async def test_add_template_ai_start(mock_update, mock_context):
     state = await add_template_ai_start(mock_update, mock_context)
@@ -42,6 +51,59 @@ async def test_process_ai_template_success(mock_update, mock_context):
         assert mock_update.message.reply_text.called
         assert any("parsed your workout" in str(call) for call in mock_update.message.reply_text.call_args_list)
 
+@pytest.mark.asyncio
+async def test_process_ai_template_llm_fallback(mock_update, mock_context):
+    # Too loose for the rule-based parser, so it goes to the LLM
+    mock_update.message.text = "Upper Body: Bench Press 2 sets 60kg x 10, then 1 set 65kg x 8"
+    mock_context.bot = AsyncMock()
+    content = json.dumps({
+        "template_name": "Upper Body",
+        "exercises": [
+            {
+                "name": "Bench Press",
+                "sets": 3,
+                "sets_config": [{"weight": 60.0, "reps": 10}, {"weight": 60.0, "reps": 10}, {"weight": 65.0, "reps": 8}]
+            }
+        ]
+    })
+
+    with patch("handlers.ai_template.get_client") as mock_get_client:
+        mock_ai_client = AsyncMock()
+        mock_get_client.return_value = mock_ai_client
+        mock_ai_client.chat.completions.create.return_value = stream_chunks(content)
+
+        state = await process_ai_template(mock_update, mock_context)
+
+        assert mock_ai_client.chat.completions.create.await_count == 1
+        assert mock_ai_client.chat.completions.create.call_args.kwargs["stream"] is True
+        assert state == EDIT_TEMPLATE_EXERCISE
+        assert mock_context.user_data["exercises"][0]["sets"] == 3
+
+@pytest.mark.asyncio
+async def test_process_ai_template_truncated_stream(mock_update, mock_context):
+    mock_update.message.text = "Full body, heavy-ish, whatever you think is best"
+    mock_context.bot = AsyncMock()
+    content = json.dumps({
+        "template_name": "Full Body",
+        "exercises": [
+            {"name": "Squat", "sets": 1, "sets_config": [{"weight": 100.0, "reps": 5}]},
+            {"name": "Bench Press", "sets": 2, "sets_config": [{"weight": 80.0, "reps": 5}]},
+        ]
+    })
+    # Cut off in the middle of the second exercise
+    truncated = content[: content.index("Bench Press")]
+
+    with patch("handlers.ai_template.get_client") as mock_get_client:
+        mock_ai_client = AsyncMock()
+        mock_get_client.return_value = mock_ai_client
+        mock_ai_client.chat.completions.create.return_value = stream_chunks(truncated)
+
+        state = await process_ai_template(mock_update, mock_context)
+
+        assert state == EDIT_TEMPLATE_EXERCISE
+        assert mock_context.user_data["template_name"] == "Full Body"
+        assert [ex["name"] for ex in mock_context.user_data["exercises"]] == ["Squat"]
+
 @pytest.mark.asyncio
 async def test_process_ai_template_error(mock_update, mock_context):
     mock_update.message.text = "invalid input"
@@ -58,7 +120,11 @@ async def test_process_ai_template_error(mock_update, mock_context):
 
 @pytest.mark.asyncio
 async def test_process_ai_template_photo(mock_update, mock_context):
-    mock_update.message.photo = [MagicMock()]
+    mock_update.message.photo = [
+        MagicMock(file_id="small", width=320, height=240, file_size=20_000),
+        MagicMock(file_id="medium", width=1280, height=960, file_size=200_000),
+        MagicMock(file_id="large", width=2560, height=1920, file_size=700_000),
+    ]
     mock_update.message.document = None
     mock_context.bot = AsyncMock()
     
@@ -92,6 +158,8 @@ async def test_process_ai_template_photo(mock_update, mock_context):
         
         assert state == EDIT_TEMPLATE_EXERCISE
         assert mock_context.user_data["template_name"] == "Photo Template"
+        # The smallest size that is large enough is downloaded, not the largest
+        mock_context.bot.get_file.assert_awaited_once_with("medium")
 
 @pytest.mark.asyncio
 async def test_process_ai_template_csv(mock_update, mock_context):
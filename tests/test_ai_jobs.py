@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock
+
+from ai_jobs import AIJobQueue, AIJobQueueFull, CANCELLED, DONE, FAILED
+from handlers.common import (
+    AI_BUSY_TEXT,
+    AIJobResult,
+    AIJobResultHandler,
+    resume_ai_job,
+    submit_ai_job,
+)
+
+
+@pytest.mark.asyncio
+async def test_workers_bound_concurrency():
+    queue = AIJobQueue(workers=2, max_queue=10)
+    await queue.start()
+    running = 0
+    peak = 0
+    release = asyncio.Event()
+
+    async def work():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await release.wait()
+        running -= 1
+
+    jobs = [queue.submit("test", user_id, 1, None, work) for user_id in range(5)]
+    await asyncio.sleep(0.01)
+    assert peak == 2
+    assert queue.position(jobs[4]) == 2
+
+    release.set()
+    await asyncio.wait_for(queue._queue.join(), 1)
+    assert all(job.status == DONE for job in jobs)
+    assert queue.snapshot()["completed"] == 5
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_cancel_running_and_queued_jobs():
+    queue = AIJobQueue(workers=1, max_queue=10)
+    await queue.start()
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(60)
+
+    running = queue.submit("test", 1, 1, None, slow)
+    waiting = queue.submit("test", 2, 2, None, slow)
+    await asyncio.wait_for(started.wait(), 1)
+
+    assert queue.cancel(2)
+    assert queue.cancel(1)
+    assert not queue.cancel(1)
+    await asyncio.wait_for(queue._queue.join(), 1)
+    assert running.status == CANCELLED
+    assert waiting.status == CANCELLED
+    assert queue.active_job(1) is None
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_recorded():
+    queue = AIJobQueue(workers=1)
+    await queue.start()
+
+    async def boom():
+        raise RuntimeError("LLM down")
+
+    job = queue.submit("test", 1, 1, None, boom)
+    await asyncio.wait_for(queue._queue.join(), 1)
+    assert job.status == FAILED
+    assert job.error == "LLM down"
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects():
+    queue = AIJobQueue(workers=1, max_queue=1)
+    await queue.start()
+    block = asyncio.Event()
+
+    async def wait():
+        await block.wait()
+
+    queue.submit("test", 1, 1, None, wait)
+    await asyncio.sleep(0)  # the worker picks up the first job
+    queue.submit("test", 2, 2, None, wait)
+    with pytest.raises(AIJobQueueFull):
+        queue.submit("test", 3, 3, None, wait)
+    assert queue.snapshot()["rejected"] == 1
+    block.set()
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_submit_ai_job_returns_before_the_work_finishes(
+    mock_update, mock_context, monkeypatch
+):
+    queue = AIJobQueue(workers=1, max_queue=0)
+    monkeypatch.setattr("handlers.common.ai_jobs", queue)
+    mock_context.bot = AsyncMock()
+    mock_context.application.update_queue = asyncio.Queue()
+    mock_update.effective_chat.id = 1
+
+    async def run(context):
+        context.user_data["draft"] = "ready"
+        return "done"
+
+    # Inline while the workers are not running
+    assert await submit_ai_job(mock_update, mock_context, "t", 5, run, "pending") == "done"
+    assert mock_context.user_data == {"draft": "ready"}
+
+    await queue.start()
+    state = await submit_ai_job(
+        mock_update, mock_context, "t", 5, run, "pending", busy_state="busy"
+    )
+    assert state == "busy"
+    assert mock_context.bot.edit_message_text.call_args.kwargs["text"] == AI_BUSY_TEXT
+
+    queue.max_queue = 5
+    state = await submit_ai_job(mock_update, mock_context, "t", 5, run, "pending")
+    assert state == "pending"
+    await asyncio.wait_for(queue._queue.join(), 1)
+    await queue.stop()
+    assert mock_context.application.update_queue.qsize() == 1
+
+
+@pytest.mark.asyncio
+async def test_ai_job_result_is_applied_through_the_update_pipeline(
+    mock_update, mock_context, monkeypatch
+):
+    queue = AIJobQueue(workers=1)
+    monkeypatch.setattr("handlers.common.ai_jobs", queue)
+    mock_context.bot = AsyncMock()
+    mock_context.application.update_queue = asyncio.Queue()
+    mock_context.user_data.update({"goals": "none", "stale": True})
+
+    async def run(context):
+        context.user_data["templates"] = ["Push"]
+        del context.user_data["stale"]
+        return "review"
+
+    await queue.start()
+    await submit_ai_job(mock_update, mock_context, "coach", 5, run, "pending")
+    result = await asyncio.wait_for(mock_context.application.update_queue.get(), 1)
+    await queue.stop()
+
+    # Nothing is written outside the user's turn
+    assert mock_context.user_data == {"goals": "none", "stale": True}
+    assert isinstance(result, AIJobResult)
+    assert result.effective_user is mock_update.effective_user
+    assert result.effective_message is None
+
+    handler = AIJobResultHandler("coach")
+    assert handler.check_update(result)
+    assert not handler.check_update(mock_update)
+    assert not AIJobResultHandler("template_text").check_update(result)
+
+    assert await resume_ai_job(result, mock_context) == "review"
+    assert mock_context.user_data == {"goals": "none", "templates": ["Push"]}
@@ -0,0 +1,66 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from handlers import process_ai_template, EDIT_TEMPLATE_EXERCISE
+from handlers.ai_parser import (
+    FAST_PATH_MIN_CONFIDENCE,
+    FastPathStats,
+    parse_template_text,
+)
+
+
+def test_parses_common_shapes():
+    data, confidence = parse_template_text(
+        "Push Day: Bench 3x5 @ 80kg, OHP 3x8 @ 40kg; 3 sets of Dips for 10 reps"
+    )
+    assert confidence >= FAST_PATH_MIN_CONFIDENCE
+    assert data["template_name"] == "Push Day"
+    assert [(ex["name"], ex["sets"]) for ex in data["exercises"]] == [
+        ("Bench", 3),
+        ("OHP", 3),
+        ("Dips", 3),
+    ]
+    assert data["exercises"][0]["sets_config"][0] == {"weight": 80.0, "reps": 5}
+    assert data["exercises"][2]["sets_config"][0] == {"weight": 0.0, "reps": 10}
+
+
+def test_per_set_weights_and_grouping():
+    data, _ = parse_template_text("Pull: Deadlift 100x5 110x3, deadlift 3x1 @ 130kg")
+    (deadlift,) = data["exercises"]
+    assert deadlift["sets"] == 5
+    assert [s["weight"] for s in deadlift["sets_config"]] == [100, 110, 130, 130, 130]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Upper Body: Bench Press 2 sets 60kg x 10, then 1 set 65kg x 8",
+        "Legs: squat 5x5 @ 225lbs",
+        "something heavy for legs please",
+        "Bench 2 60x5",  # set count doesn't match the sets given
+    ],
+)
+def test_ambiguous_input_is_left_to_the_llm(text):
+    data, confidence = parse_template_text(text)
+    assert data is None or confidence < FAST_PATH_MIN_CONFIDENCE
+
+
+def test_fast_path_stats():
+    stats = FastPathStats()
+    stats.record(True)
+    stats.record(False)
+    assert stats.snapshot() == {"attempts": 2, "handled": 1, "fraction": 0.5}
+
+
+@pytest.mark.asyncio
+async def test_fast_path_skips_the_llm(mock_update, mock_context):
+    mock_update.message.text = "Leg Day: Squat 5x5 @ 100kg"
+    mock_context.bot = AsyncMock()
+
+    with patch("handlers.ai_template.get_client") as mock_get_client:
+        state = await process_ai_template(mock_update, mock_context)
+
+    mock_get_client.assert_not_called()
+    assert state == EDIT_TEMPLATE_EXERCISE
+    assert mock_context.user_data["template_name"] == "Leg Day"
+    assert mock_context.user_data["exercises"][0]["sets"] == 5
@@ -0,0 +1,28 @@
+from catalog import ExerciseCatalog, normalize, seed_entries
+
+
+def test_seed_entries_merge_spelling_variants():
+    entries = seed_entries(
+        {"pull up": "back", "pullup": "back", "t-bar row": "back", "t bar row": "back"}
+    )
+
+    assert len(entries) == 2
+    pull_up = next(e for e in entries if e["canonical_name"] == "Pull Up")
+    assert pull_up["muscle_group"] == "back"
+    assert pull_up["aliases"] == ["pull up", "pullup"]
+
+
+def test_match_prefers_exact_alias_then_fuzzy():
+    catalog = ExerciseCatalog()
+    catalog._index(1, "Bench Press", ["bench press"])
+    catalog._index(2, "Incline Bench Press", ["incline bench press"])
+    catalog._index(3, "Lat Pulldown", ["lat pulldown"])
+
+    assert catalog.match("  Bench   PRESS ") == 1
+    assert catalog.match("Incline Bench Press") == 2
+    assert catalog.match("lat pull-down") == 3
+    assert catalog.match("Hip Thrust") is None
+
+
+def test_normalize_collapses_case_and_whitespace():
+    assert normalize("  Barbell   Row ") == "barbell row"
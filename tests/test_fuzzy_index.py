@@ -0,0 +1,36 @@
+from thefuzz import process as fuzz_process
+
+from fuzzy_index import FuzzyIndex, index_for
+from handlers.ai_coach import EXERCISE_MUSCLE_MAP
+
+QUERIES = [
+    "Barbell Bench Press", "bench press", "Incline DB Press", "lat pull-down",
+    "Cable Lateral Raises", "Romanian Deadlifts (RDL)", "press bench", "Hip Thrusts",
+    "Standing Calf Raise!", "Skullcrushers", "hammer curls", "Pec Deck Fly", "xyz",
+]
+
+
+def test_matches_and_scores_agree_with_thefuzz():
+    keys = list(EXERCISE_MUSCLE_MAP)
+    index = FuzzyIndex(keys)
+    for query in QUERIES:
+        assert index.best(query) == fuzz_process.extractOne(query, keys), query
+
+
+def test_threshold_and_exact_match():
+    index = FuzzyIndex(["Bench Press", "Incline Bench Press", "Lat Pulldown"])
+
+    assert index.best("  BENCH press ") == ("Bench Press", 100)
+    assert index.best("Hip Thrust", 82) is None
+    match, score = index.best("lat pull-down", 82)
+    assert match == "Lat Pulldown" and score >= 82
+    assert index.best("") is None
+    assert FuzzyIndex().best("Bench Press") is None
+
+
+def test_best_many_and_shared_indexes():
+    index = index_for(["Squat", "Leg Press"])
+    assert index_for(["Squat", "Leg Press"]) is index
+    assert index.best_many(["squats", "Leg press", "squats"], 70) == [
+        ("Squat", 91), ("Leg Press", 100), ("Squat", 91),
+    ]
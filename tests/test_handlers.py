@@ -7,10 +7,14 @@ from handlers import (
     exercise_name,
     show_edited_template,
     rest_timer_callback,
+    end_workout_callback,
+    handle_exercise_action,
     TEMPLATE_NAME,
+    WORKOUT_EXERCISE_SELECT,
     EDIT_TEMPLATE_EXERCISE,
 )
 from telegram.ext import ConversationHandler
+from handlers.workout_state import WorkoutState
 
 
 @pytest.mark.asyncio
@@ -143,3 +147,50 @@ async def test_rest_timer_callback_handles_missing_message(mock_context):
 
     # Only the "rest is over" message delete, not the rest_message_id delete
     assert mock_context.bot.delete_message.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_end_workout_commits_journal_and_finalizes_session(
+    mock_update, mock_context
+):
+    """Ending a workout commits its journaled sets and closes the session."""
+    workout = WorkoutState(
+        session_id=42, template_name="Leg Day", set_count=3, total_volume=1500.0
+    )
+    squat = workout.add_exercise("Squat", None, 3, 100.0, 5)
+    squat.log(1, 100.0, 5)
+    squat.log(3, 100.0, 5)  # set 2 left as a gap
+    mock_context.user_data["current_workout"] = workout
+    mock_context.bot = AsyncMock()
+
+    with patch("handlers.workout.set_journal") as mock_journal, patch(
+        "handlers.workout.finalize_workout_session", new_callable=AsyncMock
+    ) as mock_finalize, patch("handlers.workout.asyncio.sleep", new_callable=AsyncMock):
+        await end_workout_callback(mock_update, mock_context)
+
+    mock_journal.commit.assert_called_once_with(123456789, 42)
+    mock_finalize.assert_awaited_once_with(42, 5, 2500.0)
+    assert "current_workout" not in mock_context.user_data
+
+
+@pytest.mark.asyncio
+async def test_stale_complete_button_does_not_hit_another_exercise(
+    mock_update, mock_context
+):
+    """A complete_ button for an already-completed exercise is rejected."""
+    workout = WorkoutState(session_id=42, template_name="Leg Day")
+    workout.add_exercise("Squat", None, 3, 100.0, 5)
+    lunge = workout.add_exercise("Lunge", None, 3, 20.0, 10)
+    workout.add_exercise("Calf Raise", None, 3, 40.0, 15)
+    lunge.log(1, 20.0, 10)
+    workout.complete(0)
+    mock_context.user_data["current_workout"] = workout
+    mock_update.callback_query.data = "complete_0"
+
+    with patch("handlers.workout.set_journal") as mock_journal:
+        state = await handle_exercise_action(mock_update, mock_context)
+
+    assert state == WORKOUT_EXERCISE_SELECT
+    mock_journal.commit.assert_not_called()
+    assert [ex.name for ex in workout.active()] == ["Lunge", "Calf Raise"]
+    assert lunge.logged(1) == (20.0, 10)
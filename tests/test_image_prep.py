@@ -0,0 +1,58 @@
+import io
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from PIL import Image
+
+from image_prep import ImageStats, pick_photo_size, prepare_photo, preprocess
+
+
+def _size(file_id, width, height):
+    return MagicMock(file_id=file_id, width=width, height=height, file_size=width * height // 4)
+
+
+SIZES = [_size("s", 90, 68), _size("m", 800, 600), _size("l", 1280, 960), _size("xl", 2560, 1920)]
+
+
+def test_pick_photo_size():
+    assert pick_photo_size(SIZES, side=1024).file_id == "l"
+    assert pick_photo_size(SIZES, side=800).file_id == "m"
+    # Nothing big enough: the largest there is
+    assert pick_photo_size(SIZES, side=4000).file_id == "xl"
+
+
+def test_preprocess_keeps_undecodable_bytes():
+    assert preprocess(b"not an image") == b"not an image"
+
+
+def test_preprocess_shrinks_and_grayscales():
+    img = Image.effect_noise((1600, 1200), 40).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+    original = buffer.getvalue()
+
+    processed = preprocess(original, side=800)
+    assert len(processed) < len(original)
+    with Image.open(io.BytesIO(processed)) as out:
+        assert out.mode == "L"
+        assert max(out.size) == 800
+
+
+@pytest.mark.asyncio
+async def test_prepare_photo_records_sizes():
+    bot = AsyncMock()
+    bot.get_file.return_value.download_to_memory = AsyncMock(
+        side_effect=lambda buffer: buffer.write(b"jpeg bytes")
+    )
+
+    image = await prepare_photo(bot, SIZES, side=1024)
+    bot.get_file.assert_awaited_once_with("l")
+    assert image.data == b"jpeg bytes"
+    assert image.original_bytes == SIZES[-1].file_size
+    assert len(image.digest) == 64
+
+    stats = ImageStats()
+    stats.record(image, llm_seconds=1.5)
+    snapshot = stats.snapshot()
+    assert snapshot["requests"] == 1
+    assert snapshot["payload_reduction"] > 0.99
@@ -0,0 +1,194 @@
+"""Tests for the write-behind set journal."""
+
+import datetime
+import json
+
+import pytest
+from unittest.mock import AsyncMock
+
+from journal import SetJournal
+
+
+def _row(name: str, weight: float, reps: int) -> dict:
+    return {
+        "user_id": 1,
+        "template_name": "Leg Day",
+        "exercise_name": name,
+        "sets": 1,
+        "weight": weight,
+        "reps": reps,
+        "timestamp": datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc),
+    }
+
+
+@pytest.mark.asyncio
+async def test_only_committed_sets_are_flushed(tmp_path):
+    save = AsyncMock()
+    journal = SetJournal(str(tmp_path / "journal.log"), save=save)
+    journal.record(1, "w1", 0, 1, _row("Squat", 100, 5))
+    journal.record(1, "w1", 1, 1, _row("Lunge", 20, 10))
+    journal.commit(1, "w1", 0)
+
+    assert await journal.flush() == 1
+    save.assert_awaited_once()
+    assert [r["exercise_name"] for r in save.call_args[0][0]] == ["Squat"]
+    assert journal.pending_count == 1
+    assert journal.ready_count == 0
+
+
+@pytest.mark.asyncio
+async def test_rerecording_a_set_overwrites_it(tmp_path):
+    save = AsyncMock()
+    journal = SetJournal(str(tmp_path / "journal.log"), save=save)
+    journal.record(1, "w1", 0, 1, _row("Squat", 100, 5))
+    journal.record(1, "w1", 0, 1, _row("Squat", 105, 5))
+    journal.commit(1, "w1")
+    await journal.flush()
+
+    rows = save.call_args[0][0]
+    assert len(rows) == 1
+    assert rows[0]["weight"] == 105
+
+
+@pytest.mark.asyncio
+async def test_discarded_sets_are_never_written(tmp_path):
+    save = AsyncMock()
+    journal = SetJournal(str(tmp_path / "journal.log"), save=save)
+    journal.record(1, "w1", 0, 1, _row("Squat", 100, 5))
+    journal.discard(1, "w1", 0)
+    journal.commit(1, "w1")
+
+    assert await journal.flush() == 0
+    save.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_in_batches(tmp_path):
+    save = AsyncMock()
+    journal = SetJournal(str(tmp_path / "journal.log"), save=save, batch_size=2)
+    for set_num in range(1, 6):
+        journal.record(1, "w1", 0, set_num, _row("Squat", 100, 5))
+    journal.commit(1, "w1")
+
+    assert await journal.flush() == 5
+    assert [len(c[0][0]) for c in save.call_args_list] == [2, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_rows_for_retry(tmp_path):
+    save = AsyncMock(side_effect=[ConnectionError("db down"), None])
+    journal = SetJournal(str(tmp_path / "journal.log"), save=save)
+    journal.record(1, "w1", 0, 1, _row("Squat", 100, 5))
+    journal.commit(1, "w1")
+
+    assert await journal.flush() == 0
+    assert journal.ready_count == 1
+    assert await journal.flush() == 1
+
+
+@pytest.mark.asyncio
+async def test_replay_restores_state_after_crash(tmp_path):
+    path = str(tmp_path / "journal.log")
+    crashed = SetJournal(path, save=AsyncMock())
+    crashed.record(1, "w1", 0, 1, _row("Squat", 100, 5))
+    crashed.commit(1, "w1", 0)
+    crashed.record(1, "w1", 1, 1, _row("Lunge", 20, 10))
+    await crashed.sync()
+    # Simulate a torn write at the end of the file
+    with open(path, "a") as f:
+        f.write('{"op": "rec')
+
+    save = AsyncMock()
+    restarted = SetJournal(path, save=save, stored=AsyncMock(return_value=set()))
+    await restarted.start()
+    await restarted.stop()
+
+    rows = save.call_args[0][0]
+    assert [r["exercise_name"] for r in rows] == ["Squat"]
+    assert isinstance(rows[0]["timestamp"], datetime.datetime)
+    assert restarted.pending_count == 1
+
+
+@pytest.mark.asyncio
+async def test_transient_failures_never_drop_rows(tmp_path):
+    save = AsyncMock(side_effect=ConnectionError("db down"))
+    journal = SetJournal(str(tmp_path / "journal.log"), save=save)
+    journal.record(1, "w1", 0, 1, _row("Squat", 100, 5))
+    journal.record(1, "w1", 0, 2, _row("Squat", 100, 5))
+    journal.commit(1, "w1")
+
+    for _ in range(5):
+        assert await journal.flush() == 0
+    assert journal.ready_count == 2
+    assert not (tmp_path / "journal.log.dead").exists()
+
+
+@pytest.mark.asyncio
+async def test_rejected_row_is_dead_lettered_and_the_rest_written(tmp_path):
+    written = []
+
+    async def save(rows):
+        if any(r["exercise_name"] == "Deleted" for r in rows):
+            raise ValueError("violates foreign key constraint")
+        written.extend(rows)
+
+    journal = SetJournal(str(tmp_path / "journal.log"), save=save, batch_size=4)
+    for set_num, name in enumerate(["Squat", "Lunge", "Deleted", "Squat", "Lunge"]):
+        journal.record(1, "w1", set_num, 1, _row(name, 20, 10))
+    journal.commit(1, "w1")
+
+    assert await journal.flush() == 4
+    assert [r["exercise_name"] for r in written] == ["Squat", "Lunge", "Squat", "Lunge"]
+    assert journal.ready_count == 0
+    (dead,) = (tmp_path / "journal.log.dead").read_text().splitlines()
+    assert json.loads(dead)["row"]["exercise_name"] == "Deleted"
+    assert "foreign key" in json.loads(dead)["error"]
+
+
+@pytest.mark.asyncio
+async def test_replay_skips_sets_that_were_already_saved(tmp_path):
+    path = str(tmp_path / "journal.log")
+    crashed = SetJournal(path, save=AsyncMock())
+    crashed.record(1, "w1", 0, 1, _row("Squat", 100, 5))
+    crashed.record(1, "w1", 1, 1, _row("Lunge", 20, 10))
+    crashed.commit(1, "w1")
+    await crashed.sync()
+    # The first set reached workout_logs before the crash, the file never knew
+    saved_id = crashed._ready[next(iter(crashed._ready))]["journal_id"]
+
+    save = AsyncMock()
+    stored = AsyncMock(return_value={saved_id})
+    restarted = SetJournal(path, save=save, stored=stored)
+    await restarted.start()
+    await restarted.stop()
+
+    assert set(stored.call_args[0][0]) == set(crashed._ready)
+    rows = save.call_args[0][0]
+    assert [r["exercise_name"] for r in rows] == ["Lunge"]
+    assert rows[0]["journal_id"] != saved_id
+
+
+@pytest.mark.asyncio
+async def test_compacted_commit_does_not_commit_later_sets(tmp_path):
+    path = str(tmp_path / "journal.log")
+    first = SetJournal(path, save=AsyncMock())
+    first.record(1, "w1", 0, 1, _row("Squat", 100, 5))
+    first.commit(1, "w1", 0)
+    # Back to the same exercise: a new pending set for the same exercise
+    first.record(1, "w1", 0, 2, _row("Squat", 100, 5))
+    await first.sync()
+
+    # The database is down, so the restart compacts the file and keeps both
+    second = SetJournal(
+        path,
+        save=AsyncMock(side_effect=ConnectionError("db down")),
+        stored=AsyncMock(side_effect=ConnectionError("db down")),
+    )
+    await second.start()
+    second.record(1, "w1", 0, 3, _row("Squat", 100, 5))
+    await second.stop()
+
+    third = SetJournal(path, save=AsyncMock(), stored=AsyncMock(return_value=set()))
+    third._replay()
+    assert third.ready_count == 1
+    assert third.pending_count == 2
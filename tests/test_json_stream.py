@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from json_stream import ItemStream
+
+DOC = {
+    "template_name": 'Push "A" {day}',
+    "notes": "Heavy, then [light]",
+    "exercises": [
+        {
+            "name": "Bench Press",
+            "sets": 2,
+            "sets_config": [{"weight": 80.5, "reps": 5}, {"weight": -1e2, "reps": 5}],
+            "superset": None,
+        },
+        {"name": "Dips", "sets": 1, "sets_config": [{"weight": 0, "reps": 12}], "bw": True},
+    ],
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 16, 1000])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_items_are_emitted_as_they_complete(chunk_size, indent):
+    text = json.dumps(DOC, indent=indent)
+    parser = ItemStream("exercises")
+    emitted = []
+    for i in range(0, len(text), chunk_size):
+        emitted += parser.feed(text[i : i + chunk_size])
+
+    assert emitted == DOC["exercises"]
+    assert parser.complete
+    assert parser.result() == DOC
+    assert parser.fields == {"template_name": DOC["template_name"], "notes": DOC["notes"]}
+
+
+def test_first_item_is_emitted_before_the_document_ends():
+    text = json.dumps(DOC)
+    parser = ItemStream("exercises")
+    first_done = text.index('}, {"name": "Dips"')
+    assert parser.feed(text[: first_done]) == []
+    assert parser.feed(text[first_done]) == [DOC["exercises"][0]]
+    assert not parser.complete
+
+
+def test_truncated_document_keeps_complete_items():
+    text = json.dumps(DOC)
+    parser = ItemStream("exercises")
+    parser.feed(text[: text.index("Dips") + 10])
+
+    assert not parser.complete
+    assert parser.result() == {
+        "template_name": DOC["template_name"],
+        "notes": DOC["notes"],
+        "exercises": DOC["exercises"][:1],
+    }
@@ -0,0 +1,236 @@
+import asyncio
+import time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from llm_cache import LLMCache, cache_key, is_json
+
+
+def fake_client(*contents, tokens=100):
+    client = AsyncMock()
+    client.chat.completions.create.side_effect = [
+        MagicMock(
+            choices=[MagicMock(message=MagicMock(content=content))],
+            usage=MagicMock(total_tokens=tokens),
+        )
+        for content in contents
+    ]
+    return client
+
+
+REQUEST = dict(
+    model="m",
+    messages=[{"role": "user", "content": "Leg Day: squats 3x5"}],
+    response_format={"type": "json_object"},
+)
+
+
+def test_cache_key_ignores_argument_order():
+    assert cache_key(a=1, b={"x": 1, "y": 2}) == cache_key(b={"y": 2, "x": 1}, a=1)
+    assert cache_key(a=1) != cache_key(a=2)
+
+
+@pytest.mark.asyncio
+async def test_identical_request_is_served_from_memory():
+    cache = LLMCache(path=None)
+    client = fake_client('{"a": 1}')
+
+    assert await cache.complete(client, **REQUEST) == '{"a": 1}'
+    assert await cache.complete(client, **REQUEST) == '{"a": 1}'
+    assert client.chat.completions.create.await_count == 1
+    stats = cache.snapshot()
+    assert (stats["memory_hits"], stats["misses"], stats["tokens_saved"]) == (1, 1, 100)
+
+
+@pytest.mark.asyncio
+async def test_refresh_and_invalid_content():
+    cache = LLMCache(path=None)
+    client = fake_client("not json", '{"a": 1}', '{"a": 2}')
+
+    assert await cache.complete(client, validate=is_json, **REQUEST) == "not json"
+    # The invalid answer was not cached
+    assert await cache.complete(client, validate=is_json, **REQUEST) == '{"a": 1}'
+    # refresh calls again and replaces the cached answer
+    assert await cache.complete(client, refresh=True, **REQUEST) == '{"a": 2}'
+    assert await cache.complete(client, **REQUEST) == '{"a": 2}'
+    assert client.chat.completions.create.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_not_used():
+    cache = LLMCache(path=None, ttl=-1)
+    client = fake_client('{"a": 1}', '{"a": 2}')
+    await cache.complete(client, **REQUEST)
+    assert await cache.complete(client, **REQUEST) == '{"a": 2}'
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_survives_restart_and_evicts(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite3")
+    cache = LLMCache(path=path, disk_entries=2)
+    client = fake_client('{"n": 0}', '{"n": 1}', '{"n": 2}')
+    for n in range(3):
+        await cache.complete(client, model="m", messages=[{"content": str(n)}])
+    await cache.close()
+
+    restarted = LLMCache(path=path, disk_entries=2)
+    assert await restarted.get(cache_key(model="m", messages=[{"content": "2"}])) == '{"n": 2}'
+    assert await restarted.get(cache_key(model="m", messages=[{"content": "0"}])) is None
+    assert restarted.snapshot()["disk_hits"] == 1
+    await restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_calls_in_flight(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite3")
+    cache = LLMCache(path=path)
+    release = asyncio.Event()
+    client = fake_client('{"a": 1}')
+    response = next(client.chat.completions.create.side_effect)
+
+    async def slow_create(**kwargs):
+        await release.wait()
+        return response
+
+    client.chat.completions.create.side_effect = slow_create
+    store_sync = cache._store_sync
+
+    def slow_store_sync(*args):
+        time.sleep(0.05)
+        store_sync(*args)
+
+    cache._store_sync = slow_store_sync
+    pending = asyncio.create_task(cache.complete(client, **REQUEST))
+    await asyncio.sleep(0)
+    closing = asyncio.create_task(cache.close())
+    await asyncio.sleep(0)
+    release.set()
+    assert await pending == '{"a": 1}'
+    # The answer is on disk by the time the caller gets it
+    reader = LLMCache(path=path)
+    assert await reader.get(cache_key(**REQUEST)) == '{"a": 1}'
+    await reader.close()
+    await closing
+    assert not cache._tasks
+
+    restarted = LLMCache(path=path)
+    assert await restarted.get(cache_key(**REQUEST)) == '{"a": 1}'
+    await restarted.close()
+
+
+def fake_stream(text, size=4):
+    async def chunks():
+        for i in range(0, len(text), size):
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content=text[i : i + size]))], usage=None)
+    return chunks()
+
+
+@pytest.mark.asyncio
+async def test_stream_delivers_deltas_and_caches_the_whole_answer():
+    cache = LLMCache(path=None)
+    client = AsyncMock()
+    client.chat.completions.create.return_value = fake_stream('{"a": [1, 2, 3]}')
+    deltas = []
+
+    async def on_text(delta):
+        deltas.append(delta)
+
+    assert await cache.stream(client, on_text, validate=is_json, **REQUEST) == '{"a": [1, 2, 3]}'
+    assert len(deltas) > 1
+    assert client.chat.completions.create.call_args.kwargs["stream"] is True
+
+    deltas.clear()
+    assert await cache.stream(client, on_text, **REQUEST) == '{"a": [1, 2, 3]}'
+    assert deltas == ['{"a": [1, 2, 3]}']
+    assert client.chat.completions.create.await_count == 1
+    # Streamed and non-streamed calls share entries
+    assert await cache.complete(client, **REQUEST) == '{"a": [1, 2, 3]}'
+
+
+def slow_stream(text, release: asyncio.Event, size=4):
+    async def chunks():
+        for i in range(0, len(text), size):
+            if i:
+                await release.wait()
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content=text[i : i + size]))], usage=None)
+    return chunks()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_share_one_call():
+    cache = LLMCache(path=None)
+    client = AsyncMock()
+    gate = asyncio.Event()
+
+    async def create(**request):
+        await gate.wait()
+        return MagicMock(
+            choices=[MagicMock(message=MagicMock(content='{"a": 1}'))],
+            usage=MagicMock(total_tokens=10),
+        )
+
+    client.chat.completions.create.side_effect = create
+    calls = [asyncio.create_task(cache.complete(client, **REQUEST)) for _ in range(3)]
+    await asyncio.sleep(0)
+    gate.set()
+
+    assert await asyncio.gather(*calls) == ['{"a": 1}'] * 3
+    assert client.chat.completions.create.await_count == 1
+    assert (cache.snapshot()["misses"], cache.snapshot()["coalesced"]) == (1, 2)
+
+
+@pytest.mark.asyncio
+async def test_coalesced_stream_outlives_a_cancelled_first_caller():
+    cache = LLMCache(path=None)
+    client = AsyncMock()
+    release = asyncio.Event()
+    client.chat.completions.create.return_value = slow_stream('{"a": [1, 2, 3]}', release)
+    first_deltas, second_deltas = [], []
+
+    async def on_first(delta):
+        first_deltas.append(delta)
+
+    async def on_second(delta):
+        second_deltas.append(delta)
+
+    first = asyncio.create_task(cache.stream(client, on_first, **REQUEST))
+    while not first_deltas:
+        await asyncio.sleep(0)
+    second = asyncio.create_task(cache.stream(client, on_second, **REQUEST))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+
+    # The joiner gets every delta, including those sent before it joined
+    assert await second == '{"a": [1, 2, 3]}'
+    assert "".join(second_deltas) == '{"a": [1, 2, 3]}'
+    assert first.cancelled()
+    assert client.chat.completions.create.await_count == 1
+    assert cache.snapshot()["coalesced"] == 1
+
+
+@pytest.mark.asyncio
+async def test_coalesced_requests_share_the_error():
+    cache = LLMCache(path=None)
+    client = AsyncMock()
+    gate = asyncio.Event()
+
+    async def create(**request):
+        await gate.wait()
+        raise RuntimeError("provider down")
+
+    client.chat.completions.create.side_effect = create
+    calls = [asyncio.create_task(cache.complete(client, **REQUEST)) for _ in range(2)]
+    await asyncio.sleep(0)
+    gate.set()
+
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    assert [str(r) for r in results] == ["provider down"] * 2
+    assert client.chat.completions.create.await_count == 1
+    # A failed flight is not reused
+    client.chat.completions.create.side_effect = None
+    client.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content='{"a": 1}'))], usage=None
+    )
+    assert await cache.complete(client, **REQUEST) == '{"a": 1}'
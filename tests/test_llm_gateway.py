@@ -0,0 +1,229 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+
+from llm_gateway import LLMGateway
+
+
+class FakeOpenAI:
+    """Minimal OpenAI-compatible HTTP server for /v1/chat/completions.
+
+    `plan(request_number, body)` returns a dict with optional "delay",
+    "status" and "content" for each request.
+    """
+
+    def __init__(self):
+        self.plan = lambda n, body: {}
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = json.loads(await reader.readexactly(int(headers["content-length"])))
+                if not await self._respond(body, writer):
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, body, writer) -> bool:
+        """Answer one request; False when the connection must be closed."""
+        self.requests += 1
+        plan = self.plan(self.requests, body)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(plan.get("delay", 0))
+        finally:
+            self.in_flight -= 1
+        status = plan.get("status", 200)
+        content = plan.get("content", '{"ok": true}')
+        if status != 200:
+            payload = json.dumps({"error": {"message": "boom", "type": "server_error"}})
+            writer.write(
+                f"HTTP/1.1 {status} Error\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n{payload}".encode()
+            )
+            await writer.drain()
+            return True
+        if body.get("stream"):
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                b"Connection: close\r\n\r\n"
+            )
+            for i in range(0, len(content), 4):
+                chunk = {
+                    "id": "c", "object": "chat.completion.chunk", "created": 0,
+                    "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": content[i:i + 4]}}],
+                }
+                writer.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            writer.write(b"data: [DONE]\n\n")
+            await writer.drain()
+            return False
+        payload = json.dumps({
+            "id": "c", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 5, "total_tokens": 10},
+        })
+        writer.write(
+            f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n{payload}".encode()
+        )
+        await writer.drain()
+        return True
+
+
+@pytest_asyncio.fixture
+async def fake_openai():
+    server = FakeOpenAI()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+@pytest_asyncio.fixture
+async def make_gateway(fake_openai):
+    gateways = []
+
+    def make(**kwargs):
+        kwargs.setdefault("backoff", 0.01)
+        gateway = LLMGateway(api_key="sk-test", base_url=fake_openai.base_url, **kwargs)
+        gateways.append(gateway)
+        return gateway
+
+    yield make
+    for gateway in gateways:
+        await gateway.aclose()
+
+
+REQUEST = dict(model="m", messages=[{"role": "user", "content": "hi"}])
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped_under_load(fake_openai, make_gateway):
+    fake_openai.plan = lambda n, body: {"delay": 0.02}
+    gateway = make_gateway(max_concurrency=4, max_per_user=2)
+
+    async def call(user_id):
+        client = gateway.client("coach", user_id)
+        response = await client.chat.completions.create(**REQUEST)
+        return response.choices[0].message.content
+
+    results = await asyncio.gather(*[call(i % 10) for i in range(40)])
+
+    assert results == ['{"ok": true}'] * 40
+    assert fake_openai.max_in_flight <= 4
+    # Pooled keep-alive connections are reused across calls
+    assert fake_openai.connections <= 8
+    assert gateway.snapshot()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_per_user_limit(fake_openai, make_gateway):
+    fake_openai.plan = lambda n, body: {"delay": 0.02}
+    gateway = make_gateway(max_concurrency=10, max_per_user=2)
+    client = gateway.client("coach", 1)
+
+    await asyncio.gather(*[client.chat.completions.create(**REQUEST) for _ in range(6)])
+    assert fake_openai.max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_server_errors_are_retried(fake_openai, make_gateway):
+    fake_openai.plan = lambda n, body: {"status": 500} if n <= 2 else {}
+    gateway = make_gateway(retries=2)
+
+    response = await gateway.client("coach").chat.completions.create(**REQUEST)
+    assert response.choices[0].message.content == '{"ok": true}'
+    assert gateway.retried == 2
+
+
+@pytest.mark.asyncio
+async def test_flow_timeout(fake_openai, make_gateway):
+    fake_openai.plan = lambda n, body: {"delay": 0.5}
+    gateway = make_gateway(timeouts={"template_text": 0.1})
+
+    with pytest.raises(TimeoutError):
+        await gateway.client("template_text").chat.completions.create(**REQUEST)
+    assert gateway.timeouts_hit >= 1
+    assert gateway.snapshot()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged_after_p95(fake_openai, make_gateway):
+    fake_openai.plan = lambda n, body: (
+        {"delay": 0.5, "content": "slow"} if n == 1 else {"content": "fast"}
+    )
+    gateway = make_gateway(hedge=True)
+    for _ in range(20):
+        gateway._record("coach", 0.05)
+
+    response = await gateway.client("coach").chat.completions.create(**REQUEST)
+    assert response.choices[0].message.content == "fast"
+    assert (gateway.hedges, gateway.hedge_wins) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_stream_holds_its_slot_until_consumed(fake_openai, make_gateway):
+    fake_openai.plan = lambda n, body: {"content": '{"exercises": [1, 2, 3]}'}
+    gateway = make_gateway()
+
+    stream = await gateway.client("coach", 7).chat.completions.create(stream=True, **REQUEST)
+    assert gateway.in_flight == 1
+    text = "".join([chunk.choices[0].delta.content async for chunk in stream])
+    assert text == '{"exercises": [1, 2, 3]}'
+    assert gateway.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_after_failures_and_recovers(fake_openai, make_gateway):
+    from llm_gateway import CircuitBreaker, CircuitOpenError
+
+    healthy = False
+    fake_openai.plan = lambda n, body: {} if healthy else {"status": 500}
+    gateway = make_gateway(retries=0, breaker=CircuitBreaker(failures=2, reset=0.1))
+    client = gateway.client("coach")
+
+    for _ in range(2):
+        with pytest.raises(Exception):
+            await client.chat.completions.create(**REQUEST)
+    assert gateway.breaker.state == "open"
+    requests = fake_openai.requests
+    with pytest.raises(CircuitOpenError):
+        await client.chat.completions.create(**REQUEST)
+    assert fake_openai.requests == requests
+
+    await asyncio.sleep(0.1)
+    assert gateway.breaker.state == "half-open"
+    healthy = True
+    await client.chat.completions.create(**REQUEST)
+    assert gateway.breaker.state == "closed"
+    assert gateway.snapshot()["breaker_trips"] == 1
@@ -0,0 +1,70 @@
+import pytest
+from unittest.mock import AsyncMock
+
+from handlers.common import MessageTracker, ProgressMessage
+
+
+@pytest.mark.asyncio
+async def test_replace_last_is_per_chat():
+    tracker = MessageTracker()
+    bot = AsyncMock()
+
+    await tracker.replace_last(bot, 1, 10)
+    await tracker.replace_last(bot, 2, 20)
+    bot.delete_message.assert_not_called()
+
+    await tracker.replace_last(bot, 1, 11)
+    bot.delete_message.assert_awaited_once_with(chat_id=1, message_id=10)
+    assert tracker.get(1) == 11
+    assert tracker.get(2) == 20
+
+
+@pytest.mark.asyncio
+async def test_replace_last_keeps_the_same_message():
+    tracker = MessageTracker()
+    bot = AsyncMock()
+    await tracker.replace_last(bot, 1, 10)
+    await tracker.replace_last(bot, 1, 10)
+    bot.delete_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_delete_last_forgets_and_tolerates_errors():
+    tracker = MessageTracker()
+    bot = AsyncMock()
+    bot.delete_message.side_effect = Exception("message to delete not found")
+    tracker.track(1, 10)
+
+    await tracker.delete_last(bot, 1)
+    assert tracker.get(1) is None
+
+    await tracker.delete_last(bot, 1)
+    assert bot.delete_message.await_count == 1
+
+
+def test_bounded_and_mirrored_into_store():
+    store = {5: 50, 6: 60, 7: 70}
+    tracker = MessageTracker(maxsize=2)
+    tracker.attach(store)
+    assert store == {6: 60, 7: 70}
+    assert tracker.get(6) == 60
+
+    tracker.track(8, 80)  # evicts chat 7, the least recently used
+    assert len(tracker) == 2
+    assert tracker.get(7) is None
+    assert store == {6: 60, 8: 80}
+
+    tracker.forget(6)
+    assert store == {8: 80}
+
+
+@pytest.mark.asyncio
+async def test_progress_message_is_rate_limited():
+    bot = AsyncMock()
+    progress = ProgressMessage(bot, 1, 10, interval=60)
+
+    await progress.update("a")
+    await progress.update("ab")  # too soon
+    await progress.update("ab", force=True)
+    await progress.update("ab", force=True)  # unchanged
+    assert [c.kwargs["text"] for c in bot.edit_message_text.call_args_list] == ["a", "ab"]
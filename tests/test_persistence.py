@@ -0,0 +1,121 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from telegram.ext import PicklePersistence
+
+from persistence import KeyValuePersistence, PostgresPersistence, SQLitePersistence, USER_DATA
+from scripts.migrate_pickle import migrate
+
+
+def _persistence():
+    conn = MagicMock()
+    conn.execute = AsyncMock()
+    engine = MagicMock()
+    engine.begin.return_value.__aenter__ = AsyncMock(return_value=conn)
+    engine.begin.return_value.__aexit__ = AsyncMock(return_value=False)
+    return PostgresPersistence(db_engine=engine), conn
+
+
+@pytest.mark.asyncio
+async def test_only_changed_entries_are_written():
+    persistence, conn = _persistence()
+
+    await persistence.update_user_data(1, {"rest": 90})
+    (_, rows), _ = conn.execute.await_args
+    assert [row["key"] for row in rows] == ["1"]
+
+    conn.execute.reset_mock()
+    await persistence.update_user_data(1, {"rest": 90})
+    conn.execute.assert_not_awaited()
+
+    await persistence.update_user_data(1, {"rest": 120})
+    conn.execute.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_updates_from_one_run_share_a_batch():
+    persistence, conn = _persistence()
+
+    await asyncio.gather(
+        *(persistence.update_user_data(user_id, {"n": user_id}) for user_id in range(5))
+    )
+
+    conn.execute.assert_awaited_once()
+    (_, rows), _ = conn.execute.await_args
+    assert sorted(int(row["key"]) for row in rows) == list(range(5))
+
+
+@pytest.mark.asyncio
+async def test_failed_write_is_retried_on_next_flush():
+    persistence, conn = _persistence()
+    conn.execute.side_effect = [ConnectionError("db down"), None]
+
+    with pytest.raises(ConnectionError):
+        await persistence.update_user_data(1, {"rest": 90})
+    await persistence.flush()
+
+    assert conn.execute.await_count == 2
+    assert (USER_DATA, "1") in persistence._written
+
+
+@pytest.mark.asyncio
+async def test_sqlite_round_trip_and_drop(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    persistence = SQLitePersistence(path)
+    assert await persistence.get_user_data() == {}
+
+    await persistence.update_user_data(1, {"rest": 90})
+    await persistence.update_user_data(2, {"rest": 60})
+    await persistence.update_conversation("workout", (1, 1), 3)
+    await persistence.drop_user_data(2)
+    await persistence.flush()
+
+    reloaded = SQLitePersistence(path)
+    assert await reloaded.get_user_data() == {1: {"rest": 90}}
+    assert await reloaded.get_conversations("workout") == {(1, 1): 3}
+
+
+@pytest.mark.asyncio
+async def test_migrate_pickle_into_sqlite(tmp_path):
+    source = PicklePersistence(filepath=tmp_path / "storage.pickle")
+    await source.get_user_data()
+    await source.update_user_data(7, {"default_rest_seconds": 120})
+    await source.update_chat_data(7, {"seen": True})
+
+    target = SQLitePersistence(str(tmp_path / "state.sqlite3"))
+    assert await migrate(str(tmp_path / "storage.pickle"), target) == 1
+
+    reloaded = SQLitePersistence(str(tmp_path / "state.sqlite3"))
+    assert await reloaded.get_user_data() == {7: {"default_rest_seconds": 120}}
+    assert await reloaded.get_chat_data() == {7: {"seen": True}}
+
+
+@pytest.mark.asyncio
+async def test_empty_store_imports_legacy_pickle_once(tmp_path):
+    legacy = str(tmp_path / "storage.pickle")
+    source = PicklePersistence(filepath=legacy)
+    await source.get_user_data()
+    await source.update_user_data(7, {"default_rest_seconds": 120})
+    await source.update_conversation("workout", (7, 7), 2)
+
+    path = str(tmp_path / "state.sqlite3")
+    upgraded = SQLitePersistence(path, legacy_pickle=legacy)
+    assert await upgraded.get_user_data() == {7: {"default_rest_seconds": 120}}
+    assert await upgraded.get_conversations("workout") == {(7, 7): 2}
+    await upgraded.update_user_data(7, {"default_rest_seconds": 60})
+    await upgraded.flush()
+
+    # The store is no longer empty, so the stale pickle is not imported again
+    restarted = SQLitePersistence(path, legacy_pickle=legacy)
+    assert await restarted.get_user_data() == {7: {"default_rest_seconds": 60}}
+
+
+def test_store_missing_a_method_fails_at_creation():
+    class NoStore(KeyValuePersistence):
+        async def _setup(self):
+            pass
+
+    with pytest.raises(TypeError, match="_fetch_all"):
+        NoStore()
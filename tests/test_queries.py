@@ -0,0 +1,353 @@
+import datetime
+import os
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import (
+    Base,
+    DailyWorkoutSummary,
+    Template,
+    TemplateExercise,
+    User,
+    WorkoutLog,
+    WorkoutSession,
+)
+from lru import LRUCache
+from queries import (
+    backfill_daily_summary,
+    bump_template_weights,
+    get_last_performance,
+    get_last_performances,
+    save_workout_logs,
+    session_summary_query,
+    stored_journal_ids,
+    summarize_logs,
+)
+
+
+def _row(exercise, weight, reps, timestamp, template="Push", user_id=1, session_id=1):
+    return {
+        "user_id": user_id,
+        "session_id": session_id,
+        "template_name": template,
+        "exercise_name": exercise,
+        "sets": 1,
+        "weight": weight,
+        "reps": reps,
+        "timestamp": timestamp,
+    }
+
+
+def test_summarize_logs_groups_by_user_day_and_session():
+    utc = datetime.timezone.utc
+    morning = datetime.datetime(2026, 3, 2, 9, 0, tzinfo=utc)
+    rows = [
+        _row("Bench Press", 60, 5, morning),
+        _row("Bench Press", 60, 5, morning),
+        _row("Overhead Press", 40, 8, morning),
+        _row("Squat", 100, 5, morning, template=None, session_id=2),
+        _row("Squat", 100, 5, morning + datetime.timedelta(days=1), session_id=3),
+    ]
+
+    summaries = {
+        (s["user_id"], s["day"], s["session_id"]): s for s in summarize_logs(rows)
+    }
+
+    push = summaries[(1, datetime.date(2026, 3, 2), 1)]
+    assert push["template_name"] == "Push"
+    assert push["set_count"] == 3
+    assert push["exercise_count"] == 2
+    assert push["volume"] == 60 * 5 * 2 + 40 * 8
+    assert summaries[(1, datetime.date(2026, 3, 2), 2)]["template_name"] == ""
+    assert summaries[(1, datetime.date(2026, 3, 3), 3)]["volume"] == 500
+
+
+def test_summarize_logs_skips_rows_without_a_session():
+    now = datetime.datetime(2026, 3, 2, 9, 0, tzinfo=datetime.timezone.utc)
+
+    assert summarize_logs([_row("Squat", 100, 5, now, session_id=None)]) == []
+
+
+def test_summarize_logs_uses_the_utc_day():
+    late_evening = datetime.datetime(
+        2026, 3, 2, 23, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=-5))
+    )
+
+    (summary,) = summarize_logs([_row("Deadlift", 140, 3, late_evening)])
+
+    assert summary["day"] == datetime.date(2026, 3, 3)
+
+
+def _mock_session_factory(last=None):
+    session = MagicMock()
+    result = MagicMock()
+    result.scalar_one_or_none.return_value = last
+    session.execute = AsyncMock(return_value=result)
+    session.commit = AsyncMock()
+    factory = MagicMock()
+    factory.return_value.__aenter__ = AsyncMock(return_value=session)
+    factory.return_value.__aexit__ = AsyncMock(return_value=False)
+    return factory, session
+
+
+@pytest.mark.asyncio
+async def test_last_performance_is_cached_until_logs_are_written():
+    last = MagicMock(sets=1, weight=80.0, reps=5)
+    factory, session = _mock_session_factory(last)
+    timestamp = datetime.datetime(2026, 3, 2, 9, 0, tzinfo=datetime.timezone.utc)
+
+    with (
+        patch("queries.AsyncSessionLocal", factory),
+        patch("queries.last_performance_cache", LRUCache(10)),
+    ):
+        assert await get_last_performance(1, "Squat") == (1, 80.0, 5)
+        assert await get_last_performance(1, "Squat") == (1, 80.0, 5)
+        assert session.execute.await_count == 1
+
+        await save_workout_logs([_row("Squat", 85.0, 5, timestamp)])
+        session.execute.reset_mock()
+
+        last.weight = 85.0
+        assert await get_last_performance(1, "Squat") == (1, 85.0, 5)
+        assert session.execute.await_count == 1
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_last_performances_fetches_only_uncached_names_in_one_pass():
+    factory, session = _mock_session_factory()
+    from_table = MagicMock(exercise_name="Bench Press", sets=1, weight=60.0, reps=5)
+    from_logs = MagicMock(exercise_name="Row", sets=1, weight=50.0, reps=8)
+    table_result, logs_result = MagicMock(), MagicMock()
+    table_result.scalars.return_value.all.return_value = [from_table]
+    logs_result.scalars.return_value.all.return_value = [from_logs]
+    session.execute = AsyncMock(side_effect=[table_result, logs_result])
+    cache = LRUCache(10)
+    cache.put((1, "Squat"), (1, 100.0, 5))
+
+    with (
+        patch("queries.AsyncSessionLocal", factory),
+        patch("queries.last_performance_cache", cache),
+    ):
+        performances = await get_last_performances(
+            1, ["Squat", "Bench Press", "Row", "Curl"]
+        )
+
+    assert performances == {
+        "Squat": (1, 100.0, 5),
+        "Bench Press": (1, 60.0, 5),
+        "Row": (1, 50.0, 8),
+        "Curl": None,
+    }
+    assert session.execute.await_count == 2
+    assert cache.get((1, "Curl")) is None
+
+
+@pytest.mark.asyncio
+async def test_bump_template_weights_is_one_update_scoped_to_the_user():
+    factory, session = _mock_session_factory()
+    session.execute.return_value.rowcount = 4
+
+    with patch("queries.AsyncSessionLocal", factory):
+        changed = await bump_template_weights(1, 2.5, template_id=7)
+
+    assert changed == 4
+    (statement, params), _ = session.execute.await_args
+    assert str(statement).startswith("UPDATE template_exercises")
+    assert "t.id = :template_id" in str(statement)
+    assert params == {"user_id": 1, "delta": 2.5, "template_id": 7}
+    session.commit.assert_awaited_once()
+
+
+# A scratch Postgres database, e.g. postgresql+asyncpg://postgres@localhost/gymbot_test;
+# its tables are dropped and recreated
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+@pytest.mark.asyncio
+async def test_bump_template_weights_changes_stored_weights():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        async with factory() as session:
+            session.add_all([User(id=1), User(id=2)])
+            push = Template(name="Push", user_id=1)
+            legs = Template(name="Legs", user_id=1)
+            other = Template(name="Push", user_id=2)
+            session.add_all([push, legs, other])
+            await session.flush()
+            session.add_all([
+                TemplateExercise(
+                    template_id=push.id, exercise_name="Bench Press", default_weight=60,
+                    sets_config=[{"weight": 60, "reps": 5}, {"weight": 62.5, "reps": 3}],
+                ),
+                TemplateExercise(
+                    template_id=push.id, exercise_name="Dips", default_weight=0,
+                    sets_config=[{"weight": 0, "reps": 10}],
+                ),
+                TemplateExercise(template_id=push.id, exercise_name="Press", default_weight=40),
+                TemplateExercise(
+                    template_id=legs.id, exercise_name="Squat", default_weight=100,
+                    sets_config=[{"weight": 100, "reps": 5}],
+                ),
+                TemplateExercise(
+                    template_id=other.id, exercise_name="Bench Press", default_weight=80,
+                    sets_config=[{"weight": 80, "reps": 5}],
+                ),
+            ])
+            await session.commit()
+
+        with patch("queries.AsyncSessionLocal", factory):
+            assert await bump_template_weights(1, 2.5, template_id=push.id) == 3
+
+        async with factory() as session:
+            rows = {
+                (te.template_id, te.exercise_name): te
+                for te in (await session.execute(select(TemplateExercise))).scalars()
+            }
+        bench = rows[(push.id, "Bench Press")]
+        assert bench.default_weight == 62.5
+        assert bench.get_sets_config() == [{"weight": 62.5, "reps": 5}, {"weight": 65, "reps": 3}]
+        # Bodyweight sets and exercises without sets_config
+        assert rows[(push.id, "Dips")].get_sets_config() == [{"weight": 0, "reps": 10}]
+        assert rows[(push.id, "Press")].default_weight == 42.5
+        assert rows[(push.id, "Press")].get_sets_config() is None
+        # Other templates and other users are untouched
+        assert rows[(legs.id, "Squat")].get_sets_config() == [{"weight": 100, "reps": 5}]
+        assert rows[(other.id, "Bench Press")].default_weight == 80
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+@pytest.mark.asyncio
+async def test_save_workout_logs_rolls_up_by_session():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        utc = datetime.timezone.utc
+        morning = datetime.datetime(2026, 3, 2, 9, 0, tzinfo=utc)
+        async with factory() as session:
+            session.add(User(id=1))
+            await session.flush()
+            push = WorkoutSession(user_id=1, template_name="Push", started_at=morning)
+            legs = WorkoutSession(user_id=1, template_name="Legs", started_at=morning)
+            session.add_all([push, legs])
+            await session.commit()
+
+        with patch("queries.AsyncSessionLocal", factory):
+            await save_workout_logs([
+                _row("Bench Press", 60, 5, morning, session_id=push.id),
+                _row("Squat", 100, 5, morning, template="Legs", session_id=legs.id),
+            ])
+            # A second batch on the same day: distinct exercises are recounted
+            await save_workout_logs([
+                _row("Bench Press", 60, 5, morning, session_id=push.id),
+                _row("Dips", 0, 10, morning, session_id=push.id),
+                # Midnight UTC already belongs to the next day
+                _row(
+                    "Dips", 0, 10, datetime.datetime(2026, 3, 3, 0, 0, tzinfo=utc),
+                    session_id=push.id,
+                ),
+            ])
+
+            async with factory() as session:
+                result = await session.execute(select(DailyWorkoutSummary))
+                summaries = {(s.day, s.session_id): s for s in result.scalars()}
+
+            day = datetime.date(2026, 3, 2)
+            assert summaries[(day, push.id)].template_name == "Push"
+            assert summaries[(day, push.id)].set_count == 3
+            assert summaries[(day, push.id)].exercise_count == 2
+            assert summaries[(day, legs.id)].exercise_count == 1
+            assert summaries[(datetime.date(2026, 3, 3), push.id)].exercise_count == 1
+
+            # /history lists the push session once, across both days
+            async with factory() as session:
+                result = await session.execute(
+                    session_summary_query(1, datetime.date(2026, 3, 1))
+                )
+                sessions = {s.session_id: s for s in result.all()}
+            assert sessions[push.id].day == day
+            assert sessions[push.id].set_count == 4
+            assert sessions[push.id].exercise_count == 3
+            assert sessions[legs.id].set_count == 1
+
+            # The backfill recomputes the same rows
+            assert await backfill_daily_summary() == 3
+            async with factory() as session:
+                result = await session.execute(select(DailyWorkoutSummary))
+                rebuilt = {(s.day, s.session_id): s for s in result.scalars()}
+            assert {
+                key: (s.set_count, s.exercise_count, s.volume) for key, s in rebuilt.items()
+            } == {
+                key: (s.set_count, s.exercise_count, s.volume) for key, s in summaries.items()
+            }
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+@pytest.mark.asyncio
+async def test_save_workout_logs_skips_journal_ids_already_stored():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        morning = datetime.datetime(2026, 3, 2, 9, 0, tzinfo=datetime.timezone.utc)
+        async with factory() as session:
+            session.add(User(id=1))
+            await session.flush()
+            push = WorkoutSession(user_id=1, template_name="Push", started_at=morning)
+            session.add(push)
+            await session.commit()
+
+        first = dict(_row("Bench Press", 60, 5, morning, session_id=push.id), journal_id="a")
+        second = dict(_row("Dips", 0, 10, morning, session_id=push.id), journal_id="b")
+        with patch("queries.AsyncSessionLocal", factory):
+            assert await save_workout_logs([first]) == 1
+            # A replay of the same entry alongside a new one
+            assert await save_workout_logs([first, second]) == 1
+            assert await save_workout_logs([first, second]) == 0
+            assert await stored_journal_ids(["a", "b", "c"]) == {"a", "b"}
+
+            async with factory() as session:
+                logs = (await session.execute(select(WorkoutLog))).scalars().all()
+                (summary,) = (
+                    await session.execute(select(DailyWorkoutSummary))
+                ).scalars().all()
+        assert sorted(log.journal_id for log in logs) == ["a", "b"]
+        assert summary.set_count == 2
+        assert summary.volume == 60 * 5
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from unittest.mock import MagicMock
+from telegram import Update
+
+from update_processor import PerUserUpdateProcessor
+
+
+def _update(user_id):
+    update = MagicMock(spec=Update)
+    update.effective_user.id = user_id
+    return update
+
+
+@pytest.mark.asyncio
+async def test_same_user_runs_in_order_other_users_in_parallel():
+    processor = PerUserUpdateProcessor()
+    events = []
+    release_first = asyncio.Event()
+
+    async def handle(name, wait=None):
+        events.append(f"{name} start")
+        if wait is not None:
+            await wait.wait()
+        events.append(f"{name} end")
+
+    first = asyncio.create_task(
+        processor.process_update(_update(1), handle("u1-a", release_first))
+    )
+    second = asyncio.create_task(processor.process_update(_update(1), handle("u1-b")))
+    other = asyncio.create_task(processor.process_update(_update(2), handle("u2")))
+    await asyncio.wait_for(other, 1)
+
+    # User 2 finished while user 1's first update is still blocked
+    assert events == ["u1-a start", "u2 start", "u2 end"]
+    assert processor.queue_depth(1) == 2
+
+    release_first.set()
+    await asyncio.wait_for(asyncio.gather(first, second), 1)
+    assert events[3:] == ["u1-a end", "u1-b start", "u1-b end"]
+
+    stats = processor.snapshot()
+    assert stats["max_queue_depth"] == 2
+    assert stats["lock_waits"] == 3
+    assert stats["lock_wait_max_ms"] > 0
+    # Idle users are not kept around
+    assert stats["active_users"] == 0
+    assert processor.queue_depth(1) == 0
+
+
+@pytest.mark.asyncio
+async def test_lock_released_when_handler_fails():
+    processor = PerUserUpdateProcessor()
+
+    async def boom():
+        raise RuntimeError("handler failed")
+
+    async def ok():
+        return None
+
+    with pytest.raises(RuntimeError):
+        await processor.process_update(_update(1), boom())
+    await asyncio.wait_for(processor.process_update(_update(1), ok()), 1)
+    assert processor.snapshot()["active_users"] == 0
+
+
+@pytest.mark.asyncio
+async def test_updates_without_user_are_not_serialized():
+    processor = PerUserUpdateProcessor()
+
+    async def ok():
+        return None
+
+    await processor.process_update(object(), ok())
+    assert processor.snapshot()["lock_waits"] == 0
+
+
+@pytest.mark.asyncio
+async def test_one_users_burst_does_not_starve_other_users():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+    release = asyncio.Event()
+
+    async def handle(wait=None):
+        if wait is not None:
+            await wait.wait()
+
+    burst = [
+        asyncio.create_task(processor.process_update(_update(1), handle(release)))
+        for _ in range(10)
+    ]
+    await asyncio.sleep(0)
+    # Only the update holding user 1's lock takes a slot
+    assert processor.snapshot()["in_flight"] == 1
+
+    await asyncio.wait_for(processor.process_update(_update(2), handle()), 1)
+
+    release.set()
+    await asyncio.wait_for(asyncio.gather(*burst), 1)
+    assert processor.snapshot()["in_flight"] == 0
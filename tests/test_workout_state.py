@@ -0,0 +1,202 @@
+import math
+import pickle
+import struct
+
+import pytest
+
+from handlers.workout_state import ExerciseState, WorkoutState, upgrade_legacy_workout
+
+
+def _workout():
+    workout = WorkoutState(session_id=7, template_name="Push Day")
+    bench = workout.add_exercise(
+        "Bench Press",
+        3,
+        3,
+        60.0,
+        8,
+        [{"weight": 60.0, "reps": 8}, {"weight": 62.5, "reps": 6}],
+    )
+    workout.add_exercise("Dips", None, 3, 0.0, 12)
+    bench.log(1, 60.0, 8)
+    bench.log(3, 65.0, 5)
+    workout.previous = {"Bench Press": (3, 57.5, 8), "Dips": None}
+    workout.current_id = 1
+    return workout
+
+
+def test_exercise_plan_and_logging():
+    bench = _workout().exercises[0]
+    assert bench.planned(2) == (62.5, 6)
+    assert bench.planned(3) == (60.0, 8)  # falls back to the defaults
+    assert bench.logged_count == 3
+    assert bench.logged(1) == (60.0, 8)
+    assert bench.logged(2) is None
+    assert math.isnan(bench.weights[1])
+    assert list(bench.completed_sets()) == [(60.0, 8), (65.0, 5)]
+
+
+def test_tally_adds_only_complete_sets():
+    workout = _workout()
+    workout.tally(workout.exercises[0])
+    assert workout.set_count == 2
+    assert workout.total_volume == 60.0 * 8 + 65.0 * 5
+
+
+def test_binary_round_trip():
+    workout = _workout()
+    restored = WorkoutState.from_bytes(workout.to_bytes())
+    assert restored.session_id == 7
+    assert restored.template_name == "Push Day"
+    assert restored.next_exercise_id == 2
+    assert restored.current_id == 1
+    assert restored.previous == workout.previous
+    assert [ex.name for ex in restored.active()] == ["Bench Press", "Dips"]
+    assert restored.exercises[1].catalog_id is None
+    assert restored.exercises[0].plan() == workout.exercises[0].plan()
+    assert restored.exercises[0].logged(3) == (65.0, 5)
+    assert restored.exercises[0].logged(2) is None
+
+
+def test_pickles_through_compact_encoding():
+    workout = _workout()
+    restored = pickle.loads(pickle.dumps(workout))
+    assert isinstance(restored, WorkoutState)
+    assert isinstance(restored.exercises[0], ExerciseState)
+    assert restored.exercises[0].logged(1) == (60.0, 8)
+
+    as_dicts = {
+        "session_id": 7,
+        "template_name": "Push Day",
+        "exercises": [
+            {
+                "id": ex.id,
+                "name": ex.name,
+                "catalog_id": ex.catalog_id,
+                "default_sets": ex.default_sets,
+                "default_weight": ex.default_weight,
+                "default_reps": ex.default_reps,
+                "sets_config": [{"weight": w, "reps": r} for w, r in ex.plan()],
+            }
+            for ex in workout.exercises.values()
+        ],
+        "previous": workout.previous,
+        "current_id": 1,
+        "logged_sets": {0: [{"weight": 60.0, "reps": 8}, {}, {"weight": 65.0, "reps": 5}]},
+    }
+    assert len(pickle.dumps(workout)) < len(pickle.dumps(as_dicts))
+
+
+def test_rejects_unknown_encoding():
+    data = bytearray(_workout().to_bytes())
+    data[2] = 99
+    with pytest.raises(ValueError):
+        WorkoutState.from_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        WorkoutState.from_bytes(b"XX")
+
+
+def test_skip_and_complete_keep_ids_stable():
+    workout = _workout()
+    squat = workout.add_exercise("Squat", None, 3, 100.0, 5)
+    squat.log(1, 100.0, 5)
+
+    assert workout.drop(0).name == "Bench Press"
+    assert workout.get(0) is None
+    # Ids of the remaining exercises (and their logged sets) are untouched
+    assert workout.get(2).logged(1) == (100.0, 5)
+    assert workout.next_active(0) == 1
+
+    assert workout.complete(2) is squat
+    assert workout.set_count == 1
+    assert workout.complete(2) is None  # a second, stale complete is a no-op
+    assert workout.drop(2) is None
+    assert workout.set_count == 1
+    assert [ex.id for ex in workout.active()] == [1]
+    assert workout.next_active(2) == 1
+
+    restored = WorkoutState.from_bytes(workout.to_bytes())
+    assert restored.completed == {2}
+    assert 0 not in restored.exercises
+    assert [ex.id for ex in restored.active()] == [1]
+
+
+def test_decodes_version_1():
+    data = bytearray(b"WS")
+    data += struct.pack("<BqIiId", 1, 7, 2, 1, 0, 0.0)
+    data += struct.pack("<H", 3) + b"Leg"
+    data += struct.pack("<H", 2)
+    for ex_id, name in ((4, b"Squat"), (5, b"Lunge")):
+        data += struct.pack("<IidHi", ex_id, -1, 100.0, 3, 5)
+        data += struct.pack("<H", len(name)) + name
+        data += struct.pack("<H", 0) + struct.pack("<H", 0)
+    data += struct.pack("<H", 0)
+
+    restored = WorkoutState.from_bytes(bytes(data))
+    assert restored.order == [4, 5]
+    # The old list position 1 becomes the id of the exercise at that position
+    assert restored.current_id == 5
+    assert restored.completed == set()
+
+
+def test_upgrades_a_legacy_dict_workout():
+    # user_data as persisted before WorkoutState: Bench Press was completed,
+    # so the list starts at Squat and logged sets are keyed by list position
+    user_data = pickle.loads(pickle.dumps({
+        "current_workout": {
+            "session_id": 7,
+            "template_name": "Leg Day",
+            "exercises": [
+                {
+                    "id": 1,
+                    "name": "Squat",
+                    "catalog_id": 12,
+                    "default_sets": 3,
+                    "default_weight": 100.0,
+                    "default_reps": 5,
+                    "sets_config": [{"weight": 100.0, "reps": 5}],
+                },
+                {
+                    "id": 2,
+                    "name": "Lunge",
+                    "catalog_id": None,
+                    "default_sets": 2,
+                    "default_weight": 20.0,
+                    "default_reps": 10,
+                    "sets_config": None,
+                },
+            ],
+            "next_exercise_id": 3,
+            "previous": {"Squat": (3, 95.0, 5), "Lunge": None},
+            "current_index": 1,
+            "logged_sets": {
+                0: [{"weight": 100.0, "reps": 5}, {"weight": None, "reps": None},
+                    {"weight": 102.5, "reps": 4}],
+            },
+            "set_count": 3,
+            "total_volume": 1440.0,
+        },
+        "selected_exercise": 1,
+    }))
+
+    assert upgrade_legacy_workout(user_data)
+    workout = user_data["current_workout"]
+    assert isinstance(workout, WorkoutState)
+    assert workout.session_id == 7
+    assert workout.template_name == "Leg Day"
+    assert workout.order == [1, 2]
+    assert workout.next_exercise_id == 3
+    assert workout.current_id == 2
+    assert workout.set_count == 3 and workout.total_volume == 1440.0
+    assert workout.previous == {"Squat": (3, 95.0, 5), "Lunge": None}
+    squat = workout.get(1)
+    assert squat.catalog_id == 12
+    assert squat.plan() == [(100.0, 5)]
+    assert squat.logged(2) is None
+    assert list(squat.completed_sets()) == [(100.0, 5), (102.5, 4)]
+    assert workout.get(2).logged_count == 0
+    # The upgraded workout persists in the compact encoding
+    assert WorkoutState.from_bytes(workout.to_bytes()).get(1).logged(3) == (102.5, 4)
+
+    assert not upgrade_legacy_workout(user_data)
+    assert not upgrade_legacy_workout({})
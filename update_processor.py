@@ -0,0 +1,124 @@
+"""Concurrent update processing that keeps each user's updates in order.
+
+Updates of different users run in parallel, so a slow LLM call for one user
+no longer stalls everyone else. Updates of the same user are serialized
+through a per-user asyncio.Lock (FIFO, so they run in arrival order), which
+keeps the user's conversation state and current_workout free of races.
+
+At most MAX_CONCURRENT_UPDATES updates run at once, and an update only takes
+one of those slots once it holds its user's lock. A user sending a burst
+therefore occupies at most one slot, however many updates are queued.
+"""
+
+import asyncio
+import logging
+import sys
+import time
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_UPDATES = 256
+SLOW_LOCK_WAIT_SECONDS = 5.0
+
+
+class _UserQueue:
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0  # updates holding or waiting for the lock
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Run different users concurrently, each user's own updates one at a time."""
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES):
+        # BaseUpdateProcessor takes its semaphore before do_process_update, so
+        # updates waiting for their user's lock would hold slots. Leave that one
+        # unbounded and limit running updates below, after the user's lock.
+        super().__init__(sys.maxsize)
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        self.update_limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._running = 0
+        self._queues: dict[int, _UserQueue] = {}
+        # Metrics
+        self.lock_waits = 0
+        self.lock_wait_total = 0.0
+        self.lock_wait_max = 0.0
+        self.max_queue_depth = 0
+
+    @staticmethod
+    def _key(update: object) -> int | None:
+        """The user an update belongs to, or None for updates without one."""
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return update.effective_user.id
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = self._key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _UserQueue()
+        queue.depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, queue.depth)
+        try:
+            start = time.perf_counter()
+            async with queue.lock:
+                self._record_wait(key, time.perf_counter() - start)
+                await self._run(coroutine)
+        finally:
+            queue.depth -= 1
+            if queue.depth == 0:
+                # Nobody holds or waits for the lock; don't keep idle users around
+                self._queues.pop(key, None)
+
+    async def _run(self, coroutine):
+        async with self._slots:
+            self._running += 1
+            try:
+                await coroutine
+            finally:
+                self._running -= 1
+
+    def _record_wait(self, key: int, waited: float):
+        self.lock_waits += 1
+        self.lock_wait_total += waited
+        self.lock_wait_max = max(self.lock_wait_max, waited)
+        if waited >= SLOW_LOCK_WAIT_SECONDS:
+            logger.warning(f"Update for user {key} waited {waited:.1f}s for its turn")
+
+    def queue_depth(self, key: int) -> int:
+        """Updates of one user currently running or waiting."""
+        queue = self._queues.get(key)
+        return queue.depth if queue else 0
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": self._running,
+            "active_users": len(self._queues),
+            "queued": sum(q.depth for q in self._queues.values()),
+            "max_queue_depth": self.max_queue_depth,
+            "lock_waits": self.lock_waits,
+            "lock_wait_avg_ms": (
+                1000 * self.lock_wait_total / self.lock_waits if self.lock_waits else 0.0
+            ),
+            "lock_wait_max_ms": 1000 * self.lock_wait_max,
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass